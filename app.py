@@ -1,11 +1,285 @@
-from flask import Flask, render_template
+import os
+import json
+import gzip
+import hashlib
+import threading
+
+from flask import Flask, render_template, request, Response, stream_with_context
+
+from state_store import StateStore, configured_store_file
 
 app = Flask(__name__)
 
+# JSON-Dateien der Producer (status.py, status_dsl.py)
+SNAPSHOT_FILES = {
+    "depot": os.path.join(app.static_folder, "depotdaten.json"),
+    "speedtest": os.path.join(app.static_folder, "speedtest.json"),
+}
+
+# Gemeinsamer Snapshot-Speicher der Producer (siehe state_store.py), wie dort aus [Files] state_store gelesen
+STATE_STORE_FILE = configured_store_file(os.path.join(app.root_path, "status.ini"))
+_dsl_store_file = configured_store_file(os.path.join(app.root_path, "status_dsl.ini"))
+if _dsl_store_file != STATE_STORE_FILE:
+    app.logger.warning(f"status.ini und status_dsl.ini nutzen verschiedene State-Stores "
+                       f"({STATE_STORE_FILE}, {_dsl_store_file}); die Web-App liest nur {STATE_STORE_FILE}")
+
+# Snapshot-Arten mit Historie im State-Store (latency: Aggregate der Latenz-Probe aus status_dsl.py)
+HISTORY_KINDS = ("depot", "speedtest", "latency")
+
+# Standard- und Höchstzahl der Snapshots je Antwort von /api/<name>/history
+HISTORY_LIMIT = 1000
+HISTORY_LIMIT_MAX = 10000
+
+# Überwachung von State-Store und JSON-Dateien beim ersten Request starten (flask run, WSGI-Server);
+# run_all.py schaltet sie ab, wenn beide Producer im selben Prozess direkt veröffentlichen
+app.config.setdefault("SNAPSHOT_WATCHER", True)
+
+# Sekunden zwischen zwei Prüfungen der JSON-Dateien bzw. zwischen Keepalive-Kommentaren im Event-Stream
+WATCH_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15.0
+
+
+class SnapshotHub:
+    """Hält die letzten Snapshots im Speicher und benachrichtigt wartende Clients bei Änderungen"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.snapshots = {}
+        self.sequence = 0
+
+    def publish(self, name, data):
+        """Übernimmt einen neuen Snapshot; gibt False zurück, wenn sich der Inhalt nicht geändert hat"""
+        body = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        version = data.get("version") if isinstance(data, dict) else None
+        version = version or hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+
+        with self.condition:
+            current = self.snapshots.get(name)
+            if current is not None and current['version'] == version:
+                return False
+            self.sequence += 1
+            encoded = body.encode('utf-8')
+            self.snapshots[name] = {
+                'data': data,
+                'body': body,
+                'encoded': encoded,
+                'gzip': gzip.compress(encoded),
+                'version': version,
+                'sequence': self.sequence,
+            }
+            self.condition.notify_all()
+            return True
+
+    def get(self, name):
+        with self.condition:
+            return self.snapshots.get(name)
+
+    def changed_since(self, sequence):
+        """Alle Snapshots, die nach der angegebenen Sequenznummer veröffentlicht wurden"""
+        with self.condition:
+            return sorted(((name, snapshot) for name, snapshot in self.snapshots.items()
+                           if snapshot['sequence'] > sequence),
+                          key=lambda item: item[1]['sequence'])
+
+    def wait_for_change(self, sequence, timeout):
+        """Wartet, bis ein Snapshot nach der Sequenznummer veröffentlicht wird; False bei Timeout"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.sequence > sequence, timeout)
+
+
+hub = SnapshotHub()
+_watcher = None
+_watcher_lock = threading.Lock()
+_store = None
+
+
+def _file_fingerprint(path):
+    try:
+        stat_result = os.stat(path)
+        return stat_result.st_size, stat_result.st_mtime_ns
+    except OSError:
+        return None
+
+
+def publish_snapshot_files(fingerprints, skip=()):
+    """Ein Durchlauf: veröffentlicht alle JSON-Dateien, deren Größe/mtime sich seit dem letzten Durchlauf geändert hat"""
+    for name, path in SNAPSHOT_FILES.items():
+        if name in skip:
+            continue
+        fingerprint = _file_fingerprint(path)
+        if fingerprint is None or fingerprint == fingerprints.get(name):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # Datei wird evtl. gerade geschrieben: beim nächsten Durchlauf erneut versuchen
+            continue
+        fingerprints[name] = fingerprint
+        hub.publish(name, data)
+    return fingerprints
+
+
+def get_state_store():
+    """Öffnet den State-Store, sobald ein Producer ihn angelegt hat; None, solange er fehlt"""
+    global _store
+    if _store is None and os.path.exists(STATE_STORE_FILE):
+        _store = StateStore(STATE_STORE_FILE)
+    return _store
+
+
+def publish_store_snapshots(versions):
+    """
+    Ein Durchlauf: veröffentlicht die neuesten Snapshots aus dem State-Store, sofern sich (ts, version) geändert hat.
+    Gibt die Namen zurück, die der Store liefert; deren JSON-Dateien müssen nicht mehr gelesen werden.
+    """
+    store = get_state_store()
+    if store is None:
+        return set()
+    served = set()
+    for name in SNAPSHOT_FILES:
+        try:
+            marker = store.latest_version(name)
+            if marker is None:
+                continue
+            served.add(name)
+            if marker == versions.get(name):
+                continue
+            snapshot = store.latest(name)
+        except Exception:
+            # Store gesperrt oder beschädigt: JSON-Dateien bleiben als Quelle
+            continue
+        versions[name] = marker
+        data = snapshot['data']
+        hub.publish(name, dict(data, version=snapshot['version']) if snapshot['version'] else data)
+    return served
+
+
+def watch_snapshot_files(stop_event=None):
+    """
+    Prüft State-Store und JSON-Dateien der Producer auf Änderungen und veröffentlicht neue Snapshots.
+    Snapshots aus dem Store haben Vorrang, die JSON-Dateien dienen als Fallback für ältere Producer.
+    """
+    fingerprints = {}
+    versions = {}
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        served = publish_store_snapshots(versions)
+        if len(served) < len(SNAPSHOT_FILES):
+            publish_snapshot_files(fingerprints, skip=served)
+        stop_event.wait(WATCH_INTERVAL)
+
+
+def start_file_watcher():
+    """
+    Startet die Überwachung der JSON-Dateien in einem Hintergrund-Thread (nur einmal).
+    Ein erster Durchlauf läuft sofort, damit bereits der auslösende Request Daten erhält.
+    """
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            publish_snapshot_files({}, skip=publish_store_snapshots({}))
+            _watcher = threading.Thread(target=watch_snapshot_files, name="snapshot-watcher", daemon=True)
+            _watcher.start()
+    return _watcher
+
+
+@app.before_request
+def ensure_file_watcher():
+    """Startet die Überwachung unabhängig davon, wie die App gestartet wurde (app.py, flask run, WSGI-Server)"""
+    if _watcher is None and app.config["SNAPSHOT_WATCHER"]:
+        start_file_watcher()
+
+
 @app.route("/")
 def hello_world():
-    return render_template('main.html',person="ali" ) 
+    return render_template('main.html',person="ali" )
+
+
+def snapshot_response(name):
+    """
+    Liefert den Snapshot aus dem Speicher mit ETag (Version), 304 bei unverändertem If-None-Match
+    und gzip-Kompression, sofern der Client sie akzeptiert.
+    """
+    snapshot = hub.get(name)
+    if snapshot is None:
+        return Response(json.dumps({"error": f"Keine Daten für '{name}' verfügbar"}, ensure_ascii=False),
+                        status=404, mimetype="application/json")
+
+    if snapshot['version'] in request.if_none_match:
+        response = Response(status=304)
+    elif request.accept_encodings["gzip"]:
+        response = Response(snapshot['gzip'], mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(snapshot['encoded'], mimetype="application/json")
+
+    response.set_etag(snapshot['version'])
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@app.route("/api/depot")
+def api_depot():
+    return snapshot_response("depot")
+
+
+@app.route("/api/speedtest")
+def api_speedtest():
+    return snapshot_response("speedtest")
+
+
+@app.route("/api/<name>/history")
+def api_history(name):
+    """
+    Snapshots eines Zeitraums aus dem State-Store: ?start=YYYY-MM-DD[ HH:MM:SS]&end=...&limit=N
+    Höchstens limit Snapshots (Standard HISTORY_LIMIT, maximal HISTORY_LIMIT_MAX) ab start in zeitlicher
+    Reihenfolge; weitere Seiten mit start = ts des letzten Snapshots. gzip, sofern der Client es akzeptiert.
+    """
+    store = get_state_store()
+    if name not in HISTORY_KINDS or store is None:
+        return Response(json.dumps({"error": f"Keine Historie für '{name}' verfügbar"}, ensure_ascii=False),
+                        status=404, mimetype="application/json")
+    limit = request.args.get("limit", HISTORY_LIMIT, type=int)
+    limit = max(1, min(limit, HISTORY_LIMIT_MAX))
+    snapshots = store.range(name, start=request.args.get("start"), end=request.args.get("end"), limit=limit)
+    encoded = json.dumps(snapshots, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if request.accept_encodings["gzip"]:
+        response = Response(gzip.compress(encoded), mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(encoded, mimetype="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@app.route("/events")
+def events():
+    """Server-Sent Events: sendet Depot- und Speedtest-Snapshots nur, wenn ein Producer neue Daten liefert"""
+    try:
+        last_sequence = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        last_sequence = 0
+    # Nach einem Neustart des Servers beginnt die Sequenz von vorn
+    if last_sequence > hub.sequence:
+        last_sequence = 0
+
+    def stream():
+        sequence = last_sequence
+        yield "retry: 5000\n\n"
+        while True:
+            changes = hub.changed_since(sequence)
+            for name, snapshot in changes:
+                sequence = max(sequence, snapshot['sequence'])
+                yield f"event: {name}\nid: {snapshot['sequence']}\ndata: {snapshot['body']}\n\n"
+            if not changes and not hub.wait_for_change(sequence, KEEPALIVE_INTERVAL):
+                yield ": keepalive\n\n"
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0")
\ No newline at end of file
+    start_file_watcher()
+    app.run(host="0.0.0.0", threaded=True)
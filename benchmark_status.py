@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark für status.py
+Zählt die Netzwerkaufrufe (yf.download) pro Monitor-Zyklus mit einem lokalen Stub statt yfinance
+und misst die Laufzeit der Bewertung (compute_valuation) mit synthetischen Instrumenten.
+Aufruf: python benchmark_status.py [anzahl_instrumente] [anzahl_instrumente_bewertung]
+"""
+
+import sys
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import status
+
+
+class CountingDownloader:
+    """Ersetzt yf.download, liefert synthetische Kurse und zählt die Aufrufe"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, tickers, start=None, end=None, **kwargs):
+        self.calls += 1
+        if start is not None:
+            index = pd.bdate_range(start, end - timedelta(days=1))
+        else:
+            index = pd.date_range(pd.Timestamp.now().floor('min'), periods=3, freq='min')
+        if isinstance(tickers, str):
+            # Einzelabfrage: Spalten (Feld, Ticker) wie bei yfinance
+            columns = pd.MultiIndex.from_product([['Close'], [tickers]])
+        else:
+            columns = pd.MultiIndex.from_product([tickers, ['Close']])
+        values = np.linspace(100.0, 101.0, len(index) * len(columns)).reshape(len(index), len(columns))
+        return pd.DataFrame(values, index=index, columns=columns)
+
+
+def synthetic_portfolio(count):
+    """Erzeugt Instrumente und Bestände für count Positionen"""
+    wkns = [f"wkn{i:05d}" for i in range(count)]
+    instruments_df = pd.DataFrame({
+        'ticker': [f"t{i}.de" for i in range(count)],
+        'instrument_name': [f"Instrument {i}" for i in range(count)],
+        'default_value': 0,
+    }, index=wkns)
+    shares_yesterday = pd.DataFrame({'share': np.full(count, 10.0)}, index=pd.Index(wkns, name='wkn'))
+    return instruments_df, shares_yesterday
+
+
+def legacy_cycle_calls(instruments_df, shares_yesterday, reference_date, reference_date_month):
+    """Aufrufmuster vor dem Referenz-Snapshot: Tagesreferenz plus Monatsreferenz je WKN"""
+    downloader = CountingDownloader()
+    status.yf.download = downloader
+    for wkn in instruments_df.index:
+        downloader(instruments_df.loc[wkn, 'ticker'].upper(), period="1d", interval="1m")
+    status.get_reference_values_from_yfinance(instruments_df, shares_yesterday, reference_date, None)
+    for _ in instruments_df.index:
+        status.get_reference_values_from_yfinance(instruments_df, shares_yesterday, reference_date_month, None)
+    return downloader.calls
+
+
+def snapshot_cycle_calls(instruments_df, shares_yesterday, reference_date, reference_date_month, cycles=3):
+    """Netzwerkaufrufe je Zyklus mit Referenz-Snapshot und Schlusskurs-Cache"""
+    downloader = CountingDownloader()
+    status.yf.download = downloader
+    status.price_cache = status.ClosePriceCache(':memory:')
+    state = {
+        'instruments_df': instruments_df,
+        'shares_yesterday': shares_yesterday,
+        'reference_date': reference_date,
+        'reference_date_month': reference_date_month,
+        'reference_snapshot': None,
+    }
+    settings = {"Quotes": {"chunk_size": 50}}
+
+    calls_per_cycle = []
+    for _ in range(cycles):
+        before = downloader.calls
+        status.run_monitor_cycle(state, None, settings)
+        calls_per_cycle.append(downloader.calls - before)
+
+    # Neustart: neuer Snapshot, aber Cache bleibt erhalten
+    state['reference_snapshot'] = None
+    before = downloader.calls
+    status.run_monitor_cycle(state, None, settings)
+    calls_per_cycle.append(downloader.calls - before)
+    return calls_per_cycle
+
+
+def valuation_seconds(count, repeat=5):
+    """Mittlere Laufzeit von compute_valuation für count synthetische Instrumente"""
+    rng = np.random.default_rng(0)
+    wkns = pd.Index([f"wkn{i:06d}" for i in range(count)], name='wkn')
+    prices = pd.Series(rng.uniform(1, 500, count), index=wkns)
+    reference_prices = pd.Series(rng.uniform(1, 500, count), index=wkns)
+    reference_prices_month = pd.Series(rng.uniform(1, 500, count), index=wkns)
+    shares = pd.Series(rng.integers(1, 100, count).astype(float), index=wkns)
+    names = pd.Series([f"Instrument {i}" for i in range(count)], index=wkns)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        status.compute_valuation(prices, reference_prices, shares, names, reference_prices_month)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    valuation_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    reference_date = pd.Timestamp('2025-10-16')
+    reference_date_month = pd.Timestamp('2025-09-30')
+    instruments_df, shares_yesterday = synthetic_portfolio(count)
+
+    legacy = legacy_cycle_calls(instruments_df, shares_yesterday, reference_date, reference_date_month)
+    print(f"Instrumente: {count}")
+    print(f"Netzwerkaufrufe pro Zyklus vorher (Einzelabfragen, Monatsreferenz je WKN): {legacy}")
+
+    per_cycle = snapshot_cycle_calls(instruments_df, shares_yesterday, reference_date, reference_date_month)
+    print(f"Netzwerkaufrufe pro Zyklus nachher: Zyklus 1: {per_cycle[0]}, "
+          f"Folgezyklen: {per_cycle[1:-1]}, nach Neustart (Cache warm): {per_cycle[-1]}")
+
+    print(f"Bewertung (compute_valuation) für {valuation_count} Instrumente: "
+          f"{valuation_seconds(valuation_count) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
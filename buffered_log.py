@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Buffered Log - queue-backed, rotating logfile writer for status_dsl.py and the viewer
+Callers only put the finished line on a queue (logging.handlers.QueueHandler); a background thread
+drains the queue in batches, writes them to the logfile and flushes at most once per flush interval
+(immediately for warnings and errors). The file is rotated by size and optionally at midnight.
+All writers are stopped and flushed at interpreter exit.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+DEFAULTS = {
+    'max_bytes': 5 * 1024 * 1024,
+    'backup_count': 5,
+    'rotate_daily': False,
+    'flush_interval': 2.0,
+}
+
+# Lines per batch before the queue is checked again for the flush deadline
+MAX_BATCH = 512
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _next_midnight(timestamp):
+    day = datetime.fromtimestamp(timestamp).date() + timedelta(days=1)
+    return datetime.combine(day, datetime.min.time()).timestamp()
+
+
+class RotatingBatchFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that rolls over by size and, with rotate_daily, at the first record after
+    midnight. Records are written without flushing; the writer thread flushes once per batch.
+    """
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, rotate_daily=False):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.rotate_daily = rotate_daily
+        self.rollover_at = None
+        if rotate_daily:
+            started = os.path.getmtime(filename) if os.path.exists(filename) else time.time()
+            self.rollover_at = _next_midnight(started)
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and record.created >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.rollover_at is not None:
+            self.rollover_at = _next_midnight(time.time())
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class BufferedLogWriter:
+    """Logger with a QueueHandler and the background thread that writes its records in batches"""
+
+    def __init__(self, logfile, max_bytes=DEFAULTS['max_bytes'], backup_count=DEFAULTS['backup_count'],
+                 rotate_daily=DEFAULTS['rotate_daily'], flush_interval=DEFAULTS['flush_interval']):
+        self.logfile = logfile
+        self.flush_interval = float(flush_interval)
+        self.queue = queue.SimpleQueue()
+        self.handler = RotatingBatchFileHandler(logfile, int(max_bytes), int(backup_count), rotate_daily)
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+
+        self.logger = logging.getLogger(f"buffered_log.{os.path.abspath(logfile)}")
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.logger.handlers = [logging.handlers.QueueHandler(self.queue)]
+
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="buffered-log", daemon=True)
+        self.thread.start()
+
+    def write(self, line, level=logging.INFO):
+        self.logger.log(level, line)
+
+    def _drain(self, first):
+        """Writes `first` and whatever else is queued (up to MAX_BATCH); returns True if a flush is due now"""
+        urgent = False
+        record = first
+        for _ in range(MAX_BATCH):
+            if record is None:
+                self.stopping.set()
+            else:
+                self.handler.handle(record)
+                urgent = urgent or record.levelno >= logging.WARNING
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+        return urgent
+
+    def run(self):
+        dirty = False
+        deadline = None
+        while not self.stopping.is_set():
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                urgent = self._drain(self.queue.get(timeout=timeout))
+                dirty = True
+            except queue.Empty:
+                urgent = False
+            if dirty and deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if dirty and (urgent or self.stopping.is_set() or time.monotonic() >= deadline):
+                self.handler.flush()
+                dirty = False
+                deadline = None
+        self.handler.flush()
+
+    def stop(self, timeout=5.0):
+        """Writes everything still queued, flushes and closes the logfile"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
+        self.handler.close()
+
+
+def configure(logfile, **options):
+    """(Re)creates the writer of a logfile with the given options (see DEFAULTS); returns it"""
+    key = os.path.abspath(logfile)
+    with _writers_lock:
+        old = _writers.pop(key, None)
+        if old is not None:
+            old.stop()
+        _writers[key] = BufferedLogWriter(logfile, **{**DEFAULTS, **options})
+        return _writers[key]
+
+
+def get_writer(logfile):
+    """Writer of a logfile, created with DEFAULTS on first use"""
+    key = os.path.abspath(logfile)
+    writer = _writers.get(key)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(key)
+            if writer is None:
+                writer = _writers[key] = BufferedLogWriter(logfile, **DEFAULTS)
+    return writer
+
+
+# Message prefixes used by the scripts for problems; such lines are flushed without delay
+WARNING_MARKERS = ("WARN", "ERROR", "FEHLER", "Fehler")
+
+
+def write(logfile, line, level=None):
+    """Queues one line for the logfile; returns immediately. Without level it is derived from the text."""
+    if level is None:
+        text = line.split(" - ", 1)[-1]
+        level = logging.WARNING if text.startswith(WARNING_MARKERS) else logging.INFO
+    get_writer(logfile).write(line, level)
+
+
+def shutdown():
+    """Stops all writers after writing and flushing their queued lines"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.stop()
+
+
+def parse_settings(section):
+    """Options for configure() from a [Logging] INI section (dict); invalid values fall back to DEFAULTS"""
+    options = dict(DEFAULTS)
+    try:
+        options['max_bytes'] = int(section.get('max_bytes', DEFAULTS['max_bytes']))
+        options['backup_count'] = int(section.get('backup_count', DEFAULTS['backup_count']))
+        options['flush_interval'] = float(section.get('flush_interval', DEFAULTS['flush_interval']))
+    except (ValueError, TypeError):
+        return dict(DEFAULTS)
+    options['rotate_daily'] = (section.get('rotate_daily', "false") or "false").strip().lower() in ("1", "true", "yes", "on")
+    return options
+
+
+atexit.register(shutdown)
@@ -6,11 +6,26 @@ Liest Parquet-Dateien und zeigt Statistiken und Verlauf an
 
 import os
 import sys
+import json
+import argparse
 import configparser
 import pandas as pd
 from datetime import datetime, timedelta
 import traceback
 
+import buffered_log
+import speedtest_rollups
+import speedtest_storage
+from state_store import StateStore
+
+
+# Columns needed by the time-range views; only these are read from Parquet
+RECENT_COLUMNS = ['timestamp', 'download_mbps', 'upload_mbps', 'ping_ms', 'server_name']
+DAILY_COLUMNS = ['timestamp', 'download_mbps', 'upload_mbps', 'ping_ms']
+
+# Days of history kept in memory by the interactive menu (covers the 7-day and 30-day views)
+HISTORY_DAYS = 30
+
 
 def screen_and_log(text, logfile=None, screen=True):
     """Log message to screen and/or file with timestamp"""
@@ -20,12 +35,8 @@ def screen_and_log(text, logfile=None, screen=True):
         print(line)
     if logfile:
         try:
-            logdir = os.path.dirname(logfile)
-            if logdir and not os.path.exists(logdir):
-                os.makedirs(logdir, exist_ok=True)
-            with open(logfile, "a", encoding="utf-8") as f:
-                f.write(line + "\n")
-                f.flush()
+            # Only queued here; buffered_log writes and flushes in its own thread
+            buffered_log.write(logfile, line)
         except Exception as e:
             print(f"Fehler beim Schreiben ins Logfile: {e}")
 
@@ -59,6 +70,8 @@ def settings_import(settings_file, logfile=None, screen=True):
     defaults = {
         "logfile": "dsl_speedtest_viewer.log",
         "parquet_data": "speedtest_data.parquet",
+        "parquet_dataset": "speedtest_data",
+        "state_store": "state.sqlite",
     }
 
     cfg = configparser.ConfigParser()
@@ -86,18 +99,37 @@ def settings_import(settings_file, logfile=None, screen=True):
     files = dict(cfg.items("Files")) if cfg.has_section("Files") else {}
     settings["logfile"] = normalize_path(files.get("logfile", defaults["logfile"]), base_dir)
     settings["parquet_data"] = normalize_path(files.get("parquet_data", defaults["parquet_data"]), base_dir)
+    settings["parquet_dataset"] = normalize_path(files.get("parquet_dataset", defaults["parquet_dataset"]), base_dir)
+    settings["state_store"] = normalize_path(files.get("state_store", defaults["state_store"]), base_dir)
+
+    # Logging section (rotation and flush interval of the buffered logfile writer)
+    settings["logging"] = buffered_log.parse_settings(dict(cfg.items("Logging")) if cfg.has_section("Logging") else {})
 
     return settings
 
 
-def load_speedtest_data(parquet_file, logfile=None, screen=True):
-    """Load speedtest data from Parquet file"""
+def load_speedtest_data(parquet_file, logfile=None, screen=True, start=None, end=None, columns=None):
+    """
+    Load speedtest data from the partitioned Parquet dataset (directory) or a single Parquet file.
+    start/end (start <= timestamp < end) and columns are pushed down to pyarrow, so only the
+    matching partitions, row groups and columns are read.
+    """
     try:
         if not os.path.exists(parquet_file):
             screen_and_log(f"ERROR: Parquet-Datei nicht gefunden: {parquet_file}", logfile, screen)
             return None
         
-        df = pd.read_parquet(parquet_file)
+        if os.path.isdir(parquet_file):
+            df = speedtest_storage.read_dataset(parquet_file, start=start, end=end, columns=columns)
+        else:
+            filters = []
+            if start is not None:
+                filters.append(('timestamp', '>=', pd.Timestamp(start)))
+            if end is not None:
+                filters.append(('timestamp', '<', pd.Timestamp(end)))
+            if columns is not None:
+                columns = ['timestamp'] + [column for column in columns if column != 'timestamp']
+            df = pd.read_parquet(parquet_file, columns=columns, filters=filters or None)
         screen_and_log(f"Speedtest-Daten geladen: {len(df)} Einträge aus '{parquet_file}'", logfile, screen)
         
         # Ensure timestamp is datetime
@@ -114,57 +146,284 @@ def load_speedtest_data(parquet_file, logfile=None, screen=True):
         return None
 
 
-def display_summary_statistics(df, logfile=None, screen=True):
-    """Display summary statistics for speedtest data"""
-    if df is None or df.empty:
-        screen_and_log("Keine Daten zum Anzeigen verfügbar.", logfile, screen)
+def load_speedtest_data_from_store(store_file, start=None, logfile=None, screen=True, end=None, columns=None):
+    """Load speedtest snapshots from the shared state store (fallback when no Parquet file exists)"""
+    try:
+        if not store_file or not os.path.exists(store_file):
+            screen_and_log(f"ERROR: State-Store nicht gefunden: {store_file}", logfile, screen)
+            return None
+
+        store = StateStore(store_file)
+        try:
+            snapshots = store.range("speedtest", start=start, end=end)
+        finally:
+            store.close()
+
+        if not snapshots:
+            screen_and_log("ERROR: Keine Speedtest-Daten im State-Store.", logfile, screen)
+            return None
+
+        df = pd.DataFrame([snapshot['data'] for snapshot in snapshots])
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        if columns is not None:
+            df = df[['timestamp'] + [column for column in columns if column != 'timestamp' and column in df.columns]]
+        df = df.sort_values('timestamp')
+        screen_and_log(f"Speedtest-Daten geladen: {len(df)} Einträge aus State-Store '{store_file}'", logfile, screen)
+        return df
+
+    except Exception as e:
+        screen_and_log(f"ERROR: Fehler beim Lesen des State-Stores: {e}", logfile, screen)
+        return None
+
+
+def load_speedtest_history(settings, logfile=None, screen=True, start=None, end=None, columns=None):
+    """Parquet dataset, legacy Parquet file or, if neither exists, the snapshots from the state store"""
+    if speedtest_storage.dataset_exists(settings.get("parquet_dataset")):
+        return load_speedtest_data(settings["parquet_dataset"], logfile, screen, start=start, end=end, columns=columns)
+    if os.path.exists(settings["parquet_data"]):
+        return load_speedtest_data(settings["parquet_data"], logfile, screen, start=start, end=end, columns=columns)
+    return load_speedtest_data_from_store(settings.get("state_store"), start=start, logfile=logfile, screen=screen,
+                                          end=end, columns=columns)
+
+
+def history_source(settings):
+    """(kind, path) of the raw history: 'dataset', legacy Parquet 'file' or 'store' (same order as load_speedtest_history)"""
+    if speedtest_storage.dataset_exists(settings.get("parquet_dataset")):
+        return "dataset", settings["parquet_dataset"]
+    if os.path.exists(settings["parquet_data"]):
+        return "file", settings["parquet_data"]
+    return "store", settings.get("state_store")
+
+
+def source_fingerprint(kind, path):
+    """Cheap change marker of a history source; None if it does not exist"""
+    try:
+        if kind == "dataset":
+            return speedtest_storage.dataset_fingerprint(path)
+        if kind == "file":
+            stat_result = os.stat(path)
+            return stat_result.st_size, stat_result.st_mtime_ns
+        if path and os.path.exists(path):
+            store = StateStore(path)
+            try:
+                return store.latest_version("speedtest")
+            finally:
+                store.close()
+    except OSError:
+        pass
+    return None
+
+
+def load_history_cache(settings, logfile=None, screen=True):
+    """
+    Loads the last HISTORY_DAYS days (RECENT_COLUMNS only) and remembers the source, fingerprint and
+    high-water mark (newest timestamp), so that reload_history_cache only has to read newer rows
+    """
+    kind, path = history_source(settings)
+    fingerprint = source_fingerprint(kind, path)
+    df = load_speedtest_history(settings, logfile, screen, start=datetime.now() - timedelta(days=HISTORY_DAYS),
+                                columns=RECENT_COLUMNS)
+    return {
+        'df': df,
+        'source': (kind, path),
+        'fingerprint': fingerprint,
+        'high_water_mark': df['timestamp'].max() if df is not None and not df.empty else None,
+    }
+
+
+def reload_history_cache(history, settings, logfile=None, screen=True):
+    """
+    Incremental reload: returns the number of new rows appended to history['df'] (0 if the source is
+    unchanged), or None on failure. Only rows newer than the high-water mark are read, rows that left
+    the HISTORY_DAYS window are dropped; a changed source (e.g. first dataset after migration) or an
+    empty cache triggers a load of the whole window.
+    """
+    kind, path = history_source(settings)
+    if history.get('df') is None or history.get('source') != (kind, path) or history.get('high_water_mark') is None:
+        history.update(load_history_cache(settings, logfile, screen))
+        return None if history['df'] is None else len(history['df'])
+
+    fingerprint = source_fingerprint(kind, path)
+    if fingerprint == history['fingerprint']:
+        return 0
+
+    high_water_mark = history['high_water_mark']
+    new_rows = load_speedtest_history(settings, logfile, screen=False, start=high_water_mark, columns=RECENT_COLUMNS)
+    if new_rows is None:
+        return None
+    new_rows = new_rows[new_rows['timestamp'] > high_water_mark]
+
+    history['fingerprint'] = fingerprint
+    df = history['df']
+    if not new_rows.empty:
+        df = pd.concat([df, new_rows[df.columns.intersection(new_rows.columns)]], ignore_index=True)
+        history['high_water_mark'] = new_rows['timestamp'].max()
+    history['df'] = df[df['timestamp'] >= datetime.now() - timedelta(days=HISTORY_DAYS)].reset_index(drop=True)
+    return len(new_rows)
+
+
+def display_latest_snapshot(settings, logfile=None, screen=True):
+    """Display the most recent speedtest snapshot from the state store"""
+    store_file = settings.get("state_store")
+    if not store_file or not os.path.exists(store_file):
+        print("\nKein State-Store vorhanden.")
         return
+
+    store = StateStore(store_file)
+    try:
+        snapshot = store.latest("speedtest")
+    finally:
+        store.close()
+
+    if snapshot is None:
+        print("\nNoch kein Speedtest im State-Store.")
+        return
+
+    data = snapshot['data']
+    print("\n" + "="*60)
+    print(f"LETZTER SPEEDTEST ({snapshot['ts']})")
+    print("="*60)
+    print(f"  Download: {data.get('download_mbps')} Mbps")
+    print(f"  Upload:   {data.get('upload_mbps')} Mbps")
+    print(f"  Ping:     {data.get('ping_ms')} ms")
+    print(f"  Server:   {data.get('server_name')} ({data.get('server_location')})")
+
+
+def summary_from_frame(df):
+    """Summary in the shape of speedtest_rollups.summarize, computed from raw rows (fallback without rollups)"""
+    metrics = {}
+    for metric in speedtest_rollups.METRICS:
+        values = df[metric].dropna()
+        metrics[metric] = None if values.empty else {
+            'mean': values.mean(), 'min': values.min(), 'max': values.max(),
+            'median': values.median(), 'p90': values.quantile(0.9),
+        }
+    return {
+        'count': len(df),
+        'first': df['timestamp'].min().strftime('%Y-%m-%d %H:%M:%S'),
+        'last': df['timestamp'].max().strftime('%Y-%m-%d %H:%M:%S'),
+        'metrics': metrics,
+        'servers': df['server_name'].value_counts().to_dict(),
+    }
+
+
+def with_rollup_store(settings, query):
+    """Run query(store) against the state store if it holds speedtest rollups, else return None"""
+    store_file = settings.get("state_store")
+    if not store_file or not os.path.exists(store_file):
+        return None
+    store = StateStore(store_file)
+    try:
+        if not speedtest_rollups.rollups_exist(store):
+            return None
+        return query(store)
+    finally:
+        store.close()
+
+
+def load_rollup_summary(settings):
+    """Summary over the whole history from the 'total' rollup (constant time), None without rollups"""
+    return with_rollup_store(settings, speedtest_rollups.total_summary)
+
+
+def daily_window_start(days):
+    """
+    Start of the day-based views (daily, summary over a window): midnight `days - 1` days ago, i.e. the
+    window holds `days` calendar days including today (whole days for rollups and raw rows alike)
+    """
+    return pd.Timestamp(datetime.now() - timedelta(days=max(days, 1) - 1)).normalize()
+
+
+def daily_frame(daily):
+    """Daily averages in the common shape: index 'date', columns count and the metrics rounded to 2 places"""
+    daily = daily.reindex(columns=['count', *speedtest_rollups.METRICS])
+    daily['count'] = daily['count'].fillna(0).astype(int)
+    daily[list(speedtest_rollups.METRICS)] = daily[list(speedtest_rollups.METRICS)].astype(float).round(2)
+    daily.index.name = 'date'
+    return daily
+
+
+def load_rollup_window_summary(settings, days):
+    """Summary over the last `days` calendar days, merged from the daily rollups; None without rollups"""
+    start = daily_window_start(days).strftime('%Y-%m-%d')
+    return with_rollup_store(settings, lambda store: speedtest_rollups.window_summary(store, start=start))
+
+
+def load_rollup_daily(settings, days):
+    """Daily means since daily_window_start(days) from the daily rollups, None without rollups"""
+    start = daily_window_start(days).strftime('%Y-%m-%d')
+    daily = with_rollup_store(settings, lambda store: speedtest_rollups.daily_means(store, start=start))
+    return None if daily is None else daily_frame(daily)
+
+
+def display_summary_statistics(df, logfile=None, screen=True, summary=None):
+    """Display summary statistics (from the rollup summary if given, otherwise computed from df)"""
+    if summary is None:
+        if df is None or df.empty:
+            screen_and_log("Keine Daten zum Anzeigen verfügbar.", logfile, screen)
+            return
+        summary = summary_from_frame(df)
     
     print("\n" + "="*60)
     print("DSL SPEEDTEST STATISTIKEN")
     print("="*60)
     
     # Basic info
-    total_tests = len(df)
-    date_range = f"{df['timestamp'].min().strftime('%Y-%m-%d')} bis {df['timestamp'].max().strftime('%Y-%m-%d')}"
+    total_tests = summary['count']
+    date_range = f"{summary['first'][:10]} bis {summary['last'][:10]}"
     
     print(f"Anzahl Tests: {total_tests}")
     print(f"Zeitraum: {date_range}")
     
     # Speed statistics
-    print(f"\nDOWNLOAD GESCHWINDIGKEIT (Mbps):")
-    print(f"  Durchschnitt: {df['download_mbps'].mean():.2f}")
-    print(f"  Minimum:      {df['download_mbps'].min():.2f}")
-    print(f"  Maximum:      {df['download_mbps'].max():.2f}")
-    print(f"  Median:       {df['download_mbps'].median():.2f}")
-    
-    print(f"\nUPLOAD GESCHWINDIGKEIT (Mbps):")
-    print(f"  Durchschnitt: {df['upload_mbps'].mean():.2f}")
-    print(f"  Minimum:      {df['upload_mbps'].min():.2f}")
-    print(f"  Maximum:      {df['upload_mbps'].max():.2f}")
-    print(f"  Median:       {df['upload_mbps'].median():.2f}")
-    
-    print(f"\nPING (ms):")
-    print(f"  Durchschnitt: {df['ping_ms'].mean():.2f}")
-    print(f"  Minimum:      {df['ping_ms'].min():.2f}")
-    print(f"  Maximum:      {df['ping_ms'].max():.2f}")
-    print(f"  Median:       {df['ping_ms'].median():.2f}")
+    for metric, title in (('download_mbps', "DOWNLOAD GESCHWINDIGKEIT (Mbps)"),
+                          ('upload_mbps', "UPLOAD GESCHWINDIGKEIT (Mbps)"),
+                          ('ping_ms', "PING (ms)")):
+        stats = summary['metrics'][metric]
+        if stats is None:
+            continue
+        print(f"\n{title}:")
+        print(f"  Durchschnitt: {stats['mean']:.2f}")
+        print(f"  Minimum:      {stats['min']:.2f}")
+        print(f"  Maximum:      {stats['max']:.2f}")
+        print(f"  Median:       {stats['median']:.2f}")
     
     # Server statistics
-    server_counts = df['server_name'].value_counts()
     print(f"\nVERWENDETE SERVER:")
-    for server, count in server_counts.items():
+    for server, count in summary['servers'].items():
         percentage = (count / total_tests) * 100
         print(f"  {server}: {count} Tests ({percentage:.1f}%)")
 
 
+def compute_recent_tests(df, days=7, limit=None):
+    """Tests of the last `days` days, newest first (at most `limit` rows)"""
+    if df is None:
+        return None
+    cutoff_date = datetime.now() - timedelta(days=days)
+    recent_df = df[df['timestamp'] >= cutoff_date].sort_values('timestamp', ascending=False)
+    return recent_df.head(limit) if limit else recent_df
+
+
+def compute_daily_averages(df, days=30):
+    """Number of tests and mean download/upload/ping per day since daily_window_start(days) (see daily_frame)"""
+    if df is None:
+        return None
+    recent_df = df[df['timestamp'] >= daily_window_start(days)].copy()
+    recent_df['date'] = recent_df['timestamp'].dt.date
+    return daily_frame(recent_df.groupby('date').agg(
+        count=('timestamp', 'size'),
+        download_mbps=('download_mbps', 'mean'),
+        upload_mbps=('upload_mbps', 'mean'),
+        ping_ms=('ping_ms', 'mean'),
+    ))
+
+
 def display_recent_tests(df, days=7, logfile=None, screen=True):
     """Display recent speedtest results"""
     if df is None or df.empty:
         return
     
-    cutoff_date = datetime.now() - timedelta(days=days)
-    recent_df = df[df['timestamp'] >= cutoff_date].copy()
+    recent_df = compute_recent_tests(df, days)
     
     if recent_df.empty:
         print(f"\nKeine Tests in den letzten {days} Tagen gefunden.")
@@ -174,9 +433,6 @@ def display_recent_tests(df, days=7, logfile=None, screen=True):
     print(f"LETZTE {len(recent_df)} SPEEDTESTS (Letzten {days} Tage)")
     print("="*80)
     
-    # Sort by timestamp descending (newest first)
-    recent_df = recent_df.sort_values('timestamp', ascending=False)
-    
     print(f"{'Zeitpunkt':<20} {'Download':<10} {'Upload':<8} {'Ping':<8} {'Server':<25}")
     print("-" * 80)
     
@@ -190,26 +446,19 @@ def display_recent_tests(df, days=7, logfile=None, screen=True):
         print(f"{timestamp:<20} {download:<10} {upload:<8} {ping:<8} {server:<25}")
 
 
-def display_daily_averages(df, days=30, logfile=None, screen=True):
-    """Display daily averages for the specified number of days"""
-    if df is None or df.empty:
-        return
-    
-    cutoff_date = datetime.now() - timedelta(days=days)
-    recent_df = df[df['timestamp'] >= cutoff_date].copy()
+def display_daily_averages(df, days=30, logfile=None, screen=True, daily=None):
+    """Display daily averages for the specified number of days (from daily rollups if given)"""
+    if daily is not None:
+        daily_avg = daily
+    else:
+        if df is None or df.empty:
+            return
+        daily_avg = compute_daily_averages(df, days)
     
-    if recent_df.empty:
+    if daily_avg.empty:
         print(f"\nKeine Tests in den letzten {days} Tagen für Durchschnittswerte gefunden.")
         return
     
-    # Group by date
-    recent_df['date'] = recent_df['timestamp'].dt.date
-    daily_avg = recent_df.groupby('date').agg({
-        'download_mbps': 'mean',
-        'upload_mbps': 'mean',
-        'ping_ms': 'mean'
-    }).round(2)
-    
     print(f"\n" + "="*60)
     print(f"TÄGLICHE DURCHSCHNITTSWERTE (Letzten {days} Tage)")
     print("="*60)
@@ -225,8 +474,12 @@ def display_daily_averages(df, days=30, logfile=None, screen=True):
         print(f"{date!s:<12} {download:<12} {upload:<10} {ping:<8}")
 
 
-def interactive_menu(df, settings, logfile):
-    """Interactive menu for data viewing options"""
+def interactive_menu(history, settings, logfile):
+    """
+    Interactive menu for data viewing options. The recent and daily views are computed from the
+    in-memory window (history, see load_history_cache), which is brought up to date incrementally
+    before each view; the summary comes from the rollups.
+    """
     while True:
         print("\n" + "="*60)
         print("DSL SPEEDTEST VIEWER - HAUPTMENÜ")
@@ -235,30 +488,44 @@ def interactive_menu(df, settings, logfile):
         print("2. Letzte Tests anzeigen (7 Tage)")
         print("3. Tägliche Durchschnittswerte (30 Tage)")
         print("4. Daten neu laden")
-        print("5. Beenden")
+        print("5. Letzter Speedtest (State-Store)")
+        print("6. Beenden")
         print("-" * 60)
         
         try:
-            choice = input("Wählen Sie eine Option (1-5): ").strip()
+            choice = input("Wählen Sie eine Option (1-6): ").strip()
             
             if choice == "1":
-                display_summary_statistics(df, logfile)
+                summary = load_rollup_summary(settings)
+                df = None
+                if summary is None:
+                    # Without rollups the summary needs the whole history; it is not kept in memory
+                    df = load_speedtest_history(settings, logfile, columns=RECENT_COLUMNS)
+                display_summary_statistics(df, logfile, summary=summary)
             elif choice == "2":
-                display_recent_tests(df, days=7, logfile=logfile)
+                if reload_history_cache(history, settings, logfile, screen=False) is None:
+                    print("✗ Fehler beim Laden der Daten")
+                    continue
+                display_recent_tests(history['df'], days=7, logfile=logfile)
             elif choice == "3":
-                display_daily_averages(df, days=30, logfile=logfile)
+                if reload_history_cache(history, settings, logfile, screen=False) is None:
+                    print("✗ Fehler beim Laden der Daten")
+                    continue
+                display_daily_averages(history['df'], days=30, logfile=logfile)
             elif choice == "4":
                 print("Lade Daten neu...")
-                df = load_speedtest_data(settings["parquet_data"], logfile)
-                if df is not None:
-                    print(f"✓ Daten neu geladen: {len(df)} Einträge")
+                new_rows = reload_history_cache(history, settings, logfile)
+                if new_rows is not None:
+                    print(f"✓ Daten aktualisiert: {new_rows} neue Einträge, {len(history['df'])} insgesamt")
                 else:
                     print("✗ Fehler beim Laden der Daten")
             elif choice == "5":
+                display_latest_snapshot(settings, logfile)
+            elif choice == "6":
                 print("Programm wird beendet...")
                 break
             else:
-                print("Ungültige Auswahl. Bitte wählen Sie 1-5.")
+                print("Ungültige Auswahl. Bitte wählen Sie 1-6.")
                 
         except KeyboardInterrupt:
             print("\nProgramm durch Benutzer beendet (Ctrl+C)")
@@ -267,29 +534,124 @@ def interactive_menu(df, settings, logfile):
             print(f"Fehler: {e}")
             
 
-def main():
-    """Main function - DSL Speedtest Viewer"""
+def build_report(report, settings, days, logfile=None, limit=None):
+    """
+    Report data without any screen output: 'summary' -> dict, 'recent' / 'daily' -> DataFrame.
+    Only the needed slice is read (rollups where available, otherwise a time-range Parquet read).
+    The summary covers the whole history with days=None, otherwise the same calendar days as 'daily'.
+    """
+    if report == "summary":
+        if days is None:
+            summary = load_rollup_summary(settings)
+            start = None
+        else:
+            summary = load_rollup_window_summary(settings, days)
+            start = daily_window_start(days)
+        if summary is None:
+            df = load_speedtest_history(settings, logfile, screen=False, start=start)
+            if df is not None and start is not None:
+                df = df[df['timestamp'] >= start]
+            summary = summary_from_frame(df) if df is not None and not df.empty else None
+        return summary
+    if report == "recent":
+        start = datetime.now() - timedelta(days=days)
+        df = load_speedtest_history(settings, logfile, screen=False, start=start, columns=RECENT_COLUMNS)
+        return compute_recent_tests(df, days, limit)
+    if report == "daily":
+        # Same columns, rounding and day-aligned window with and without rollups
+        daily = load_rollup_daily(settings, days)
+        if daily is None:
+            df = load_speedtest_history(settings, logfile, screen=False, start=daily_window_start(days),
+                                        columns=DAILY_COLUMNS)
+            daily = compute_daily_averages(df, days)
+        return daily
+    raise ValueError(f"Unbekannter Report: {report}")
+
+
+def format_report(report, data, output_format):
+    """Serializes report data as JSON or CSV"""
+    if report == "summary":
+        if output_format == "json":
+            return json.dumps(data, ensure_ascii=False, indent=2)
+        rows = [{'metric': metric, **stats} for metric, stats in data['metrics'].items() if stats is not None]
+        return pd.DataFrame(rows).to_csv(index=False)
+
+    if report == "daily":
+        frame = data.reset_index()
+        frame['date'] = frame['date'].astype(str)
+    else:
+        frame = data
+    if output_format == "json":
+        return frame.to_json(orient="records", date_format="iso", force_ascii=False, indent=2)
+    return frame.to_csv(index=False)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="DSL Speedtest Viewer (ohne Argumente: interaktives Menü)")
+    parser.add_argument("--report", choices=["summary", "recent", "daily"],
+                        help="Report ohne Menü ausgeben")
+    parser.add_argument("--days", type=int, default=None,
+                        help="Zeitraum in Tagen (Standard: recent 7, daily 30, summary gesamte Historie); "
+                             "daily und summary zählen ganze Kalendertage einschließlich heute")
+    parser.add_argument("--limit", type=int, default=None, help="recent: maximale Anzahl Tests")
+    parser.add_argument("--format", choices=["json", "csv"], default="json", dest="output_format")
+    parser.add_argument("--output", help="Datei statt Standardausgabe")
+    return parser.parse_args(argv)
+
+
+def run_report(args, settings, logfile):
+    """Batch mode: writes the requested report to stdout or --output; returns the exit code"""
+    days = args.days if args.days is not None else {"recent": 7, "daily": 30}.get(args.report)
+    data = build_report(args.report, settings, days, logfile, limit=args.limit)
+    if data is None:
+        screen_and_log(f"ERROR: Keine Speedtest-Daten für Report '{args.report}' verfügbar.", logfile, False)
+        print(f"Keine Speedtest-Daten für Report '{args.report}' verfügbar.", file=sys.stderr)
+        return 1
+
+    text = format_report(args.report, data, args.output_format)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        screen_and_log(f"Report '{args.report}' geschrieben: {args.output}", logfile, False)
+    else:
+        sys.stdout.write(text if text.endswith("\n") else text + "\n")
+    return 0
+
+
+def main(argv=None):
+    """Main function - DSL Speedtest Viewer (interactive menu or --report batch mode)"""
+    args = parse_arguments(argv)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    screen = args.report is None
     try:
-        script_dir = set_working_directory()
+        script_dir = set_working_directory(screen=screen)
         if not script_dir:
             sys.exit(1)
             
         settings_file = "dsl_speedtest_viewer.ini"
-        settings = settings_import(settings_file, logfile=None, screen=True)
+        settings = settings_import(settings_file, logfile=None, screen=screen)
         
         logfile = settings["logfile"]
+        buffered_log.configure(logfile, **settings["logging"])
+
+        if args.report:
+            sys.exit(run_report(args, settings, logfile))
         
         screen_and_log("DSL Speedtest Viewer gestartet", logfile, True)
         
-        # Load speedtest data
-        df = load_speedtest_data(settings["parquet_data"], logfile)
+        # The summary comes from the rollups; the last HISTORY_DAYS days are kept in memory for the other views
+        summary = load_rollup_summary(settings)
+        if summary is not None:
+            screen_and_log(f"Speedtest-Rollups im State-Store gefunden: {summary['count']} Tests", logfile, True)
+        history = load_history_cache(settings, logfile)
         
-        if df is None:
+        if history['df'] is None and summary is None:
             screen_and_log("FEHLER: Keine Speedtest-Daten verfügbar. Programm wird beendet.", logfile, True)
             sys.exit(1)
         
         # Start interactive menu
-        interactive_menu(df, settings, logfile)
+        interactive_menu(history, settings, logfile)
         
         screen_and_log("DSL Speedtest Viewer beendet", logfile, True)
 
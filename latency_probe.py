@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Latency Probe - lightweight TCP-connect latency sampler between full speedtests
+Every few seconds the probe opens a TCP connection to each configured host and records the connect
+time (no payload, a few packets per sample). Samples live in a fixed-size ring buffer backed by
+array.array; once per flush interval a compact aggregate per host (count, failures, min/mean/p50/p90/max)
+is appended to the state store as a 'latency' snapshot; snapshots older than the retention are pruned
+once a day.
+"""
+
+import math
+import socket
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+
+
+DEFAULT_PORT = 443
+
+
+def parse_host(item):
+    """
+    'host', 'host:port', '[v6addr]' or '[v6addr]:port' -> (host, port); a bare address with more than
+    one colon is an IPv6 address without port
+    """
+    if item.startswith("["):
+        host, _, rest = item[1:].partition("]")
+        return host, int(rest[1:]) if rest.startswith(":") else DEFAULT_PORT
+    if item.count(":") == 1:
+        host, _, port = item.partition(":")
+        return host, int(port)
+    return item, DEFAULT_PORT
+
+
+def parse_hosts(value):
+    """'host:port, [v6addr]:port, host' -> [(host, port)]; port defaults to 443"""
+    return [parse_host(item.strip()) for item in (value or "").split(",") if item.strip()]
+
+
+class LatencyRing:
+    """
+    Fixed-size ring buffer of (timestamp, host index, latency in ms) in three parallel arrays.
+    A failed probe is stored as NaN. The oldest sample is overwritten once the buffer is full.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.timestamps = array('d', bytes(8 * self.capacity))
+        self.latencies = array('d', bytes(8 * self.capacity))
+        self.hosts = array('H', bytes(2 * self.capacity))
+        self.next = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, host_index, latency_ms):
+        with self.lock:
+            self.timestamps[self.next] = timestamp
+            self.hosts[self.next] = host_index
+            self.latencies[self.next] = math.nan if latency_ms is None else latency_ms
+            self.next = (self.next + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def since(self, timestamp):
+        """Samples newer than timestamp, oldest first, as a list of (timestamp, host index, latency)"""
+        with self.lock:
+            start = (self.next - self.size) % self.capacity
+            samples = []
+            for offset in range(self.size):
+                position = (start + offset) % self.capacity
+                if self.timestamps[position] > timestamp:
+                    samples.append((self.timestamps[position], self.hosts[position], self.latencies[position]))
+            return samples
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def aggregate(samples, host_names):
+    """Per-host aggregate of ring samples: count, failures, min, mean, p50, p90, max (ms)"""
+    per_host = {}
+    for _, host_index, latency in samples:
+        per_host.setdefault(host_index, []).append(latency)
+
+    result = {}
+    for host_index, values in per_host.items():
+        ok = sorted(value for value in values if not math.isnan(value))
+        result[host_names[host_index]] = {
+            'count': len(values),
+            'failures': len(values) - len(ok),
+            'min': round(ok[0], 2) if ok else None,
+            'mean': round(sum(ok) / len(ok), 2) if ok else None,
+            'p50': round(_percentile(ok, 0.5), 2) if ok else None,
+            'p90': round(_percentile(ok, 0.9), 2) if ok else None,
+            'max': round(ok[-1], 2) if ok else None,
+        }
+    return result
+
+
+class LatencyProbe:
+    """
+    Samples TCP-connect latency to `hosts` every `interval` seconds in a background thread.
+    `on_failure(host)` is called when a host fails `failure_threshold` probes in a row
+    (e.g. to trigger an early speedtest). 'latency' snapshots older than `retention_days` are pruned
+    from the store once a day (0 keeps them).
+    """
+
+    def __init__(self, hosts, interval=5.0, timeout=2.0, capacity=17280, flush_interval=60.0,
+                 store=None, failure_threshold=3, on_failure=None, logger=None, retention_days=7):
+        self.hosts = list(hosts)
+        self.host_names = [f"{host}:{port}" for host, port in self.hosts]
+        self.interval = float(interval)
+        self.timeout = float(timeout)
+        self.flush_interval = float(flush_interval)
+        self.store = store
+        self.failure_threshold = int(failure_threshold)
+        self.on_failure = on_failure
+        self.logger = logger
+        self.retention_days = retention_days
+        self.pruned_on = None
+        self.ring = LatencyRing(capacity)
+        self.addresses = {}
+        self.consecutive_failures = [0] * len(self.hosts)
+        self.last_flush = time.time()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _log(self, message):
+        if self.logger is not None:
+            self.logger(message)
+
+    def _address(self, index):
+        """Resolved address of a host, cached until a probe fails (DNS time is not part of the sample)"""
+        address = self.addresses.get(index)
+        if address is None:
+            host, port = self.hosts[index]
+            family, socktype, proto, _, sockaddr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+            address = self.addresses[index] = (family, socktype, proto, sockaddr)
+        return address
+
+    def measure(self, index):
+        """TCP-connect time to host `index` in ms, None on failure"""
+        try:
+            family, socktype, proto, sockaddr = self._address(index)
+            with socket.socket(family, socktype, proto) as sock:
+                sock.settimeout(self.timeout)
+                start = time.perf_counter()
+                sock.connect(sockaddr)
+                return (time.perf_counter() - start) * 1000.0
+        except OSError:
+            self.addresses.pop(index, None)
+            return None
+
+    def probe_once(self):
+        """Probes every host once, stores the samples and returns [(host name, latency or None)]"""
+        results = []
+        for index, name in enumerate(self.host_names):
+            latency = self.measure(index)
+            self.ring.append(time.time(), index, latency)
+            results.append((name, latency))
+            if latency is None:
+                self.consecutive_failures[index] += 1
+                if self.consecutive_failures[index] == self.failure_threshold:
+                    self._log(f"WARN: Latenz-Probe {name}: {self.failure_threshold} Fehlschläge in Folge")
+                    if self.on_failure is not None:
+                        self.on_failure(name)
+            else:
+                self.consecutive_failures[index] = 0
+        return results
+
+    def stats(self, window=None):
+        """Per-host aggregate over the last `window` seconds (whole ring if None)"""
+        since = time.time() - window if window else 0.0
+        return aggregate(self.ring.since(since), self.host_names)
+
+    def flush(self):
+        """Appends the aggregate since the last flush to the store as a 'latency' snapshot"""
+        now = time.time()
+        samples = self.ring.since(self.last_flush)
+        if samples and self.store is not None:
+            self.store.append("latency", {
+                'start': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.last_flush)),
+                'end': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+                'hosts': aggregate(samples, self.host_names),
+            })
+        self.last_flush = now
+        self.prune()
+
+    def prune(self):
+        """Deletes 'latency' snapshots older than retention_days (at most once a day)"""
+        today = datetime.today().date()
+        if self.store is None or not self.retention_days or self.pruned_on == today:
+            return 0
+        removed = self.store.prune("latency", datetime.combine(today, datetime.min.time()) - timedelta(days=self.retention_days))
+        self.pruned_on = today
+        return removed
+
+    def run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            self.probe_once()
+            if started >= next_flush:
+                try:
+                    self.flush()
+                except Exception as e:
+                    self._log(f"ERROR: Latenz-Aggregate konnten nicht gespeichert werden: {e}")
+                next_flush = started + self.flush_interval
+            self.stop_event.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="latency-probe", daemon=True)
+            self.thread.start()
+        return self.thread
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(self.timeout + 1)
+        try:
+            self.flush()
+        except Exception:
+            pass
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Run All - Aktien-Monitor, DSL-Speedtest und Web-App in einem Prozess
+Statt drei Interpretern (status.py, status_dsl.py, app.py) laufen beide Producer als Threads neben
+dem Flask-Server und übergeben ihre Snapshots direkt an den SnapshotHub der Web-App. Die JSON-Dateien
+werden weiterhin geschrieben (Viewer, Neustart), aber nicht mehr von der Web-App gepollt.
+Aufruf: python run_all.py [--no-monitor] [--no-speedtest] [--port 5000]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import traceback
+
+import app as web_app
+
+
+def run_producer(name, target):
+    """
+    Führt einen Producer aus; Fehler und sys.exit() beenden nur diesen Thread, nicht den Webserver.
+    Die Producer wechseln das Arbeitsverzeichnis nicht (chdir=False), sondern lösen ihre Pfade absolut auf.
+    """
+    try:
+        target(publish=web_app.hub.publish, chdir=False)
+        print(f"{name}: beendet")
+    except SystemExit as e:
+        print(f"ERROR: {name} beendet mit Exit-Code {e.code}")
+    except Exception as e:
+        print(f"ERROR: {name} abgebrochen: {e}")
+        traceback.print_exc()
+
+
+def start_producer(name, target):
+    thread = threading.Thread(target=run_producer, args=(name, target), name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aktien-Monitor, DSL-Speedtest und Web-App in einem Prozess")
+    parser.add_argument("--no-monitor", action="store_true", help="Aktien-Monitor nicht starten")
+    parser.add_argument("--no-speedtest", action="store_true", help="DSL-Speedtest nicht starten")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    # Letzte Snapshots aus den JSON-Dateien übernehmen, damit das Dashboard sofort Daten hat
+    web_app.publish_snapshot_files({})
+
+    if not args.no_monitor:
+        import status
+        start_producer("status", status.main)
+    if not args.no_speedtest:
+        import status_dsl
+        start_producer("status_dsl", status_dsl.main)
+
+    # Läuft ein Producer weiterhin als eigener Prozess, dessen JSON-Datei wie bisher überwachen
+    if args.no_monitor or args.no_speedtest:
+        web_app.start_file_watcher()
+    else:
+        web_app.app.config["SNAPSHOT_WATCHER"] = False
+
+    web_app.app.run(host=args.host, port=args.port, threaded=True, use_reloader=False)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
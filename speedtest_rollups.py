@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Speedtest Rollups - incrementally maintained hourly/daily/total aggregates of speedtest results
+Each rollup holds, per metric, count, sum, min, max and a mergeable log-bucket quantile sketch,
+plus the number of tests per server. status_dsl.py updates them with every measurement, the viewer
+answers summary and daily views from them without reading the raw history.
+Rollups live in the shared state store (see state_store.StateStore.merge_rollups).
+"""
+
+import math
+
+import pandas as pd
+
+KIND = "speedtest"
+METRICS = ('download_mbps', 'upload_mbps', 'ping_ms')
+RELATIVE_ACCURACY = 0.01
+
+
+class LogBucketSketch:
+    """
+    Quantile sketch with logarithmic buckets: value x > 0 falls into bucket ceil(log_gamma(x)),
+    gamma = (1 + a) / (1 - a). Quantiles are accurate to the relative error a; two sketches are merged
+    by adding their bucket counts, so hourly sketches combine into daily and total ones.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, buckets=None, zeros=0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = dict(buckets or {})
+        self.zeros = zeros
+
+    @property
+    def count(self):
+        return self.zeros + sum(self.buckets.values())
+
+    def add(self, value, count=1):
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return
+        if value <= 0:
+            self.zeros += count
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zeros += other.zeros
+        return self
+
+    def quantile(self, q):
+        """Approximate q-quantile (0 <= q <= 1); None for an empty sketch"""
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {'a': self.relative_accuracy, 'zeros': self.zeros,
+                'buckets': {str(index): count for index, count in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('a', RELATIVE_ACCURACY),
+                   {int(index): count for index, count in data.get('buckets', {}).items()},
+                   data.get('zeros', 0))
+
+
+def empty_rollup():
+    return {
+        'count': 0,
+        'first': None,
+        'last': None,
+        'metrics': {metric: {'count': 0, 'sum': 0.0, 'min': None, 'max': None,
+                             'sketch': LogBucketSketch().to_dict()} for metric in METRICS},
+        'servers': {},
+    }
+
+
+def add_measurement(rollup, results):
+    """Adds one speedtest result (dict with timestamp, metrics and server_name) to a rollup in place"""
+    rollup = rollup or empty_rollup()
+    timestamp = pd.Timestamp(results['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
+    rollup['count'] += 1
+    rollup['first'] = min(rollup['first'] or timestamp, timestamp)
+    rollup['last'] = max(rollup['last'] or timestamp, timestamp)
+
+    for metric in METRICS:
+        value = results.get(metric)
+        if value is None or pd.isna(value):
+            continue
+        value = float(value)
+        stats = rollup['metrics'][metric]
+        stats['count'] += 1
+        stats['sum'] += value
+        stats['min'] = value if stats['min'] is None else min(stats['min'], value)
+        stats['max'] = value if stats['max'] is None else max(stats['max'], value)
+        sketch = LogBucketSketch.from_dict(stats['sketch'])
+        sketch.add(value)
+        stats['sketch'] = sketch.to_dict()
+
+    server = results.get('server_name') or "unbekannt"
+    rollup['servers'][server] = rollup['servers'].get(server, 0) + 1
+    return rollup
+
+
+def combine_rollups(rollups):
+    """Combines several rollups (e.g. the daily ones of a window) into a new one; sketches are merged bucket-wise"""
+    combined = empty_rollup()
+    for rollup in rollups:
+        combined['count'] += rollup['count']
+        if rollup['first'] is not None:
+            combined['first'] = min(combined['first'] or rollup['first'], rollup['first'])
+        if rollup['last'] is not None:
+            combined['last'] = max(combined['last'] or rollup['last'], rollup['last'])
+        for metric in METRICS:
+            stats = rollup['metrics'][metric]
+            if not stats['count']:
+                continue
+            target = combined['metrics'][metric]
+            target['count'] += stats['count']
+            target['sum'] += stats['sum']
+            target['min'] = stats['min'] if target['min'] is None else min(target['min'], stats['min'])
+            target['max'] = stats['max'] if target['max'] is None else max(target['max'], stats['max'])
+            sketch = LogBucketSketch.from_dict(target['sketch']).merge(LogBucketSketch.from_dict(stats['sketch']))
+            target['sketch'] = sketch.to_dict()
+        for server, count in rollup['servers'].items():
+            combined['servers'][server] = combined['servers'].get(server, 0) + count
+    return combined
+
+
+def bucket_keys(timestamp):
+    """(granularity, bucket) pairs a measurement contributes to"""
+    timestamp = pd.Timestamp(timestamp)
+    return [
+        ('hour', timestamp.strftime('%Y-%m-%d %H:00')),
+        ('day', timestamp.strftime('%Y-%m-%d')),
+        ('total', 'all'),
+    ]
+
+
+def update_rollups(store, results):
+    """Adds a speedtest result to its hourly, daily and total rollup (one transaction)"""
+    store.merge_rollups(KIND, bucket_keys(results['timestamp']), lambda rollup: add_measurement(rollup, results))
+
+
+def rollups_exist(store):
+    return store.rollup(KIND, 'total', 'all') is not None
+
+
+def rebuild_rollups(store, df):
+    """Rebuilds all rollups from raw history (DataFrame), e.g. on first start with an existing dataset"""
+    rollups = {}
+    for record in df.to_dict('records'):
+        for key in bucket_keys(record['timestamp']):
+            rollups[key] = add_measurement(rollups.get(key), record)
+    store.replace_rollups(KIND, [(granularity, bucket, rollup) for (granularity, bucket), rollup in rollups.items()])
+    return len(df)
+
+
+def metric_summary(stats):
+    """mean/min/max/median/p90 of one metric in a rollup; None if it has no values"""
+    if not stats['count']:
+        return None
+    sketch = LogBucketSketch.from_dict(stats['sketch'])
+    return {
+        'mean': stats['sum'] / stats['count'],
+        'min': stats['min'],
+        'max': stats['max'],
+        'median': sketch.quantile(0.5),
+        'p90': sketch.quantile(0.9),
+    }
+
+
+def summarize(rollup):
+    """Summary of a rollup: count, first/last timestamp, per-metric statistics and server counts"""
+    return {
+        'count': rollup['count'],
+        'first': rollup['first'],
+        'last': rollup['last'],
+        'metrics': {metric: metric_summary(rollup['metrics'][metric]) for metric in METRICS},
+        'servers': dict(sorted(rollup['servers'].items(), key=lambda item: item[1], reverse=True)),
+    }
+
+
+def total_summary(store):
+    """Summary over the whole history from the 'total' rollup; None if no rollups exist"""
+    rollup = store.rollup(KIND, 'total', 'all')
+    return summarize(rollup) if rollup else None
+
+
+def window_summary(store, start=None, end=None):
+    """Summary over the daily rollups with start <= day < end (days as 'YYYY-MM-DD'); None if there are none"""
+    rollups = [rollup for _, rollup in store.rollups(KIND, 'day', start=start, end=end)]
+    return summarize(combine_rollups(rollups)) if rollups else None
+
+
+def daily_means(store, start=None, end=None):
+    """DataFrame of daily mean values (index: date) from the daily rollups"""
+    rows = []
+    for bucket, rollup in store.rollups(KIND, 'day', start=start, end=end):
+        row = {'date': pd.Timestamp(bucket).date(), 'count': rollup['count']}
+        for metric in METRICS:
+            stats = rollup['metrics'][metric]
+            row[metric] = stats['sum'] / stats['count'] if stats['count'] else None
+        rows.append(row)
+    if not rows:
+        return pd.DataFrame(columns=['count', *METRICS])
+    return pd.DataFrame(rows).set_index('date')
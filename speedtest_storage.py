@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Speedtest Storage - append-only Parquet dataset for speedtest history
+Layout (Hive-style, one partition per month):
+
+    speedtest_data/month=2025-10/part-20251018T101500-1a2b3c4d.parquet   one file per measurement
+    speedtest_data/month=2025-10/compacted.parquet                         merged parts of the month
+
+Each measurement is written as its own small file (O(1), independent of history size). A partition
+is compacted into compacted.parquet once it holds enough parts; a crash during compaction leaves
+at worst duplicate rows, which the reader drops by timestamp.
+"""
+
+import os
+import glob
+import uuid
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+
+SCHEMA = pa.schema([
+    ('timestamp', pa.timestamp('us')),
+    ('server_name', pa.string()),
+    ('server_location', pa.string()),
+    ('download_mbps', pa.float64()),
+    ('upload_mbps', pa.float64()),
+    ('ping_ms', pa.float64()),
+    ('ip_address', pa.string()),
+])
+
+PARTITION_FIELD = "month"
+COMPACTED_FILE = "compacted.parquet"
+
+# Rows per row group in compacted files (about one week at a 10 minute interval), so that
+# time-range reads can skip row groups by their timestamp statistics
+ROW_GROUP_SIZE = 1008
+
+PARTITIONING = ds.partitioning(pa.schema([(PARTITION_FIELD, pa.string())]), flavor="hive")
+
+
+def partition_dir(dataset_dir, timestamp):
+    """Directory of the month partition a timestamp belongs to"""
+    return os.path.join(dataset_dir, f"{PARTITION_FIELD}={pd.Timestamp(timestamp).strftime('%Y-%m')}")
+
+
+def _to_table(df):
+    """DataFrame -> Arrow table with the fixed dataset schema (missing columns become null)"""
+    df = df.copy()
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    for field in SCHEMA:
+        if field.name not in df.columns:
+            df[field.name] = None
+    return pa.Table.from_pandas(df[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+
+
+def _write_table_atomic(table, path):
+    """Writes via a hidden temp file (ignored by dataset readers) and os.replace, sorted rows in ROW_GROUP_SIZE groups"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".parquet", dir=directory)
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def append_measurement(dataset_dir, row):
+    """Writes one measurement as a new part file of its month partition; returns the file path"""
+    timestamp = pd.Timestamp(row['timestamp'])
+    directory = partition_dir(dataset_dir, timestamp)
+    path = os.path.join(directory, f"part-{timestamp.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet")
+    _write_table_atomic(_to_table(pd.DataFrame([row])), path)
+    return path
+
+
+def part_files(directory):
+    return sorted(glob.glob(os.path.join(directory, "part-*.parquet")))
+
+
+def compact_partition(directory):
+    """
+    Merges all part files of a partition (and the existing compacted file) into compacted.parquet,
+    sorted and deduplicated by timestamp, then removes the merged parts. Returns the number of rows.
+    """
+    parts = part_files(directory)
+    compacted = os.path.join(directory, COMPACTED_FILE)
+    sources = ([compacted] if os.path.exists(compacted) else []) + parts
+    if not sources:
+        return 0
+
+    df = pa.concat_tables([pq.read_table(path, schema=SCHEMA) for path in sources]).to_pandas()
+    df = df.sort_values('timestamp').drop_duplicates(subset=['timestamp'], keep='last')
+    _write_table_atomic(_to_table(df), compacted)
+    for path in parts:
+        os.remove(path)
+    return len(df)
+
+
+def compact_if_needed(directory, max_parts):
+    """Compacts a partition once it holds at least max_parts part files; returns True if compacted"""
+    if max_parts and len(part_files(directory)) >= max_parts:
+        compact_partition(directory)
+        return True
+    return False
+
+
+def compact_closed_partitions(dataset_dir, now=None):
+    """Compacts every partition of a past month that still holds part files; returns the compacted directories"""
+    current = os.path.basename(partition_dir(dataset_dir, now or pd.Timestamp.now()))
+    compacted = []
+    for directory in sorted(glob.glob(os.path.join(dataset_dir, f"{PARTITION_FIELD}=*"))):
+        if os.path.basename(directory) != current and part_files(directory):
+            compact_partition(directory)
+            compacted.append(directory)
+    return compacted
+
+
+def migrate_legacy_file(parquet_file, dataset_dir):
+    """
+    Splits a legacy single-file speedtest_data.parquet into month partitions (compacted files) and
+    renames it to *.migrated. Returns the number of migrated rows, 0 if there is nothing to migrate.
+    """
+    if not parquet_file or not os.path.isfile(parquet_file):
+        return 0
+
+    df = pd.read_parquet(parquet_file)
+    if not df.empty:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        for month, month_df in df.groupby(df['timestamp'].dt.strftime('%Y-%m')):
+            directory = os.path.join(dataset_dir, f"{PARTITION_FIELD}={month}")
+            # Write as a part file so that data already in the partition is merged, not overwritten
+            _write_table_atomic(_to_table(month_df), os.path.join(directory, f"part-migrated-{uuid.uuid4().hex[:8]}.parquet"))
+            compact_partition(directory)
+    os.replace(parquet_file, parquet_file + ".migrated")
+    return len(df)
+
+
+def dataset_fingerprint(dataset_dir):
+    """(file name, size, mtime) of all visible data files; changes whenever a part is appended or compacted"""
+    entries = []
+    for directory in glob.glob(os.path.join(dataset_dir, f"{PARTITION_FIELD}=*")):
+        with os.scandir(directory) as files:
+            for entry in files:
+                if entry.is_file() and not entry.name.startswith(('.', '_')):
+                    stat_result = entry.stat()
+                    entries.append((os.path.join(os.path.basename(directory), entry.name),
+                                    stat_result.st_size, stat_result.st_mtime_ns))
+    return tuple(sorted(entries))
+
+
+def dataset_exists(dataset_dir):
+    return bool(dataset_dir) and os.path.isdir(dataset_dir)
+
+
+def _timestamp_scalar(value):
+    return pa.scalar(pd.Timestamp(value).to_pydatetime(), type=SCHEMA.field('timestamp').type)
+
+
+def time_filter(start=None, end=None):
+    """
+    Dataset filter for start <= timestamp < end. The condition on the month partition prunes whole
+    folders without opening them; the timestamp condition skips row groups by their statistics.
+    """
+    expression = None
+    if start is not None:
+        start = pd.Timestamp(start)
+        expression = (ds.field(PARTITION_FIELD) >= start.strftime('%Y-%m')) & (ds.field('timestamp') >= _timestamp_scalar(start))
+    if end is not None:
+        end = pd.Timestamp(end)
+        condition = (ds.field(PARTITION_FIELD) <= end.strftime('%Y-%m')) & (ds.field('timestamp') < _timestamp_scalar(end))
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_dataset(dataset_dir, start=None, end=None, columns=None):
+    """
+    Reads the dataset (compacted and part files) as a DataFrame sorted by timestamp.
+    start/end restrict the time range and columns the projection; both are pushed down to pyarrow,
+    so only the needed partitions, row groups and columns are read. 'timestamp' is always included.
+    """
+    if columns is not None:
+        columns = ['timestamp'] + [column for column in columns if column != 'timestamp']
+    dataset = ds.dataset(dataset_dir, format="parquet", schema=SCHEMA.append(pa.field(PARTITION_FIELD, pa.string())),
+                         partitioning=PARTITIONING)
+    df = dataset.to_table(columns=columns or SCHEMA.names, filter=time_filter(start, end)).to_pandas()
+    return df.sort_values('timestamp').drop_duplicates(subset=['timestamp'], keep='last').reset_index(drop=True)
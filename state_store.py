@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+State Store - gemeinsamer Snapshot-Speicher (SQLite im WAL-Modus)
+status.py und status_dsl.py hängen ihre Snapshots an, app.py und dsl_speedtest_viewer.py lesen sie.
+Im WAL-Modus blockieren Leser keine Schreiber (und umgekehrt), auch über Prozessgrenzen hinweg.
+"""
+
+import configparser
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_FILE = "state.sqlite"
+
+
+def configured_store_file(ini_file, default=DEFAULT_FILE):
+    """
+    Pfad des State-Stores laut [Files] state_store einer INI-Datei (status.ini, status_dsl.ini).
+    Relative Pfade gelten wie in den Producern relativ zu [Paths] path bzw. zum Ordner der INI-Datei.
+    """
+    cfg = configparser.ConfigParser(interpolation=None)
+    base_dir = os.path.dirname(os.path.abspath(ini_file))
+    try:
+        cfg.read(ini_file, encoding="utf-8")
+    except configparser.Error:
+        pass
+    path_setting = cfg.get("Paths", "path", fallback="").strip()
+    if path_setting and path_setting.lower() != "default":
+        base_dir = path_setting
+    path_value = cfg.get("Files", "state_store", fallback="").strip() or default
+    if not os.path.isabs(path_value):
+        path_value = os.path.join(base_dir, path_value)
+    return os.path.normpath(path_value)
+
+
+def _format_ts(value):
+    """Zeitstempel als sortierbarer Text (YYYY-MM-DD HH:MM:SS); Strings werden unverändert übernommen"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+class StateStore:
+    """
+    Snapshots je Art (z.B. 'depot', 'speedtest') mit Zeitstempel und Version.
+    Der Index (kind, ts) macht 'latest' und Zeitbereichsabfragen unabhängig von der Historienlänge.
+    """
+
+    def __init__(self, filename, timeout=10.0):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filename, timeout=timeout, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, ts TEXT NOT NULL, "
+            "version TEXT, payload TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_kind_ts ON snapshots (kind, ts)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rollups ("
+            "kind TEXT NOT NULL, granularity TEXT NOT NULL, bucket TEXT NOT NULL, payload TEXT NOT NULL, "
+            "PRIMARY KEY (kind, granularity, bucket))"
+        )
+        self.conn.commit()
+
+    def append(self, kind, data, ts=None, version=None):
+        """Hängt einen Snapshot an; gibt die Zeilen-ID zurück"""
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO snapshots (kind, ts, version, payload) VALUES (?, ?, ?, ?)",
+                (kind, _format_ts(ts or datetime.now()), version, payload)
+            )
+            self.conn.commit()
+        return cursor.lastrowid
+
+    @staticmethod
+    def _row_to_snapshot(row):
+        ts, version, payload = row
+        return {'ts': ts, 'version': version, 'data': json.loads(payload)}
+
+    def latest(self, kind):
+        """Neuester Snapshot als {'ts', 'version', 'data'} oder None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT ts, version, payload FROM snapshots WHERE kind = ? ORDER BY ts DESC, id DESC LIMIT 1",
+                (kind,)
+            ).fetchone()
+        return self._row_to_snapshot(row) if row else None
+
+    def latest_version(self, kind):
+        """(ts, version) des neuesten Snapshots ohne Payload, z.B. für Änderungsprüfungen"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT ts, version FROM snapshots WHERE kind = ? ORDER BY ts DESC, id DESC LIMIT 1",
+                (kind,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def range(self, kind, start=None, end=None, limit=None):
+        """Snapshots mit start <= ts < end in zeitlicher Reihenfolge (Grenzen optional)"""
+        query = "SELECT ts, version, payload FROM snapshots WHERE kind = ?"
+        params = [kind]
+        if start is not None:
+            query += " AND ts >= ?"
+            params.append(_format_ts(start))
+        if end is not None:
+            query += " AND ts < ?"
+            params.append(_format_ts(end))
+        query += " ORDER BY ts, id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [self._row_to_snapshot(row) for row in rows]
+
+    def prune(self, kind, before):
+        """Löscht Snapshots einer Art, die älter als `before` sind; gibt die Anzahl zurück"""
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM snapshots WHERE kind = ? AND ts < ?", (kind, _format_ts(before)))
+            self.conn.commit()
+        return cursor.rowcount
+
+    def rollup(self, kind, granularity, bucket):
+        """Aggregat eines Zeitfensters (z.B. 'day', '2025-10-18') oder None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT payload FROM rollups WHERE kind = ? AND granularity = ? AND bucket = ?",
+                (kind, granularity, bucket)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def rollups(self, kind, granularity, start=None, end=None):
+        """(bucket, aggregat) mit start <= bucket < end, sortiert nach bucket"""
+        query = "SELECT bucket, payload FROM rollups WHERE kind = ? AND granularity = ?"
+        params = [kind, granularity]
+        if start is not None:
+            query += " AND bucket >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND bucket < ?"
+            params.append(end)
+        query += " ORDER BY bucket"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [(bucket, json.loads(payload)) for bucket, payload in rows]
+
+    def merge_rollups(self, kind, keys, merge):
+        """
+        Aktualisiert mehrere Aggregate in einer Transaktion: für jedes (granularity, bucket) aus keys
+        wird merge(bisheriges Aggregat oder None) gespeichert.
+        """
+        with self.lock:
+            with self.conn:
+                for granularity, bucket in keys:
+                    row = self.conn.execute(
+                        "SELECT payload FROM rollups WHERE kind = ? AND granularity = ? AND bucket = ?",
+                        (kind, granularity, bucket)
+                    ).fetchone()
+                    rollup = merge(json.loads(row[0]) if row else None)
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO rollups (kind, granularity, bucket, payload) VALUES (?, ?, ?, ?)",
+                        (kind, granularity, bucket, json.dumps(rollup, separators=(',', ':')))
+                    )
+
+    def replace_rollups(self, kind, items):
+        """Ersetzt alle Aggregate einer Art durch items [(granularity, bucket, aggregat), ...]"""
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM rollups WHERE kind = ?", (kind,))
+                self.conn.executemany(
+                    "INSERT INTO rollups (kind, granularity, bucket, payload) VALUES (?, ?, ?, ?)",
+                    [(kind, granularity, bucket, json.dumps(rollup, separators=(',', ':')))
+                     for granularity, bucket, rollup in items]
+                )
+
+    def close(self):
+        self.conn.close()
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import yfinance as yf
 import os
 import sys
@@ -6,6 +7,15 @@ from datetime import datetime, timedelta
 from holidays.countries.germany import Germany
 import time
 import json
+import asyncio
+import threading
+import sqlite3
+import hashlib
+import functools
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from state_store import StateStore
 
 # Import ahlib functions
 from ahlib import (
@@ -18,6 +28,28 @@ from ahlib import (
 # Global logger instance
 logger = None
 
+# Global close price cache instance (see ClosePriceCache)
+price_cache = None
+
+# Global trading calendar instance (see TradingCalendar)
+trading_calendar = None
+
+# Global snapshot store shared with app.py (see state_store.StateStore)
+state_store = None
+
+# Basisverzeichnis für relative Pfade ([Paths] path bzw. Skriptordner), wird in initializing gesetzt
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Einträge aus [Files], die relativ zu base_dir aufgelöst werden
+PATH_SETTINGS = ("logfile", "prices", "price_cache", "state_store", "instruments", "bookings", "cache_dir")
+
+
+def resolve_path(path):
+    """Relativer Pfad -> absoluter Pfad unter base_dir, unabhängig vom aktuellen Arbeitsverzeichnis"""
+    if not path or os.path.isabs(path):
+        return path
+    return os.path.join(base_dir, path)
+
 
 def screen_and_log(message, logfile=None, screen=True):
     """
@@ -53,8 +85,67 @@ def function_result(function_name, error_count, warning_count, logfile, screen=T
         screen_and_log(f"Info: {function_name} erfolgreich abgeschlossen.", logfile, screen=True)
 
 
+def source_fingerprint(filename):
+    """Liefert den Fingerabdruck (Pfad, Größe, mtime) einer Quelldatei"""
+    stat_result = os.stat(filename)
+    return {
+        'source': os.path.abspath(filename),
+        'size': stat_result.st_size,
+        'mtime_ns': stat_result.st_mtime_ns,
+    }
+
+
+def read_cached_frame(filename, parser, cache_dir, logfile=None, screen=True):
+    """
+    Liefert den geparsten DataFrame einer Quelldatei aus einem lokalen Parquet-Cache.
+    Der Cache ist über Pfad, Größe und mtime der Quelle geschlüsselt; nur bei Änderungen
+    wird die Quelle mit parser(filename) neu eingelesen und der Cache aktualisiert.
+    """
+    if not cache_dir:
+        return parser(filename)
+
+    fingerprint = source_fingerprint(filename)
+    cache_name = hashlib.sha1(fingerprint['source'].lower().encode('utf-8')).hexdigest()[:12]
+    base_name = os.path.splitext(os.path.basename(filename))[0]
+    cache_file = os.path.join(cache_dir, f"{base_name}_{cache_name}.parquet")
+    meta_file = cache_file + ".json"
+
+    try:
+        if os.path.exists(cache_file) and os.path.exists(meta_file):
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                cached_fingerprint = json.load(f)
+            if cached_fingerprint == fingerprint:
+                df = pd.read_parquet(cache_file)
+                screen_and_log(f"Info: '{filename}' unverändert, lade aus Cache '{cache_file}'", logfile, screen=screen)
+                return df
+    except Exception as e:
+        screen_and_log(f"WARNING: Cache '{cache_file}' nicht lesbar ({e}). Lese Quelldatei neu ein.", logfile, screen=screen)
+
+    df = parser(filename)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_parquet(cache_file)
+        # Metadaten erst nach erfolgreichem Schreiben der Daten ablegen
+        with open(meta_file, 'w', encoding='utf-8') as f:
+            json.dump(fingerprint, f)
+    except Exception as e:
+        screen_and_log(f"WARNING: Cache für '{filename}' konnte nicht geschrieben werden: {e}", logfile, screen=screen)
+
+    return df
+
+
 # Spezifische Funktionen
-def instruments_import(filename, logfile, screen=True):
+def _parse_instruments(filename):
+    """Parst die Instruments-Excel-Datei und normalisiert WKN und Ticker"""
+    df = pd.read_excel(filename, usecols=[0, 1, 2, 3], index_col=0)
+    df.index = df.index.str.lower()
+    df['ticker'] = df['ticker'].str.lower()
+    df.columns = ['ticker', 'instrument_name', 'default_value']
+    return df
+
+
+def instruments_import(filename, logfile, screen=True, cache_dir=None):
     """
     Liest die Excel-Datei und importiert die ersten vier Spalten (wkn, ticker, instrument_name, Default)
     """
@@ -62,11 +153,7 @@ def instruments_import(filename, logfile, screen=True):
         if not filename.endswith(('.xlsx', '.xls')):
             raise ValueError(f"Die Datei '{filename}' ist keine Excel-Datei.")
 
-        df = pd.read_excel(filename, usecols=[0, 1, 2, 3], index_col=0)
-        df.index = df.index.str.lower()  
-        df['ticker'] = df['ticker'].str.lower()  
-        df.columns = ['ticker', 'instrument_name', 'default_value'] 
-        return df
+        return read_cached_frame(filename, _parse_instruments, cache_dir, logfile, screen=screen)
 
     except FileNotFoundError:
         screen_and_log(f"ERROR: Die Datei '{filename}' wurde nicht gefunden.", logfile, screen=screen)
@@ -79,16 +166,21 @@ def instruments_import(filename, logfile, screen=True):
         return None
 
 
-def bookings_import(filename, logfile, screen=True):
+def _parse_bookings(filename):
+    """Parst die Buchungs-Excel-Datei und summiert Buchungen je (date, wkn, bank)"""
+    df = pd.read_excel(filename, usecols=[0, 1, 2, 3], names=['date', 'wkn', 'bank', 'delta'])
+    df['wkn'] = df['wkn'].str.lower()
+    df['bank'] = df['bank'].str.lower()
+    df.dropna(subset=['wkn', 'bank', 'delta'], inplace=True)
+    df.set_index(['date', 'wkn', 'bank'], inplace=True)
+    df = df.groupby(level=['date', 'wkn', 'bank']).sum()
+    return df
+
+
+def bookings_import(filename, logfile, screen=True, cache_dir=None):
     """Liest Buchungsdaten aus Excel-Datei"""
     try:
-        df = pd.read_excel(filename, usecols=[0, 1, 2, 3], names=['date', 'wkn', 'bank', 'delta'])
-        df['wkn'] = df['wkn'].str.lower()
-        df['bank'] = df['bank'].str.lower()
-        df.dropna(subset=['wkn', 'bank', 'delta'], inplace=True)
-        df.set_index(['date', 'wkn', 'bank'], inplace=True)
-        df = df.groupby(level=['date', 'wkn', 'bank']).sum()
-        return df
+        return read_cached_frame(filename, _parse_bookings, cache_dir, logfile, screen=screen)
     except FileNotFoundError:
         screen_and_log(f"Fehler: Die Datei '{filename}' wurde nicht gefunden.", logfile, screen=screen)
         return None
@@ -105,83 +197,378 @@ def bookings_check_for_instruments(bookings, instruments):
     return missing_in_instruments
 
 
-def shares_from_bookings(bookings, end_date, logfile, screen=False):
-    """Erweitert den DataFrame `bookings` mit allen Kombinationen von Datum, wkn und Bank bis zu einem angegebenen Enddatum und berechnet die laufende Summe."""
-    all_dates = pd.date_range(bookings.index.get_level_values('date').min(), end_date)
-    wkns = bookings.index.get_level_values('wkn').unique()
-    banks = bookings.index.get_level_values('bank').unique()
-    
-    full_index = pd.MultiIndex.from_product([all_dates, wkns, banks], names=['date', 'wkn', 'bank'])
-    bookings_expanded = bookings.reindex(full_index).fillna(0)
-    bookings_expanded['delta'] = bookings_expanded.groupby(['wkn', 'bank'])['delta'].cumsum()
-    bookings_expanded['delta'] = bookings_expanded['delta'].where(bookings_expanded['delta'] >= 0.0001, 0)
-    bookings_expanded.rename(columns={'delta': 'share'}, inplace=True)
-    screen_and_log('Info: Positionen (shares) auf Tagesbasis erfolgreich aufgebaut', logfile, screen=screen)
-    return bookings_expanded
-
-
-def aggregate_banks(df):
-    """Aggregiert die Werte in einem DataFrame mit MultiIndex (date, wkn, bank) über alle Banken"""
-    expected_index = ['date', 'wkn', 'bank']
-    if list(df.index.names) != expected_index:
-        raise ValueError(f"Der DataFrame muss den MultiIndex {expected_index} haben.")
-    df_aggregated = df.groupby(['date', 'wkn']).sum()
-    return df_aggregated
-
-
-def get_historical_price(ticker, date, logfile=None, screen=True):
-    """Holt historischen Preis für ein bestimmtes Datum von yfinance"""
+class PositionBook:
+    """
+    Sparse Positionsbestände: speichert je Schlüssel (wkn, bank) bzw. wkn nur die Änderungszeitpunkte
+    (Buchungstage) und den laufenden Bestand. Der Bestand zu einem Datum wird per Binärsuche ermittelt,
+    statt einen dichten Würfel Datum x WKN x Bank aufzubauen.
+    """
+
+    def __init__(self, index_names, changes, clip=True):
+        self.index_names = list(index_names)
+        # {key: (dates als datetime64[ns]-Array, laufender Bestand als float-Array)}
+        self.changes = changes
+        # Bestände unter 0.0001 werden je Schlüssel als 0 behandelt
+        self.clip = clip
+
+    @staticmethod
+    def _group_bookings(bookings):
+        """Gruppiert Buchungen je (wkn, bank), sortiert nach Datum und summiert je Tag"""
+        flat = bookings.reset_index()
+        flat['date'] = pd.to_datetime(flat['date']).dt.normalize()
+        flat = flat.groupby(['wkn', 'bank', 'date'], sort=True)['delta'].sum().reset_index()
+        return flat.groupby(['wkn', 'bank'], sort=False)
+
+    @classmethod
+    def from_bookings(cls, bookings):
+        """Baut die Änderungspunkte je (wkn, bank) aus dem Buchungs-DataFrame auf"""
+        changes = {}
+        for key, group in cls._group_bookings(bookings):
+            changes[key] = (group['date'].to_numpy(dtype='datetime64[ns]'),
+                            group['delta'].cumsum().to_numpy(dtype=float))
+        return cls(['wkn', 'bank'], changes)
+
+    def with_bookings(self, bookings):
+        """
+        Liefert ein neues PositionBook (je (wkn, bank)) ergänzt um zusätzliche Buchungen.
+        Liegen alle neuen Buchungen eines Schlüssels nach dessen letztem Änderungszeitpunkt, wird nur
+        angehängt; rückdatierte Buchungen kumulieren nur den betroffenen Schlüssel neu.
+        Gibt (neues PositionBook, Menge der betroffenen WKNs) zurück.
+        """
+        changes = dict(self.changes)
+        affected_wkns = set()
+
+        for key, group in self._group_bookings(bookings):
+            new_dates = group['date'].to_numpy(dtype='datetime64[ns]')
+            new_deltas = group['delta'].to_numpy(dtype=float)
+            affected_wkns.add(key[0])
+
+            if key not in changes:
+                changes[key] = (new_dates, np.cumsum(new_deltas))
+                continue
+
+            dates, shares = changes[key]
+            if new_dates[0] > dates[-1]:
+                changes[key] = (np.concatenate([dates, new_dates]),
+                                np.concatenate([shares, shares[-1] + np.cumsum(new_deltas)]))
+            else:
+                all_dates = np.concatenate([dates, new_dates])
+                all_deltas = np.concatenate([np.diff(shares, prepend=0.0), new_deltas])
+                unique_dates, inverse = np.unique(all_dates, return_inverse=True)
+                changes[key] = (unique_dates, np.cumsum(np.bincount(inverse, weights=all_deltas)))
+
+        return PositionBook(self.index_names, changes, self.clip), affected_wkns
+
+    @property
+    def start_date(self):
+        """Erster Änderungszeitpunkt über alle Schlüssel (None, wenn leer)"""
+        if not self.changes:
+            return None
+        return pd.Timestamp(min(dates[0] for dates, _ in self.changes.values()))
+
+    def _values_as_of(self, key, dates):
+        """Bestand eines Schlüssels zu mehreren Zeitpunkten (datetime64-Array)"""
+        change_dates, shares = self.changes[key]
+        positions = np.searchsorted(change_dates, dates, side='right') - 1
+        values = np.where(positions >= 0, shares[np.maximum(positions, 0)], 0.0)
+        if self.clip:
+            values = np.where(values >= 0.0001, values, 0.0)
+        return values
+
+    def shares_on(self, date):
+        """
+        Liefert die Bestände zum Datum als DataFrame mit Spalte 'share' (Index wie index_names),
+        oder None, wenn das Datum vor der ersten Buchung liegt.
+        """
+        start_date = self.start_date
+        date = pd.Timestamp(date).normalize()
+        if start_date is None or date < start_date:
+            return None
+
+        keys = list(self.changes.keys())
+        target = np.array([date.to_datetime64()], dtype='datetime64[ns]')
+        values = [self._values_as_of(key, target)[0] for key in keys]
+
+        if len(self.index_names) > 1:
+            index = pd.MultiIndex.from_tuples(keys, names=self.index_names)
+        else:
+            index = pd.Index(keys, name=self.index_names[0])
+        return pd.DataFrame({'share': values}, index=index)
+
+
+def shares_from_bookings(bookings, logfile, screen=False):
+    """Baut aus dem DataFrame `bookings` die sparse Positionsbestände je (wkn, bank) auf (nur Buchungstage)."""
+    positions = PositionBook.from_bookings(bookings)
+    screen_and_log('Info: Positionen (shares) je Buchungstag erfolgreich aufgebaut', logfile, screen=screen)
+    return positions
+
+
+def aggregate_banks(positions, previous=None, wkns=None):
+    """
+    Aggregiert die Bestände eines PositionBook mit Schlüssel (wkn, bank) über alle Banken.
+    Mit `previous` und `wkns` werden nur die angegebenen WKNs neu aggregiert, alle anderen übernommen.
+    """
+    expected_index = ['wkn', 'bank']
+    if positions.index_names != expected_index:
+        raise ValueError(f"Das PositionBook muss den Schlüssel {expected_index} haben.")
+
+    keys_by_wkn = {}
+    for key in positions.changes:
+        if previous is None or wkns is None or key[0] in wkns:
+            keys_by_wkn.setdefault(key[0], []).append(key)
+
+    changes = dict(previous.changes) if previous is not None and wkns is not None else {}
+    for wkn, keys in keys_by_wkn.items():
+        dates = np.unique(np.concatenate([positions.changes[key][0] for key in keys]))
+        shares = np.sum([positions._values_as_of(key, dates) for key in keys], axis=0)
+        changes[wkn] = (dates, shares)
+    return PositionBook(['wkn'], changes, clip=False)
+
+
+class ClosePriceCache:
+    """
+    Persistenter Speicher für Schlusskurse, Schlüssel (ticker, datum).
+    Gespeichert wird der Schlusskurs, der für ein Datum gilt (bei Nicht-Handelstagen der letzte
+    Kurs davor). Nur abgeschlossene Tage (vor heute) werden abgelegt, da sich diese nicht mehr ändern.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS close_prices ("
+            "ticker TEXT NOT NULL, date TEXT NOT NULL, close REAL NOT NULL, "
+            "PRIMARY KEY (ticker, date))"
+        )
+        self.conn.commit()
+
+    def get(self, ticker, date):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT close FROM close_prices WHERE ticker = ? AND date = ?",
+                (ticker, pd.Timestamp(date).strftime('%Y-%m-%d'))
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, rows):
+        """Speichert mehrere (ticker, datum, close)-Einträge; offene Handelstage werden ignoriert"""
+        today = pd.Timestamp(datetime.today().date())
+        records = [
+            (ticker, pd.Timestamp(date).strftime('%Y-%m-%d'), float(close))
+            for ticker, date, close in rows
+            if pd.Timestamp(date).normalize() < today and pd.notna(close)
+        ]
+        if records:
+            with self.lock:
+                self.conn.executemany("INSERT OR REPLACE INTO close_prices VALUES (?, ?, ?)", records)
+                self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def call_with_timeout(func, timeout, *args, **kwargs):
+    """
+    Führt func mit hartem Timeout in einem Daemon-Thread aus und löst bei Zeitüberschreitung TimeoutError aus.
+    Ein hängender Aufruf läuft im Hintergrund aus, blockiert aber den Monitor nicht mehr.
+    """
+    if not timeout:
+        return func(*args, **kwargs)
+
+    result = {}
+
+    def target():
+        try:
+            result['value'] = func(*args, **kwargs)
+        except BaseException as e:
+            result['error'] = e
+
+    worker = threading.Thread(target=target, daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if worker.is_alive():
+        raise TimeoutError(f"Zeitüberschreitung nach {timeout} Sekunden")
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+
+class TickerCircuitBreaker:
+    """
+    Circuit Breaker je Ticker. Nach failure_threshold aufeinanderfolgenden Fehlern wird ein Ticker für
+    eine Abkühlzeit nicht mehr abgefragt; jeder weitere Fehlschlag verdoppelt die Abkühlzeit bis max_cooldown
+    (exponentielles Backoff). Nach Ablauf ist genau ein Versuch erlaubt (half-open), ein Erfolg schließt den Breaker.
+    Der letzte bekannte Kurs bleibt erhalten und wird bei Ausfällen als veraltet ausgeliefert.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown=300, max_cooldown=3600):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def _entry(self, ticker):
+        return self.entries.setdefault(ticker, {
+            'failures': 0,
+            'open_until': None,
+            'last_price': None,
+            'last_success': None,
+            'last_error': None,
+            'stale': False,
+        })
+
+    def allow(self, ticker, now=None):
+        """True, wenn der Ticker abgefragt werden darf (Breaker geschlossen oder Abkühlzeit abgelaufen)"""
+        now = now or datetime.now()
+        with self.lock:
+            entry = self.entries.get(ticker)
+            allowed = entry is None or entry['open_until'] is None or now >= entry['open_until']
+            if not allowed:
+                entry['stale'] = True
+            return allowed
+
+    def record_success(self, ticker, price=None):
+        with self.lock:
+            entry = self._entry(ticker)
+            entry.update(failures=0, open_until=None, last_error=None, stale=False)
+            if price is not None:
+                entry['last_price'] = price
+                entry['last_success'] = datetime.now()
+
+    def record_failure(self, ticker, reason):
+        """Zählt einen Fehlschlag; gibt die Abkühlzeit in Sekunden zurück, falls der Breaker (erneut) öffnet"""
+        with self.lock:
+            entry = self._entry(ticker)
+            entry['failures'] += 1
+            entry['last_error'] = str(reason)
+            entry['stale'] = True
+            if entry['failures'] < self.failure_threshold:
+                return None
+            cooldown = min(self.cooldown * 2 ** (entry['failures'] - self.failure_threshold), self.max_cooldown)
+            entry['open_until'] = datetime.now() + timedelta(seconds=cooldown)
+            return cooldown
+
+    def last_price(self, ticker):
+        with self.lock:
+            entry = self.entries.get(ticker)
+            return entry['last_price'] if entry else None
+
+    def is_stale(self, ticker):
+        with self.lock:
+            entry = self.entries.get(ticker)
+            return bool(entry and entry['stale'])
+
+    def status(self):
+        """Zustand aller Ticker mit Fehlern für die JSON-Ausgabe"""
+        now = datetime.now()
+        with self.lock:
+            result = {}
+            for ticker, entry in self.entries.items():
+                if entry['failures'] == 0:
+                    continue
+                if entry['open_until'] is None:
+                    state = "closed"
+                elif now < entry['open_until']:
+                    state = "open"
+                else:
+                    state = "half-open"
+                result[ticker] = {
+                    "state": state,
+                    "failures": entry['failures'],
+                    "retry_at": entry['open_until'].strftime('%d.%m.%Y %H:%M:%S') if entry['open_until'] else "",
+                    "last_success": entry['last_success'].strftime('%d.%m.%Y %H:%M:%S') if entry['last_success'] else "",
+                    "last_error": entry['last_error'] or "",
+                }
+            return result
+
+
+def build_circuit_breaker(settings):
+    """Erstellt den Circuit Breaker aus dem Abschnitt [Quotes] der Einstellungen"""
+    quote_settings = settings.get("Quotes", {})
+    return TickerCircuitBreaker(failure_threshold=int(quote_settings.get("failure_threshold", 3)),
+                                cooldown=float(quote_settings.get("cooldown", 300)),
+                                max_cooldown=float(quote_settings.get("max_cooldown", 3600)))
+
+
+def _close_value_to_float(close_value):
+    """Konvertiert einen Close-Wert aus yfinance zu float, None bei NaN oder ungültigen Werten"""
+    if isinstance(close_value, pd.Series):
+        close_value = close_value.iloc[0]
+    if pd.isna(close_value):
+        return None
+    try:
+        return float(str(close_value))
+    except (ValueError, TypeError):
+        return None
+
+
+def get_historical_price(ticker, date, logfile=None, screen=True, cache=None, downloader=None, timeout=None, breaker=None):
+    """
+    Holt historischen Preis für ein bestimmtes Datum.
+    Liest zuerst aus dem Schlusskurs-Cache und lädt nur bei einem Fehltreffer von yfinance
+    (mit hartem Timeout und unter Beachtung des Circuit Breakers).
+    """
     try:
         if pd.isna(ticker) or str(ticker).strip() == '':
             return None
             
         ticker_clean = str(ticker).strip().upper()
-        
+        target_date = pd.Timestamp(date).normalize()
+
+        if cache is None:
+            cache = price_cache
+        if cache is not None:
+            cached_price = cache.get(ticker_clean, target_date)
+            if cached_price is not None:
+                return cached_price
+
+        if breaker is not None and not breaker.allow(ticker_clean):
+            return None
+
         # Hole Daten für einen Tag vor und nach dem gewünschten Datum
         start_date = date - timedelta(days=5)
         end_date = date + timedelta(days=2)
         
-        data = yf.download(ticker_clean, start=start_date, end=end_date, progress=False, auto_adjust=False)
+        if downloader is None:
+            downloader = yf.download
+        try:
+            data = call_with_timeout(downloader, timeout, ticker_clean, start=start_date, end=end_date,
+                                     progress=False, auto_adjust=False)
+        except Exception as e:
+            if breaker is not None:
+                breaker.record_failure(ticker_clean, e)
+            raise
         
         if data is None or data.empty or 'Close' not in data.columns:
+            if breaker is not None:
+                breaker.record_failure(ticker_clean, "Keine historischen Daten")
             return None
-            
-        # Versuche das exakte Datum zu finden
-        target_date = pd.Timestamp(date).normalize()
-        if target_date in data.index:
-            close_value = data.loc[target_date, 'Close']
-            if isinstance(close_value, pd.Series):
-                price_val = close_value.iloc[0]
-            else:
-                price_val = close_value
-            
-            # Konvertiere zu float, handle NaN und andere edge cases
-            if pd.isna(price_val):
-                return None
-            try:
-                return float(str(price_val))
-            except (ValueError, TypeError):
-                return None
-        
-        # Falls das exakte Datum nicht verfügbar ist, nimm den letzten verfügbaren Preis vor dem Datum
+
+        if breaker is not None:
+            breaker.record_success(ticker_clean)
+
+        close_data = data['Close']
+        if isinstance(close_data, pd.DataFrame):
+            close_data = close_data.iloc[:, 0]
+
+        price = None
+        # Versuche das exakte Datum zu finden, sonst den letzten verfügbaren Preis vor dem Datum
         available_dates = data.index[data.index <= target_date]
         if not available_dates.empty:
-            last_available = available_dates.max()
-            close_value = data.loc[last_available, 'Close']
-            if isinstance(close_value, pd.Series):
-                price_val = close_value.iloc[0]
-            else:
-                price_val = close_value
-            
-            # Konvertiere zu float, handle NaN und andere edge cases
-            if pd.isna(price_val):
-                return None
-            try:
-                return float(str(price_val))
-            except (ValueError, TypeError):
-                return None
-            
-        return None
+            price = _close_value_to_float(close_data.loc[available_dates.max()])
+
+        if cache is not None:
+            # Alle geladenen Tage sind selbst gültige Schlusskurse für ihr Datum (put_many ignoriert offene Tage)
+            rows = [(ticker_clean, day, value) for day, value in close_data.items()]
+            # Der Ersatzkurs (letzter Schluss vor dem Zieldatum) wird nur dauerhaft gespeichert, wenn ein
+            # späterer Kurs belegt, dass für das Zieldatum kein eigener Schlusskurs mehr kommt
+            if price is not None and target_date not in close_data.index and data.index.max() > target_date:
+                rows.append((ticker_clean, target_date, price))
+            cache.put_many(rows)
+
+        return price
         
     except Exception as e:
         if logfile:
@@ -189,32 +576,149 @@ def get_historical_price(ticker, date, logfile=None, screen=True):
         return None
 
 
-def get_current_prices(instruments_df):
-    """Holt aktuelle Preise für alle Instrumente"""
+def _extract_close_series(data, ticker):
+    """Liefert die Close-Spalte eines Tickers aus einem (ggf. gruppierten) yfinance-Download"""
+    if data is None or data.empty:
+        return None
+
+    if isinstance(data.columns, pd.MultiIndex):
+        # group_by='ticker' liefert (Ticker, Feld), ohne group_by (Feld, Ticker)
+        if (ticker, "Close") in data.columns:
+            close_data = data[(ticker, "Close")]
+        elif ("Close", ticker) in data.columns:
+            close_data = data[("Close", ticker)]
+        else:
+            return None
+    elif "Close" in data.columns:
+        close_data = data["Close"]
+    else:
+        return None
+
+    if isinstance(close_data, pd.DataFrame):
+        close_data = close_data.iloc[:, 0]
+    return close_data
+
+
+def fetch_quotes_batch(tickers, downloader=None, chunk_size=50, timeout=None):
+    """
+    Holt die letzten Kurse für mehrere Ticker gebündelt (ein Request pro Chunk, mit optionalem hartem Timeout).
+    Gibt (prices, failures) zurück: prices = {ticker: preis}, failures = {ticker: grund}.
+    Fehler einzelner Ticker oder Chunks brechen den Batch nicht ab.
+    """
+    if downloader is None:
+        downloader = yf.download
+
+    unique_tickers = list(dict.fromkeys(tickers))
     prices = {}
-    for wkn, row in instruments_df.iterrows():
-        raw_ticker = row["ticker"]
+    failures = {}
 
-        if pd.isna(raw_ticker):
+    for start in range(0, len(unique_tickers), chunk_size):
+        chunk = unique_tickers[start:start + chunk_size]
+        try:
+            data = call_with_timeout(downloader, timeout, chunk, period="1d", interval="1m", group_by="ticker",
+                                     progress=False, auto_adjust=False)
+        except Exception as e:
+            for ticker in chunk:
+                failures[ticker] = f"Download fehlgeschlagen: {e}"
             continue
 
+        for ticker in chunk:
+            try:
+                close_data = _extract_close_series(data, ticker)
+                if close_data is None:
+                    failures[ticker] = "Keine Daten"
+                    continue
+                close_data = close_data.dropna()
+                if close_data.empty:
+                    failures[ticker] = "Keine gültigen Kurse"
+                    continue
+                prices[ticker] = float(close_data.iloc[-1])
+            except Exception as e:
+                failures[ticker] = str(e)
+
+    return prices, failures
+
+
+def ticker_history_downloader(tickers, **kwargs):
+    """
+    Ersatz für yf.download auf Basis von yf.Ticker.history.
+    yf.download nutzt modulweite Zwischenspeicher und ist daher nicht für parallele Aufrufe geeignet.
+    """
+    history_args = {key: kwargs[key] for key in ("period", "interval", "start", "end", "auto_adjust") if key in kwargs}
+
+    def history(ticker):
+        data = yf.Ticker(ticker).history(**history_args)
+        # Zeitzonenfreier Index wie bei yf.download, damit Datumsvergleiche funktionieren
+        if data is not None and getattr(data.index, 'tz', None) is not None:
+            data.index = data.index.tz_localize(None)
+        return data
+
+    if isinstance(tickers, str):
+        return history(tickers)
+    return pd.concat({ticker: history(ticker) for ticker in tickers}, axis=1)
+
+
+def _tickers_by_wkn(instruments_df):
+    """Liefert das Mapping WKN -> bereinigter Ticker (ohne leere Ticker)"""
+    ticker_by_wkn = {}
+    for wkn, raw_ticker in instruments_df["ticker"].items():
+        if pd.isna(raw_ticker):
+            continue
         ticker = str(raw_ticker).strip().upper()
         if ticker == "":
             continue
+        ticker_by_wkn[wkn] = ticker
+    return ticker_by_wkn
 
-        try:
-            data = yf.download(ticker, period="1d", interval="1m", progress=False, auto_adjust=False)
-            if data is not None and not data.empty and "Close" in data.columns:
-                close_data = data["Close"]
-                if not close_data.empty:
-                    last_valid_price = float(close_data.dropna().iloc[-1].item())
-                    prices[wkn] = last_valid_price
-        except Exception as e:
-            print(f"Fehler beim Abrufen von {ticker} für WKN {wkn}: {e}")
+
+def _record_quote_results(breaker, tickers, quotes, failures, logfile=None, screen=True):
+    """Überträgt die Ergebnisse einer Kursabfrage in den Circuit Breaker"""
+    for ticker in tickers:
+        if ticker in quotes:
+            breaker.record_success(ticker, quotes[ticker])
+        else:
+            cooldown = breaker.record_failure(ticker, failures.get(ticker, "Keine Daten"))
+            if cooldown is not None:
+                screen_and_log(f"WARNING: Circuit Breaker für {ticker} geöffnet, nächster Versuch in {int(cooldown)} Sekunden",
+                               logfile, screen=screen)
+
+
+def _prices_by_wkn(ticker_by_wkn, quotes, failures, logfile=None, screen=True, breaker=None):
+    """
+    Ordnet Kurse je Ticker den WKNs zu und protokolliert fehlgeschlagene Ticker.
+    Mit Circuit Breaker wird für fehlgeschlagene oder gesperrte Ticker der letzte bekannte Kurs verwendet.
+    """
+    prices = {}
+    for wkn, ticker in ticker_by_wkn.items():
+        if ticker in quotes:
+            prices[wkn] = quotes[ticker]
+            continue
+        if ticker in failures:
+            screen_and_log(f"WARNING: Fehler beim Abrufen von {ticker} für WKN {wkn}: {failures[ticker]}",
+                           logfile, screen=screen)
+        if breaker is not None and breaker.last_price(ticker) is not None:
+            prices[wkn] = breaker.last_price(ticker)
     return prices
 
 
-def get_reference_values_from_yfinance(instruments_df, shares_yesterday, reference_date, logfile):
+def get_current_prices(instruments_df, downloader=None, chunk_size=50, logfile=None, screen=True, timeout=None,
+                       breaker=None):
+    """
+    Holt aktuelle Preise für alle Instrumente gebündelt und liefert ein Mapping WKN -> Preis.
+    Ticker mit offenem Circuit Breaker werden nicht abgefragt, sondern mit dem letzten bekannten Kurs bedient.
+    """
+    ticker_by_wkn = _tickers_by_wkn(instruments_df)
+    tickers = list(dict.fromkeys(ticker_by_wkn.values()))
+    if breaker is not None:
+        tickers = [ticker for ticker in tickers if breaker.allow(ticker)]
+
+    quotes, failures = fetch_quotes_batch(tickers, downloader=downloader, chunk_size=chunk_size, timeout=timeout)
+    if breaker is not None:
+        _record_quote_results(breaker, tickers, quotes, failures, logfile, screen=screen)
+    return _prices_by_wkn(ticker_by_wkn, quotes, failures, logfile, screen=screen, breaker=breaker)
+
+
+def get_reference_values_from_yfinance(instruments_df, shares_yesterday, reference_date, logfile, timeout=None, breaker=None):
     """Berechnet Referenzwerte direkt von yfinance für ein bestimmtes Datum"""
     reference_values = {}
     
@@ -224,7 +728,7 @@ def get_reference_values_from_yfinance(instruments_df, shares_yesterday, referen
             share_count = shares_yesterday.loc[wkn, 'share']
             
             if pd.notna(share_count) and share_count > 0:
-                historical_price = get_historical_price(ticker, reference_date, logfile)
+                historical_price = get_historical_price(ticker, reference_date, logfile, timeout=timeout, breaker=breaker)
                 if historical_price is not None:
                     reference_values[wkn] = {
                         'price': historical_price,
@@ -236,37 +740,49 @@ def get_reference_values_from_yfinance(instruments_df, shares_yesterday, referen
 
 
 # Main Block 01: Initializing
-def initializing(settings_file, screen):
-    """Initialisiert das Programm"""
-    global logger
+def initializing(settings_file, screen, chdir=True):
+    """
+    Initialisiert das Programm. Alle Pfade aus [Files] werden absolut aufgelöst (relativ zu [Paths] path).
+    Mit chdir=False (gemeinsamer Prozess, siehe run_all.py) bleibt das Arbeitsverzeichnis unverändert.
+    """
+    global logger, base_dir
     error_count = 0
     warning_count = 0
     settings = None
     screen = True
+    script_dir = os.path.dirname(os.path.abspath(__file__))
 
     # Set initial working directory manually (before logger exists)
-    try:
-        caller_frame = os.path.dirname(os.path.abspath(__file__))
-        os.chdir(caller_frame)
-        print("Info: Arbeitsverzeichnis initial auf Ausführungsordner gesetzt.")
-    except Exception as e:
-        print(f"ERROR: Fehler beim Setzen des Arbeitsverzeichnisses: {e}")
-        error_count += 1
-        return None
+    if chdir:
+        try:
+            os.chdir(script_dir)
+            print("Info: Arbeitsverzeichnis initial auf Ausführungsordner gesetzt.")
+        except Exception as e:
+            print(f"ERROR: Fehler beim Setzen des Arbeitsverzeichnisses: {e}")
+            error_count += 1
+            return None
 
     # Create a temporary logger for initialization
-    temp_logfile = 'temp_init.log'
+    temp_logfile = os.path.join(script_dir, 'temp_init.log')
     temp_logger = create_extended_logger(temp_logfile, screen_output=screen)
 
-    settings = settings_import(settings_file, logger=temp_logger)
+    settings = settings_import(os.path.join(script_dir, settings_file), logger=temp_logger)
     if settings is None:
         print("ERROR: Einstellungen konnten nicht geladen werden.")
         error_count += 1
         return None
 
-    logfile = settings['Files']['logfile']
+    # Basisverzeichnis wie set_working_directory: "default" = Skriptordner
+    path_setting = str(settings.get('Paths', {}).get('path') or "").strip()
+    base_dir = script_dir if path_setting.lower() in ("", "default") else path_setting
+    files = settings.setdefault('Files', {})
+    for key in PATH_SETTINGS:
+        if files.get(key):
+            files[key] = resolve_path(files[key])
+
+    logfile = files.get('logfile')
     if logfile is None:
-        logfile = 'logfile.txt'
+        logfile = resolve_path('logfile.txt')
         print("ERROR: Kein Logfile angegeben. Fallback auf 'logfile.txt'.")
 
     # Initialize the global logger with the correct logfile
@@ -275,8 +791,11 @@ def initializing(settings_file, screen):
 
     # Set working directory from settings (now with logger)
     try:
-        set_working_directory(settings['Paths']['path'], logger=logger)
-        screen_and_log("Info: Arbeitsverzeichnis erfolgreich gesetzt.", logfile=None, screen=screen)
+        if chdir:
+            set_working_directory(settings['Paths']['path'], logger=logger)
+            screen_and_log("Info: Arbeitsverzeichnis erfolgreich gesetzt.", logfile=None, screen=screen)
+        else:
+            screen_and_log(f"Info: Arbeitsverzeichnis unverändert, Basisverzeichnis: {base_dir}", logfile=None, screen=screen)
     except Exception as e:
         screen_and_log(f"ERROR: Fehler beim Setzen des Arbeitsverzeichnisses: {e}", logfile=None, screen=screen)
         error_count += 1
@@ -307,7 +826,8 @@ def instruments_import_and_process(settings, logfile, screen=True):
     """Importiert die Instruments-Datei"""
     try:
         instruments_file = settings['Files']['instruments']
-        instruments_df = instruments_import(instruments_file, logfile, screen=screen)
+        cache_dir = settings['Files'].get('cache_dir')
+        instruments_df = instruments_import(instruments_file, logfile, screen=screen, cache_dir=cache_dir)
 
         if instruments_df is None:
             screen_and_log(f"ERROR: Fehler beim Laden der Instruments-Datei '{instruments_file}'.", logfile, screen=screen)
@@ -329,7 +849,8 @@ def bookings_import_and_process(settings, instruments_df, logfile, screen=True):
 
     try:
         bookings_file = settings['Files']['bookings']
-        bookings_df = bookings_import(bookings_file, logfile, screen=screen)
+        cache_dir = settings['Files'].get('cache_dir')
+        bookings_df = bookings_import(bookings_file, logfile, screen=screen, cache_dir=cache_dir)
 
         if bookings_df is None:
             screen_and_log(f"ERROR: Fehler beim Import der Buchungsdatei '{bookings_file}'.", logfile, screen=screen)
@@ -355,171 +876,690 @@ def bookings_import_and_process(settings, instruments_df, logfile, screen=True):
     return bookings_df
 
 
+def _parse_day_list(value):
+    """Zerlegt eine kommagetrennte Liste von Tagen (MM-DD wiederkehrend oder YYYY-MM-DD)"""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = str(value).replace(';', ',').split(',')
+    return [str(item).strip() for item in items if str(item).strip()]
+
+
+class TradingCalendar:
+    """
+    Handelskalender auf Basis eines sortierten Arrays aller Handelstage (datetime64[D]).
+    Wird einmal für einen Jahresbereich aufgebaut; Abfragen erfolgen per Binärsuche.
+    Neben den deutschen Feiertagen können börsenspezifische Schließtage (z.B. Xetra: 24.12., 31.12.)
+    und Handelstage an Feiertagen (z.B. 3.10.) konfiguriert werden.
+    """
+
+    def __init__(self, start_year, end_year, public_holidays=True, closing_days=None, open_days=None):
+        self.public_holidays = public_holidays
+        self.closing_days = _parse_day_list(closing_days)
+        self.open_days = _parse_day_list(open_days)
+        self._build(start_year, end_year)
+
+    def _expand_days(self, day_list, years):
+        """Wandelt MM-DD (jedes Jahr) und YYYY-MM-DD in konkrete Daten um"""
+        days = set()
+        for item in day_list:
+            if len(item) == 5:
+                for year in years:
+                    try:
+                        days.add(datetime.strptime(f"{year}-{item}", '%Y-%m-%d').date())
+                    except ValueError:
+                        pass
+            else:
+                days.add(datetime.strptime(item, '%Y-%m-%d').date())
+        return days
+
+    def _build(self, start_year, end_year):
+        years = range(start_year, end_year + 1)
+        closed = set(Germany(years=years).keys()) if self.public_holidays else set()
+        closed |= self._expand_days(self.closing_days, years)
+        closed -= self._expand_days(self.open_days, years)
+
+        all_days = np.arange(np.datetime64(f"{start_year}-01-01"), np.datetime64(f"{end_year + 1}-01-01"),
+                             dtype='datetime64[D]')
+        holidays_array = np.array(sorted(closed), dtype='datetime64[D]')
+        self.days = all_days[np.is_busday(all_days, holidays=holidays_array)]
+        self.start_year = start_year
+        self.end_year = end_year
+
+    def _ensure_range(self, *dates):
+        """Erweitert den Kalender, falls ein Datum außerhalb des aufgebauten Jahresbereichs liegt"""
+        years = [pd.Timestamp(date).year for date in dates]
+        if min(years) <= self.start_year or max(years) >= self.end_year:
+            self._build(min(min(years) - 1, self.start_year), max(max(years) + 1, self.end_year))
+
+    def previous_trading_day(self, date):
+        """Letzter Handelstag strikt vor dem Datum"""
+        self._ensure_range(date)
+        position = np.searchsorted(self.days, np.datetime64(pd.Timestamp(date).date(), 'D'), side='left') - 1
+        return pd.Timestamp(self.days[position]) if position >= 0 else None
+
+    def last_trading_day_of_month(self, year, month):
+        """Letzter Handelstag eines Monats (None, wenn der Monat keinen Handelstag hat)"""
+        first_day = pd.Timestamp(year=year, month=month, day=1)
+        last_day = first_day + pd.offsets.MonthEnd(0)
+        self._ensure_range(first_day)
+        position = np.searchsorted(self.days, np.datetime64(last_day.date(), 'D'), side='right') - 1
+        if position < 0 or self.days[position] < np.datetime64(first_day.date(), 'D'):
+            return None
+        return pd.Timestamp(self.days[position])
+
+    def trading_days_between(self, start, end):
+        """Alle Handelstage im Intervall [start, end] als DatetimeIndex"""
+        self._ensure_range(start, end)
+        left = np.searchsorted(self.days, np.datetime64(pd.Timestamp(start).date(), 'D'), side='left')
+        right = np.searchsorted(self.days, np.datetime64(pd.Timestamp(end).date(), 'D'), side='right')
+        return pd.DatetimeIndex(self.days[left:right])
+
+
+def build_trading_calendar(settings):
+    """Baut den Handelskalender einmalig aus dem Abschnitt [Calendar] der Einstellungen"""
+    calendar_settings = settings.get("Calendar", {}) if settings else {}
+    public_holidays = str(calendar_settings.get("public_holidays", True)).strip().lower() in ("1", "true", "yes", "on")
+    current_year = datetime.today().year
+    return TradingCalendar(current_year - 10, current_year + 2,
+                           public_holidays=public_holidays,
+                           closing_days=calendar_settings.get("closing_days"),
+                           open_days=calendar_settings.get("open_days"))
+
+
+def get_trading_calendar():
+    """Liefert den globalen Handelskalender (bei Bedarf mit Standardeinstellungen aufgebaut)"""
+    global trading_calendar
+    if trading_calendar is None:
+        trading_calendar = build_trading_calendar(None)
+    return trading_calendar
+
+
 def get_last_trading_day():
     """Bestimmt den letzten Handelstag (gestern oder der letzte Werktag)"""
     today = datetime.today().date()
-    yesterday = today - timedelta(days=1)
-    
-    # Deutsche Feiertage
-    de_holidays = Germany()
-    
-    # Gehe bis zu 5 Tage zurück, um den letzten Handelstag zu finden
-    for i in range(1, 6):
-        check_date = today - timedelta(days=i)
-        # Montag bis Freitag und kein Feiertag
-        if check_date.weekday() < 5 and check_date.strftime('%Y-%m-%d') not in de_holidays:
-            return pd.Timestamp(check_date)
-    
+    last_trading_day = get_trading_calendar().previous_trading_day(today)
+
     # Fallback auf gestern
-    return pd.Timestamp(yesterday)
+    if last_trading_day is None:
+        return pd.Timestamp(today - timedelta(days=1))
+    return last_trading_day
 
 
 def get_last_trading_day_of_previous_month():
     """Bestimmt den letzten Handelstag des Vormonats"""
     today = datetime.today().date()
-    first_day_current_month = today.replace(day=1)
-    last_day_previous_month = first_day_current_month - timedelta(days=1)
-    
-    de_holidays = Germany()
-    
-    # Gehe bis zu 10 Tage vom letzten Tag des Vormonats zurück
-    for i in range(10):
-        check_date = last_day_previous_month - timedelta(days=i)
-        if check_date.weekday() < 5 and check_date.strftime('%Y-%m-%d') not in de_holidays:
-            return pd.Timestamp(check_date)
-    
-    return None
+    last_day_previous_month = today.replace(day=1) - timedelta(days=1)
+    return get_trading_calendar().last_trading_day_of_month(last_day_previous_month.year, last_day_previous_month.month)
 
 
-def run_monitor(instruments_df, shares_day_df, shares_yesterday, reference_date, logfile, settings, reference_date_month=None):
-    """Hauptschleife für das Monitoring"""
-    current_last_trading_day = reference_date
-    current_last_trading_day_month = reference_date_month
-    current_shares_yesterday = shares_yesterday
-    
-    while True:
-        # Prüfe, ob sich der letzte Handelstag geändert hat
-        new_last_trading_day = get_last_trading_day()
-        new_last_trading_day_month = get_last_trading_day_of_previous_month()
-        
-        if new_last_trading_day != current_last_trading_day:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Neuer Handelstag erkannt: {new_last_trading_day.strftime('%d.%m.%Y')}")
+def missing_reference_wkns(snapshot):
+    """Liefert die noch fehlenden Referenzwerte des Snapshots als Liste von (art, wkn, datum)"""
+    shares_yesterday = snapshot['shares']
+    held_wkns = [wkn for wkn in shares_yesterday.index
+                 if pd.notna(shares_yesterday.loc[wkn, 'share']) and shares_yesterday.loc[wkn, 'share'] > 0]
 
-            # Prüfe, ob Shares-Daten für den neuen Handelstag verfügbar sind
-            new_shares_yesterday = shares_day_df.loc[new_last_trading_day] if new_last_trading_day in shares_day_df.index else None
+    missing = [('daily', wkn, snapshot['reference_date']) for wkn in held_wkns if wkn not in snapshot['daily']]
+    if snapshot['reference_date_month'] is not None:
+        missing += [('monthly', wkn, snapshot['reference_date_month'])
+                    for wkn in held_wkns if wkn not in snapshot['monthly']]
+    return missing
 
-            if new_shares_yesterday is None:
-                screen_and_log(f"WARNING: Keine Shares-Daten für neuen Handelstag {new_last_trading_day.strftime('%d.%m.%Y')} verfügbar", logfile)
-                print(f"Warnung: Keine Daten für {new_last_trading_day.strftime('%d.%m.%Y')} verfügbar. Behalte altes Referenzdatum {current_last_trading_day.strftime('%d.%m.%Y')} bei.")
-                # WICHTIG: Behalte die alten Werte bei - NICHT aktualisieren!
-            else:
-                # Nur aktualisieren, wenn Daten verfügbar sind
-                current_last_trading_day = new_last_trading_day
-                current_shares_yesterday = new_shares_yesterday
-                screen_and_log(f"Info: Referenzdaten für neuen Handelstag {current_last_trading_day.strftime('%d.%m.%Y')} aktualisiert", logfile)
-                print(f"Info: Referenzdatum aktualisiert auf {current_last_trading_day.strftime('%d.%m.%Y')}")
-        
-        if new_last_trading_day_month != current_last_trading_day_month:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Neuer monatlicher Referenztag: {new_last_trading_day_month.strftime('%d.%m.%Y') if new_last_trading_day_month else 'None'}")
-            current_last_trading_day_month = new_last_trading_day_month
-            screen_and_log(f"Info: Monatlicher Referenztag aktualisiert auf {current_last_trading_day_month.strftime('%d.%m.%Y') if current_last_trading_day_month else 'None'}", logfile)
-        
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Starte Kursabfrage...")
-        current_prices = get_current_prices(instruments_df)
-        
-        # Hole Referenzdaten direkt von yfinance mit aktuellen Referenzdaten
-        reference_data = get_reference_values_from_yfinance(instruments_df, current_shares_yesterday, current_last_trading_day, logfile)
-        
-        output_rows = []
 
-        for wkn, price_today in current_prices.items():
-            try:
-                if wkn in reference_data:
-                    ref_data = reference_data[wkn]
-                    price_yesterday = ref_data['price']
-                    share_count = ref_data['share']
-                    
-                    if share_count > 0:
-                        diff_price = price_today - price_yesterday
-                        percent_price = (diff_price / price_yesterday) * 100
-                        diff_value = diff_price * share_count
-
-                        # Monatliche Unterschiede falls verfügbar
-                        diff_price_month = ""
-                        percent_price_month = ""
-                        diff_value_month = ""
-                        
-                        if current_last_trading_day_month is not None:
-                            monthly_ref_data = get_reference_values_from_yfinance(
-                                instruments_df, current_shares_yesterday, current_last_trading_day_month, logfile)
-                            
-                            if wkn in monthly_ref_data:
-                                price_last_month = monthly_ref_data[wkn]['price']
-                                diff_price_month = round(price_today - price_last_month, 2)
-                                percent_price_month = round(((price_today - price_last_month) / price_last_month) * 100, 2)
-                                diff_value_month = round((price_today - price_last_month) * share_count, 2)
-
-                        instrument_name = instruments_df.loc[wkn, "instrument_name"] if wkn in instruments_df.index else wkn
-                        output_rows.append({
-                            "Name": instrument_name,
-                            "Aktueller Preis": round(price_today, 2),
-                            "Kursdiff": round(diff_price, 2),
-                            "Kursdiff (%)": round(percent_price, 2),
-                            "Wertdiff (€)": round(diff_value, 2),
-                            "Kursdiff Monat": diff_price_month,
-                            "Kursdiff Monat (%)": percent_price_month,
-                            "Wertdiff Monat (€)": diff_value_month
-                        })
+def build_reference_snapshot(instruments_df, shares_yesterday, reference_date, reference_date_month, logfile, snapshot=None,
+                             fetch=True, timeout=None, breaker=None):
+    """
+    Erstellt (oder ergänzt) den Referenz-Snapshot mit Tages- und Monatsreferenzwerten.
+    Wird nur bei einem Wechsel der Referenzdaten neu aufgebaut; bei unverändertem Datum werden
+    lediglich fehlende WKNs (z.B. nach einem fehlgeschlagenen Abruf) nachgeladen.
+    Mit fetch=False wird der Snapshot nur vorbereitet, die Werte lädt der Aufrufer selbst.
+    """
+    if (snapshot is None
+            or snapshot['reference_date'] != reference_date
+            or snapshot['reference_date_month'] != reference_date_month
+            or snapshot['shares'] is not shares_yesterday):
+        snapshot = {
+            'reference_date': reference_date,
+            'reference_date_month': reference_date_month,
+            'shares': shares_yesterday,
+            'daily': {},
+            'monthly': {},
+        }
 
-            except Exception as e:
-                print(f"WKN {wkn}: Fehler – {e}")
+    if not fetch:
+        return snapshot
 
-        df_out = pd.DataFrame(output_rows)
+    missing = missing_reference_wkns(snapshot)
+    for kind, reference_day in (('daily', reference_date), ('monthly', reference_date_month)):
+        missing_wkns = [wkn for missing_kind, wkn, _ in missing if missing_kind == kind]
+        if missing_wkns:
+            snapshot[kind].update(get_reference_values_from_yfinance(
+                instruments_df, shares_yesterday.loc[missing_wkns], reference_day, logfile,
+                timeout=timeout, breaker=breaker))
 
-        # Summenzeile hinzufügen
-        if not df_out.empty:
-            gesamtwertdiff = df_out["Wertdiff (€)"].sum()
-            
-            gesamtwertdiff_month = ""
-            if "Wertdiff Monat (€)" in df_out.columns:
-                monthly_values = df_out["Wertdiff Monat (€)"]
-                numeric_monthly = [val for val in monthly_values if isinstance(val, (int, float))]
-                if numeric_monthly:
-                    gesamtwertdiff_month = round(sum(numeric_monthly), 2)
-            
-            df_out.loc[len(df_out.index)] = {
-                "Name": "SUMME",
-                "Aktueller Preis": "",
-                "Kursdiff": "",
-                "Kursdiff (%)": "",
-                "Wertdiff (€)": round(gesamtwertdiff, 2),
-                "Kursdiff Monat": "",
-                "Kursdiff Monat (%)": "",
-                "Wertdiff Monat (€)": gesamtwertdiff_month
+    return snapshot
+
+
+def compute_valuation(prices, reference_prices, shares, names=None, reference_prices_month=None, stale_wkns=()):
+    """
+    Spaltenweise Bewertung als reine Funktion: alle Eingaben sind nach WKN indizierte pandas Series.
+    Berücksichtigt werden WKNs mit aktuellem Preis und Bestand > 0, in der Reihenfolge von `prices`.
+    Liefert die Ausgabetabelle inklusive Summenzeile; fehlende Tages- und Monatswerte werden als "" ausgegeben,
+    Zeilen ohne Tagesreferenz zusätzlich mit "Referenz fehlt" markiert.
+    """
+    prices = prices.astype(float)
+    reference = reference_prices.astype(float).reindex(prices.index)
+    share = shares.astype(float).reindex(prices.index)
+
+    valid = prices.notna() & share.notna() & (share > 0)
+    index = prices.index[valid.to_numpy()]
+    price = prices.loc[index].to_numpy()
+    reference = reference.loc[index].to_numpy()
+    share = share.loc[index].to_numpy()
+    has_reference = ~np.isnan(reference) & (reference != 0)
+
+    if reference_prices_month is not None:
+        reference_month = reference_prices_month.astype(float).reindex(index).to_numpy()
+    else:
+        reference_month = np.full(len(index), np.nan)
+    has_month = ~np.isnan(reference_month) & (reference_month != 0)
+
+    diff_price = price - reference
+    diff_price_month = price - reference_month
+
+    if names is not None:
+        name_values = names.reindex(index)
+        name_values = name_values.where(name_values.notna(), pd.Series(index, index=index))
+    else:
+        name_values = pd.Series(index, index=index)
+
+    def optional_column(values, present):
+        return [float(value) if valid_value else "" for value, valid_value in zip(np.round(values, 2), present)]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = diff_price / reference * 100
+        percent_month = diff_price_month / reference_month * 100
+
+    df_out = pd.DataFrame({
+        "Name": name_values.to_numpy(dtype=object),
+        "Aktueller Preis": np.round(price, 2),
+        "Kursdiff": optional_column(diff_price, has_reference),
+        "Kursdiff (%)": optional_column(percent, has_reference),
+        "Wertdiff (€)": optional_column(diff_price * share, has_reference),
+        "Kursdiff Monat": optional_column(diff_price_month, has_month),
+        "Kursdiff Monat (%)": optional_column(percent_month, has_month),
+        "Wertdiff Monat (€)": optional_column(diff_price_month * share, has_month),
+        "Veraltet": [bool(wkn in stale_wkns) for wkn in index],
+        "Referenz fehlt": [bool(not present) for present in has_reference],
+    })
+
+    if df_out.empty:
+        return df_out
+
+    # Summenzeile
+    total = round(float(np.round(diff_price * share, 2)[has_reference].sum()), 2) if has_reference.any() else ""
+    total_month = round(float(np.round(diff_price_month * share, 2)[has_month].sum()), 2) if has_month.any() else ""
+    total_row = pd.DataFrame([{
+        "Name": "SUMME",
+        "Aktueller Preis": "",
+        "Kursdiff": "",
+        "Kursdiff (%)": "",
+        "Wertdiff (€)": total,
+        "Kursdiff Monat": "",
+        "Kursdiff Monat (%)": "",
+        "Wertdiff Monat (€)": total_month,
+        "Veraltet": "",
+        "Referenz fehlt": ""
+    }])
+    return pd.concat([df_out.astype(object), total_row], ignore_index=True)
+
+
+def build_output_table(current_prices, snapshot, instruments_df, stale_wkns=()):
+    """
+    Berechnet die Ausgabetabelle (inkl. Summenzeile) aus aktuellen Preisen und Referenz-Snapshot.
+    WKNs in stale_wkns werden mit dem letzten bekannten Kurs als veraltet markiert; WKNs ohne Tagesreferenz
+    (Abruf fehlgeschlagen oder Referenz-Breaker offen) bleiben mit "Referenz fehlt" in der Tabelle.
+    """
+    daily = snapshot['daily']
+    monthly = snapshot['monthly']
+    return compute_valuation(
+        prices=pd.Series(current_prices, dtype=float),
+        reference_prices=pd.Series({wkn: ref['price'] for wkn, ref in daily.items()}, dtype=float),
+        shares=snapshot['shares']['share'].astype(float),
+        names=instruments_df["instrument_name"],
+        reference_prices_month=pd.Series({wkn: ref['price'] for wkn, ref in monthly.items()}, dtype=float),
+        stale_wkns=stale_wkns,
+    )
+
+
+def update_reference_dates(state, logfile):
+    """Prüft, ob sich der letzte Handelstag oder der monatliche Referenztag geändert hat, und aktualisiert den Zustand"""
+    new_last_trading_day = get_last_trading_day()
+    new_last_trading_day_month = get_last_trading_day_of_previous_month()
+
+    if new_last_trading_day != state['reference_date']:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Neuer Handelstag erkannt: {new_last_trading_day.strftime('%d.%m.%Y')}")
+
+        # Prüfe, ob Shares-Daten für den neuen Handelstag verfügbar sind
+        new_shares_yesterday = state['positions'].shares_on(new_last_trading_day)
+
+        if new_shares_yesterday is None:
+            screen_and_log(f"WARNING: Keine Shares-Daten für neuen Handelstag {new_last_trading_day.strftime('%d.%m.%Y')} verfügbar", logfile)
+            print(f"Warnung: Keine Daten für {new_last_trading_day.strftime('%d.%m.%Y')} verfügbar. Behalte altes Referenzdatum {state['reference_date'].strftime('%d.%m.%Y')} bei.")
+            # WICHTIG: Behalte die alten Werte bei - NICHT aktualisieren!
+        else:
+            # Nur aktualisieren, wenn Daten verfügbar sind
+            state['reference_date'] = new_last_trading_day
+            state['shares_yesterday'] = new_shares_yesterday
+            screen_and_log(f"Info: Referenzdaten für neuen Handelstag {new_last_trading_day.strftime('%d.%m.%Y')} aktualisiert", logfile)
+            print(f"Info: Referenzdatum aktualisiert auf {new_last_trading_day.strftime('%d.%m.%Y')}")
+
+    if new_last_trading_day_month != state['reference_date_month']:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Neuer monatlicher Referenztag: {new_last_trading_day_month.strftime('%d.%m.%Y') if new_last_trading_day_month else 'None'}")
+        state['reference_date_month'] = new_last_trading_day_month
+        screen_and_log(f"Info: Monatlicher Referenztag aktualisiert auf {new_last_trading_day_month.strftime('%d.%m.%Y') if new_last_trading_day_month else 'None'}", logfile)
+
+
+def reload_sources_if_changed(state, settings, logfile, screen=True):
+    """
+    Prüft Instruments- und Buchungsdatei auf Änderungen (Größe/mtime) und lädt sie im laufenden Betrieb nach.
+    Geänderte Buchungen werden inkrementell auf die Positionsbestände angewendet, ohne die Historie neu zu
+    berechnen. Der neue Zustand wird vollständig aufgebaut und erst danach in einem Schritt übernommen;
+    bei Fehlern bleibt der bisherige Zustand aktiv.
+    """
+    sources = state.get('sources')
+    if sources is None:
+        return False
+
+    files = settings.get('Files', {})
+    cache_dir = files.get('cache_dir')
+    try:
+        instruments_fingerprint = source_fingerprint(files['instruments'])
+        bookings_fingerprint = source_fingerprint(files['bookings'])
+    except OSError as e:
+        screen_and_log(f"WARNING: Quelldateien nicht erreichbar ({e}). Behalte bisherige Daten.", logfile, screen=screen)
+        return False
+
+    instruments_changed = instruments_fingerprint != sources['instruments']
+    bookings_changed = bookings_fingerprint != sources['bookings']
+    if not instruments_changed and not bookings_changed:
+        return False
+
+    updates = {'sources': {'instruments': instruments_fingerprint, 'bookings': bookings_fingerprint}}
+
+    instruments_df = state['instruments_df']
+    if instruments_changed:
+        screen_and_log("Info: Instruments-Datei geändert, lade neu.", logfile, screen=screen)
+        instruments_df = instruments_import(files['instruments'], logfile, screen=screen, cache_dir=cache_dir)
+        if instruments_df is None:
+            screen_and_log("WARNING: Neue Instruments-Datei nicht ladbar. Behalte bisherige Daten.", logfile, screen=screen)
+            return False
+        updates['instruments_df'] = instruments_df
+        # Ticker können sich geändert haben: Referenzwerte neu bestimmen
+        updates['reference_snapshot'] = None
+
+    bookings_df = state['bookings_df']
+    positions = state['positions']
+    if bookings_changed:
+        screen_and_log("Info: Buchungsdatei geändert, lade neu.", logfile, screen=screen)
+        new_bookings_df = bookings_import(files['bookings'], logfile, screen=screen, cache_dir=cache_dir)
+        if new_bookings_df is None:
+            screen_and_log("WARNING: Neue Buchungsdatei nicht ladbar. Behalte bisherige Daten.", logfile, screen=screen)
+            return False
+
+        # Nur die Differenz zum bisherigen Stand auf die Positionen anwenden
+        delta = new_bookings_df['delta'].sub(bookings_df['delta'], fill_value=0)
+        delta = delta[delta.abs() > 0].to_frame('delta')
+        if not delta.empty:
+            positions_banks, affected_wkns = state['positions_banks'].with_bookings(delta)
+            positions = aggregate_banks(positions_banks, previous=positions, wkns=affected_wkns)
+            updates['positions_banks'] = positions_banks
+            updates['positions'] = positions
+            screen_and_log(f"Info: {len(delta)} geänderte Buchung(en) für {len(affected_wkns)} WKN(s) übernommen.", logfile, screen=screen)
+        bookings_df = new_bookings_df
+        updates['bookings_df'] = bookings_df
+
+    missing_wkns = bookings_check_for_instruments(bookings_df, instruments_df)
+    if missing_wkns:
+        screen_and_log(f"WARNING: WKNs aus Buchungen fehlen in Instruments: {missing_wkns}. Behalte bisherige Daten.", logfile, screen=screen)
+        return False
+
+    new_shares_yesterday = positions.shares_on(state['reference_date'])
+    if new_shares_yesterday is not None and not new_shares_yesterday.equals(state['shares_yesterday']):
+        updates['shares_yesterday'] = new_shares_yesterday
+
+    state.update(updates)
+    return True
+
+
+def build_json_data(state, df_out):
+    """JSON-Struktur mit Referenzdaten (und ggf. Circuit-Breaker-Zustand für Kurse und Referenzkurse) für static/depotdaten.json"""
+    json_data = {
+        "reference_date": state['reference_date'].strftime('%d.%m.%Y'),
+        "reference_date_month": state['reference_date_month'].strftime('%d.%m.%Y') if state['reference_date_month'] is not None else "",
+        "data": df_out.to_dict('records')
+    }
+    if state.get('breaker') is not None:
+        json_data["circuit_breaker"] = state['breaker'].status()
+    if state.get('history_breaker') is not None:
+        json_data["circuit_breaker_reference"] = state['history_breaker'].status()
+    return json_data
+
+
+def _stale_wkns(state):
+    """WKNs, deren Kurs aktuell aus dem letzten bekannten Wert stammt"""
+    breaker = state.get('breaker')
+    if breaker is None:
+        return set()
+    return {wkn for wkn, ticker in _tickers_by_wkn(state['instruments_df']).items() if breaker.is_stale(ticker)}
+
+
+def run_monitor_cycle(state, logfile, settings):
+    """Führt einen Abfragezyklus aus: Kurse holen, Referenz-Snapshot aktualisieren, Tabelle berechnen"""
+    quote_settings = settings.get("Quotes", {})
+    quote_chunk_size = int(quote_settings.get("chunk_size", 50))
+    timeout = float(quote_settings.get("request_timeout", 20))
+    breaker = state.get('breaker')
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Starte Kursabfrage...")
+    current_prices = get_current_prices(state['instruments_df'], chunk_size=quote_chunk_size, logfile=logfile,
+                                        timeout=timeout, breaker=breaker)
+
+    # Referenzwerte nur bei Wechsel der Referenzdaten neu laden
+    state['reference_snapshot'] = build_reference_snapshot(
+        state['instruments_df'], state['shares_yesterday'], state['reference_date'],
+        state['reference_date_month'], logfile, snapshot=state.get('reference_snapshot'),
+        timeout=timeout, breaker=state.get('history_breaker'))
+
+    df_out = build_output_table(current_prices, state['reference_snapshot'], state['instruments_df'],
+                                stale_wkns=_stale_wkns(state))
+    return build_json_data(state, df_out), df_out
+
+
+async def _run_limited(semaphore, executor, timeout, func, *args):
+    """Führt eine blockierende Abfrage im Executor aus, begrenzt durch Semaphore und Timeout"""
+    async with semaphore:
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(executor, functools.partial(func, *args)), timeout)
+
+
+def get_quote_executor(state, max_workers):
+    """
+    Eigener Thread-Pool für die yfinance-Abfragen des asynchronen Modus (einmal je Monitor).
+    Abfragen, deren Timeout abgelaufen ist, belegen höchstens max_workers Threads, bis yfinance zurückkehrt,
+    statt den Standard-Executor von asyncio zu blockieren.
+    """
+    if state.get('executor') is None:
+        state['executor'] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yfinance")
+    return state['executor']
+
+
+def get_download_executor(state):
+    """
+    Ein-Thread-Executor für yf.download (einmal je Monitor). Dessen modulweite Zwischenspeicher erlauben
+    keine parallelen Aufrufe; ein Download, dessen Timeout abgelaufen ist, belegt den Thread weiter,
+    bis er zurückkehrt, und blockiert damit den nächsten.
+    """
+    if state.get('download_executor') is None:
+        state['download_executor'] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="yf-download")
+    return state['download_executor']
+
+
+async def fetch_quote_chunks(state, chunks, semaphore, timeout, downloader=None):
+    """
+    Holt die Chunks nacheinander über fetch_quotes_batch im Download-Executor (siehe get_download_executor).
+    Der Timeout eines Chunks zählt ab seinem Start. Läuft ein abgelaufener Download (auch aus einem
+    früheren Zyklus) noch, schlagen die übrigen Chunks sofort fehl, statt hinter ihm zu warten.
+    Gibt je Chunk (prices, failures) bzw. die Exception zurück.
+    """
+    executor = get_download_executor(state)
+    lock = asyncio.Lock()
+
+    async def run_chunk(chunk):
+        async with lock, semaphore:
+            pending = state.get('download_future')
+            if pending is not None and not pending.done():
+                raise RuntimeError("Vorheriger Download läuft noch")
+            future = executor.submit(fetch_quotes_batch, chunk, downloader, len(chunk))
+            state['download_future'] = future
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    return await asyncio.gather(*(run_chunk(chunk) for chunk in chunks), return_exceptions=True)
+
+
+async def run_monitor_cycle_async(state, logfile, settings):
+    """
+    Asynchrone Variante von run_monitor_cycle: aktuelle Kurse (gebündelt in Chunks von chunk_size Tickern)
+    und fehlende Referenzpreise werden nebenläufig (begrenzt durch max_concurrency, in einem eigenen
+    Thread-Pool) mit Timeout je Anfrage abgefragt. Ein hängender Chunk verzögert damit nicht mehr den
+    gesamten Zyklus.
+    """
+    quote_settings = settings.get("Quotes", {})
+    max_concurrency = int(quote_settings.get("max_concurrency", 8))
+    semaphore = asyncio.Semaphore(max_concurrency)
+    executor = get_quote_executor(state, max_concurrency)
+    chunk_size = int(quote_settings.get("chunk_size", 50))
+    timeout = float(quote_settings.get("request_timeout", 20))
+    instruments_df = state['instruments_df']
+    breaker = state.get('breaker')
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Starte Kursabfrage (asynchron)...")
+    snapshot = build_reference_snapshot(
+        instruments_df, state['shares_yesterday'], state['reference_date'],
+        state['reference_date_month'], logfile, snapshot=state.get('reference_snapshot'), fetch=False)
+    state['reference_snapshot'] = snapshot
+
+    ticker_by_wkn = _tickers_by_wkn(instruments_df)
+    tickers = list(dict.fromkeys(ticker_by_wkn.values()))
+    if breaker is not None:
+        tickers = [ticker for ticker in tickers if breaker.allow(ticker)]
+    references = [(kind, wkn, reference_day) for kind, wkn, reference_day in missing_reference_wkns(snapshot)
+                  if wkn in ticker_by_wkn]
+
+    # Gebündelte Chunks über yf.download; sie laufen nacheinander (neben den Referenzpreisabfragen)
+    chunks = [tickers[start:start + chunk_size] for start in range(0, len(tickers), chunk_size)]
+    history_breaker = state.get('history_breaker')
+    fetch_reference = functools.partial(get_historical_price, downloader=ticker_history_downloader, breaker=history_breaker)
+    reference_tasks = [_run_limited(semaphore, executor, timeout, fetch_reference, ticker_by_wkn[wkn], reference_day, logfile)
+                       for _, wkn, reference_day in references]
+    chunk_results, reference_results = await asyncio.gather(
+        fetch_quote_chunks(state, chunks, semaphore, timeout),
+        asyncio.gather(*reference_tasks, return_exceptions=True))
+
+    quotes = {}
+    failures = {}
+    for chunk, result in zip(chunks, chunk_results):
+        if isinstance(result, asyncio.TimeoutError):
+            failures.update({ticker: f"Zeitüberschreitung nach {timeout} Sekunden" for ticker in chunk})
+        elif isinstance(result, BaseException):
+            failures.update({ticker: str(result) for ticker in chunk})
+        else:
+            quotes.update(result[0])
+            failures.update(result[1])
+    if breaker is not None:
+        _record_quote_results(breaker, tickers, quotes, failures, logfile)
+    current_prices = _prices_by_wkn(ticker_by_wkn, quotes, failures, logfile, breaker=breaker)
+
+    shares_yesterday = snapshot['shares']
+    for (kind, wkn, reference_day), result in zip(references, reference_results):
+        if isinstance(result, BaseException) or result is None:
+            if isinstance(result, asyncio.TimeoutError):
+                screen_and_log(f"WARNING: Zeitüberschreitung beim Referenzpreis für WKN {wkn} ({reference_day.strftime('%d.%m.%Y')})", logfile)
+                if history_breaker is not None:
+                    history_breaker.record_failure(ticker_by_wkn[wkn], result)
+            continue
+        share_count = shares_yesterday.loc[wkn, 'share']
+        snapshot[kind][wkn] = {'price': result, 'value': result * share_count, 'share': share_count}
+
+    df_out = build_output_table(current_prices, snapshot, instruments_df, stale_wkns=_stale_wkns(state))
+    return build_json_data(state, df_out), df_out
+
+
+def content_version(data):
+    """Inhalts-Hash (Version/ETag) der kompakt serialisierten Daten ohne das Feld 'version'"""
+    payload = {key: value for key, value in data.items() if key != "version"}
+    serialized = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()[:16]
+
+
+def _read_json_version(path):
+    """Liest das Feld 'version' einer bestehenden JSON-Datei (None, wenn nicht vorhanden)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("version")
+    except Exception:
+        return None
+
+
+def write_json_atomic(path, data, previous_version=None):
+    """
+    Schreibt data kompakt mit Versionsfeld (Inhalts-Hash) über eine temporäre Datei und atomares Umbenennen.
+    Ist der Inhalt unverändert (gleiche Version wie previous_version bzw. wie die bestehende Datei),
+    wird nicht geschrieben. Gibt (version, geschrieben) zurück.
+    """
+    version = content_version(data)
+    if previous_version is None:
+        previous_version = _read_json_version(path)
+    if version == previous_version and os.path.exists(path):
+        return version, False
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    document = dict(data, version=version)
+
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, suffix='.tmp', delete=False) as tmp:
+        json.dump(document, tmp, ensure_ascii=False, separators=(',', ':'))
+        tmp.flush()
+        os.fsync(tmp.fileno())
+        tmp_name = tmp.name
+    # NamedTemporaryFile legt die Datei nur für den Besitzer lesbar an
+    os.chmod(tmp_name, 0o644)
+
+    # Unter Windows kann ein gerade lesender Prozess das Ersetzen kurz verhindern
+    for attempt in range(5):
+        try:
+            os.replace(tmp_name, path)
+            break
+        except PermissionError:
+            if attempt == 4:
+                os.remove(tmp_name)
+                raise
+            time.sleep(0.1)
+    return version, True
+
+
+def store_depot_snapshot(state, json_data, version):
+    """Hängt einen geänderten Depot-Snapshot an den State-Store an; ältere Snapshots werden einmal täglich gelöscht"""
+    try:
+        state_store.append("depot", json_data, version=version)
+        state['stored_version'] = version
+        history_days = state.get('history_days')
+        today = datetime.today().date()
+        if history_days and state.get('pruned_on') != today:
+            state_store.prune("depot", datetime.combine(today, datetime.min.time()) - timedelta(days=history_days))
+            state['pruned_on'] = today
+    except Exception as e:
+        screen_and_log(f"ERROR: Depot-Snapshot konnte nicht im State-Store gespeichert werden: {e}", None)
+
+
+def write_monitor_output(state, json_data, df_out):
+    """
+    Schreibt static/depotdaten.json (nur bei Änderungen, atomar) und gibt die Tabelle auf dem Bildschirm aus.
+    Ist ein publish-Callback gesetzt (gemeinsamer Prozess mit der Web-App), wird der Snapshot zusätzlich
+    direkt im Speicher übergeben.
+    """
+    version = content_version(json_data)
+    try:
+        version, written = write_json_atomic(resolve_path(os.path.join("static", "depotdaten.json")), json_data,
+                                             state.get('output_version'))
+        state['output_version'] = version
+        if not written:
+            print("Depotdaten unverändert, keine neue JSON-Datei geschrieben.")
+    except Exception as e:
+        screen_and_log(f"ERROR: static/depotdaten.json konnte nicht geschrieben werden: {e}", None)
+
+    if state_store is not None and version != state.get('stored_version'):
+        store_depot_snapshot(state, json_data, version)
+
+    if state.get('publish') is not None:
+        state['publish']("depot", dict(json_data, version=version))
+
+    print(f"Kursdifferenz bezogen auf Schlusskurs vom: {state['reference_date'].strftime('%d.%m.%Y')}")
+    if state['reference_date_month'] is not None:
+        print(f"Monatliche Kursdifferenz bezogen auf Schlusskurs vom: {state['reference_date_month'].strftime('%d.%m.%Y')}")
+    print(df_out.to_string(index=False))
+
+
+async def run_monitor_async(state, logfile, settings):
+    """Asynchrone Hauptschleife für das Monitoring (Modus 'async')"""
+    while True:
+        reload_sources_if_changed(state, settings, logfile)
+        update_reference_dates(state, logfile)
+
+        json_data, df_out = await run_monitor_cycle_async(state, logfile, settings)
+        write_monitor_output(state, json_data, df_out)
+
+        refresh_time = settings.get("Timing", {}).get("refresh_time", 600)
+        print(f"-> Daten aktualisiert. Nächste Abfrage in {refresh_time} Sekunden.")
+        await asyncio.sleep(refresh_time)
+
+
+def run_monitor(instruments_df, positions, shares_yesterday, reference_date, logfile, settings, reference_date_month=None,
+                bookings_df=None, positions_banks=None, publish=None):
+    """
+    Hauptschleife für das Monitoring.
+    Mit `bookings_df` und `positions_banks` werden Instruments- und Buchungsdatei überwacht und bei
+    Änderungen zwischen zwei Zyklen nachgeladen. Mit [Timing] mode = async läuft die Schleife
+    als asyncio-Schleife mit nebenläufigen Kursabfragen. `publish(name, data)` erhält jeden
+    neuen Snapshot direkt (siehe run_all.py).
+    """
+    state = {
+        'instruments_df': instruments_df,
+        'positions': positions,
+        'positions_banks': positions_banks,
+        'bookings_df': bookings_df,
+        'shares_yesterday': shares_yesterday,
+        'reference_date': reference_date,
+        'reference_date_month': reference_date_month,
+        'reference_snapshot': None,
+        'sources': None,
+        'breaker': build_circuit_breaker(settings),
+        # Eigener Breaker für Referenzkurse: Fehler beim Historienabruf dürfen frische Kurse nicht als veraltet markieren
+        'history_breaker': build_circuit_breaker(settings),
+        'publish': publish,
+        'history_days': int(settings.get("History", {}).get("depot_days", 30)),
+    }
+
+    if bookings_df is not None and positions_banks is not None:
+        try:
+            state['sources'] = {
+                'instruments': source_fingerprint(settings['Files']['instruments']),
+                'bookings': source_fingerprint(settings['Files']['bookings']),
             }
+        except OSError as e:
+            screen_and_log(f"WARNING: Quelldateien können nicht überwacht werden ({e}). Kein Nachladen im Betrieb.", logfile)
 
-        # JSON-Struktur mit Referenzdaten erstellen
-        json_data = {
-            "reference_date": current_last_trading_day.strftime('%d.%m.%Y'),
-            "reference_date_month": current_last_trading_day_month.strftime('%d.%m.%Y') if current_last_trading_day_month is not None else "",
-            "data": df_out.to_dict('records')
-        }
-        
-        with open("static/depotdaten.json", 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=2)
-        
-        print(f"Kursdifferenz bezogen auf Schlusskurs vom: {current_last_trading_day.strftime('%d.%m.%Y')}")
-        if current_last_trading_day_month is not None:
-            print(f"Monatliche Kursdifferenz bezogen auf Schlusskurs vom: {current_last_trading_day_month.strftime('%d.%m.%Y')}")
-        print(df_out.to_string(index=False))
+    if str(settings.get("Timing", {}).get("mode", "sync")).strip().lower() == "async":
+        asyncio.run(run_monitor_async(state, logfile, settings))
+        return
+
+    while True:
+        reload_sources_if_changed(state, settings, logfile)
+        update_reference_dates(state, logfile)
+
+        json_data, df_out = run_monitor_cycle(state, logfile, settings)
+        write_monitor_output(state, json_data, df_out)
 
         refresh_time = settings.get("Timing", {}).get("refresh_time", 600)
         print(f"-> Daten aktualisiert. Nächste Abfrage in {refresh_time} Sekunden.")
         time.sleep(refresh_time)
 
 
-def main():
-    settings = initializing("status.ini", screen=False)
+def main(publish=None, chdir=True):
+    global price_cache, trading_calendar, state_store
+    settings = initializing("status.ini", screen=False, chdir=chdir)
     if settings is None:
         print("Error: Could not initialize settings")
         return
@@ -527,6 +1567,27 @@ def main():
     logfile = settings.get("Files", {}).get("logfile")
     screen = settings.get("Output", {}).get("screen", True)
 
+    # Handelskalender einmalig aufbauen
+    trading_calendar = build_trading_calendar(settings)
+
+    # Persistenter Schlusskurs-Cache für Referenzpreise
+    price_cache_file = settings.get("Files", {}).get("price_cache") or resolve_path("close_prices.sqlite")
+    try:
+        price_cache = ClosePriceCache(price_cache_file)
+        screen_and_log(f"Info: Schlusskurs-Cache geöffnet: {price_cache_file}", logfile, screen=screen)
+    except Exception as e:
+        price_cache = None
+        screen_and_log(f"WARNING: Schlusskurs-Cache konnte nicht geöffnet werden ({e}). Lade ohne Cache.", logfile, screen=screen)
+
+    # Gemeinsamer Snapshot-Speicher für Web-App und Viewer
+    state_store_file = settings.get("Files", {}).get("state_store") or resolve_path("state.sqlite")
+    try:
+        state_store = StateStore(state_store_file)
+        screen_and_log(f"Info: State-Store geöffnet: {state_store_file}", logfile, screen=screen)
+    except Exception as e:
+        state_store = None
+        screen_and_log(f"WARNING: State-Store konnte nicht geöffnet werden ({e}). Nur JSON-Ausgabe.", logfile, screen=screen)
+
     # Nur Instruments und Bookings laden - keine Preise mehr!
     instruments_df = instruments_import_and_process(settings, logfile, screen=screen)
     bookings_df = bookings_import_and_process(settings, instruments_df, logfile, screen=screen)
@@ -535,20 +1596,17 @@ def main():
         print("Error: Could not load required data")
         return
 
-    # Bestimme das Ende der Buchungsdaten (heute + 30 Tage für zukünftige Handelstage)
-    end_date = pd.Timestamp(datetime.today().date()) + timedelta(days=30)
-    
-    # Erstelle Shares-DataFrame
-    shares_day_banks_df = shares_from_bookings(bookings_df, end_date, logfile, screen=screen)
-    if shares_day_banks_df is None:
+    # Erstelle sparse Positionsbestände (nur Buchungstage)
+    positions_banks = shares_from_bookings(bookings_df, logfile, screen=screen)
+    if positions_banks is None:
         print("Error: Could not process bookings data")
         return
         
-    shares_day_df = aggregate_banks(shares_day_banks_df)
+    positions = aggregate_banks(positions_banks)
 
     # Bestimme Referenzdaten
     last_trading_day = get_last_trading_day()
-    shares_yesterday = shares_day_df.loc[last_trading_day] if last_trading_day in shares_day_df.index else None
+    shares_yesterday = positions.shares_on(last_trading_day)
     
     if shares_yesterday is None:
         print("Error: No shares data available for reference date")
@@ -562,8 +1620,9 @@ def main():
         print(f"Monatliches Referenzdatum: {last_trading_day_prev_month.strftime('%d.%m.%Y')}")
 
     # Starte Monitoring
-    run_monitor(instruments_df, shares_day_df, shares_yesterday, last_trading_day, logfile, settings,
-                reference_date_month=last_trading_day_prev_month)
+    run_monitor(instruments_df, positions, shares_yesterday, last_trading_day, logfile, settings,
+                reference_date_month=last_trading_day_prev_month,
+                bookings_df=bookings_df, positions_banks=positions_banks, publish=publish)
 
 
 if __name__ == "__main__":
@@ -10,16 +10,24 @@ import os
 import sys
 import re
 import json
-import subprocess
+import asyncio
 import traceback
 import configparser
+import math
 import time
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 
 # Python-Speedtest (sivel/speedtest)
 import speedtest
 import pandas as pd
 
+import buffered_log
+import latency_probe
+import speedtest_rollups
+import speedtest_storage
+from state_store import StateStore
+
 
 def screen_and_log(text, logfile=None, screen=True):
     """Log message to screen and/or file with timestamp"""
@@ -29,12 +37,8 @@ def screen_and_log(text, logfile=None, screen=True):
         print(line)
     if logfile:
         try:
-            logdir = os.path.dirname(logfile)
-            if logdir and not os.path.exists(logdir):
-                os.makedirs(logdir, exist_ok=True)
-            with open(logfile, "a", encoding="utf-8") as f:
-                f.write(line + "\n")
-                f.flush()
+            # Only queued here; buffered_log writes and flushes in its own thread
+            buffered_log.write(logfile, line)
         except Exception as e:
             print(f"Fehler beim Schreiben ins Logfile: {e}")
 
@@ -70,6 +74,12 @@ def settings_import(settings_file, logfile=None, screen=True):
         "logfile": "status_dsl.log",
         "json_output": os.path.join("static", "speedtest.json"),
         "parquet_data": "speedtest_data.parquet",
+        "parquet_dataset": "speedtest_data",
+        "compact_after": 144,  # part files per month partition before compaction (1 day at 10 min)
+        "store_days": 90,  # days 'speedtest' snapshots stay in the state store (0 = keep all)
+        "state_store": "state.sqlite",
+        "server_cache": "speedtest_servers.json",
+        "server_cache_ttl": 86400,  # 1 day
         "cli_path": "",
         "use_ookla_cli": True,
         "secure": True,
@@ -78,6 +88,7 @@ def settings_import(settings_file, logfile=None, screen=True):
         "city": "Frankfurt",
         "country": "Germany",
         "refresh_time": 300,  # 5 minutes default
+        "probe_hosts": "1.1.1.1:443, 8.8.8.8:53, www.telekom.de:443",
     }
 
     cfg = configparser.ConfigParser()
@@ -97,6 +108,23 @@ def settings_import(settings_file, logfile=None, screen=True):
     settings["logfile"] = normalize_path(files.get("logfile", defaults["logfile"]), base_dir)
     settings["json_output"] = normalize_path(files.get("json_output", defaults["json_output"]), base_dir)
     settings["parquet_data"] = normalize_path(files.get("parquet_data", defaults["parquet_data"]), base_dir)
+    settings["parquet_dataset"] = normalize_path(files.get("parquet_dataset", defaults["parquet_dataset"]), base_dir)
+    settings["state_store"] = normalize_path(files.get("state_store", defaults["state_store"]), base_dir)
+    settings["server_cache"] = normalize_path(files.get("server_cache", defaults["server_cache"]), base_dir)
+
+    # Logging section (rotation and flush interval of the buffered logfile writer)
+    settings["logging"] = buffered_log.parse_settings(dict(cfg.items("Logging")) if cfg.has_section("Logging") else {})
+
+    # Storage section
+    storage_section = dict(cfg.items("Storage")) if cfg.has_section("Storage") else {}
+    try:
+        settings["compact_after"] = int(storage_section.get("compact_after", defaults["compact_after"]))
+    except (ValueError, TypeError):
+        settings["compact_after"] = defaults["compact_after"]
+    try:
+        settings["store_days"] = int(storage_section.get("store_days", defaults["store_days"]))
+    except (ValueError, TypeError):
+        settings["store_days"] = defaults["store_days"]
 
     # Speedtest section
     speedtest_section = dict(cfg.items("Speedtest")) if cfg.has_section("Speedtest") else {}
@@ -109,6 +137,27 @@ def settings_import(settings_file, logfile=None, screen=True):
         "city": (speedtest_section.get("city", defaults["city"]) or "").strip(),
         "country": (speedtest_section.get("country", defaults["country"]) or "").strip(),
     }
+    try:
+        settings["speedtest"]["server_cache_ttl"] = int(speedtest_section.get("server_cache_ttl", defaults["server_cache_ttl"]))
+    except (ValueError, TypeError):
+        settings["speedtest"]["server_cache_ttl"] = defaults["server_cache_ttl"]
+
+    # Probe section (TCP-connect latency between full speedtests)
+    probe_section = dict(cfg.items("Probe")) if cfg.has_section("Probe") else {}
+    try:
+        settings["probe"] = {
+            "enabled": (probe_section.get("enabled", "false") or "false").strip().lower() in ("1", "true", "yes", "on"),
+            "hosts": latency_probe.parse_hosts(probe_section.get("hosts", defaults["probe_hosts"])),
+            "interval": float(probe_section.get("interval", 5)),
+            "timeout": float(probe_section.get("timeout", 2)),
+            "capacity": int(probe_section.get("capacity", 17280)),
+            "flush_interval": float(probe_section.get("flush_interval", 60)),
+            "failure_threshold": int(probe_section.get("failure_threshold", 3)),
+            "retention_days": int(probe_section.get("retention_days", 7)),
+        }
+    except (ValueError, TypeError) as e:
+        screen_and_log(f"WARN: Ungültige [Probe]-Einstellungen ({e}). Latenz-Probe deaktiviert.", logfile, screen)
+        settings["probe"] = {"enabled": False}
 
     # Timing section
     timing_section = dict(cfg.items("Timing")) if cfg.has_section("Timing") else {}
@@ -117,6 +166,22 @@ def settings_import(settings_file, logfile=None, screen=True):
     except (ValueError, TypeError):
         settings["refresh_time"] = defaults["refresh_time"]
 
+    # Adaptive scheduling: interval between refresh_time/min_interval and max_interval
+    try:
+        settings["adaptive"] = {
+            "enabled": (timing_section.get("adaptive", "false") or "false").strip().lower() in ("1", "true", "yes", "on"),
+            "min_interval": int(timing_section.get("min_interval", settings["refresh_time"])),
+            "max_interval": int(timing_section.get("max_interval", 4 * settings["refresh_time"])),
+            "backoff_factor": float(timing_section.get("backoff_factor", 1.5)),
+            "band_sigma": float(timing_section.get("band_sigma", 3)),
+            "ewma_alpha": float(timing_section.get("ewma_alpha", 0.1)),
+            "warmup": int(timing_section.get("warmup", 10)),
+            "history_days": int(timing_section.get("history_days", 7)),
+        }
+    except (ValueError, TypeError) as e:
+        screen_and_log(f"WARN: Ungültige adaptive [Timing]-Einstellungen ({e}). Festes Intervall.", logfile, screen)
+        settings["adaptive"] = {"enabled": False}
+
     # Create directories if needed
     for key in ("logfile", "json_output", "parquet_data"):
         path_value = settings.get(key)
@@ -140,69 +205,220 @@ def bytes_per_sec_to_mbps(bps_bytes):
         return None
 
 
-def perform_speedtest_cli(cli_path, logfile, screen=True, server_id=None, secure=True, timeout=180):
-    """Perform speedtest using Ookla CLI"""
-    try:
-        # Log version (best effort)
+def cli_result_to_dict(data):
+    """Convert the Ookla CLI JSON result into the speedtest result dict"""
+    server = data.get("server", {}) or {}
+    ping = (data.get("ping", {}) or {}).get("latency")
+    dl_bps = (data.get("download", {}) or {}).get("bandwidth")
+    ul_bps = (data.get("upload", {}) or {}).get("bandwidth")
+    ext_ip = (data.get("interface", {}) or {}).get("externalIp")
+
+    return {
+        "server_name": server.get("name") or server.get("host") or server.get("sponsor") or "Unknown",
+        "server_location": f"{server.get('location','Unknown')}, {server.get('country','Unknown')}",
+        "download_mbps": bytes_per_sec_to_mbps(dl_bps),
+        "upload_mbps": bytes_per_sec_to_mbps(ul_bps),
+        "ping_ms": round(float(ping), 2) if ping is not None else None,
+        "ip_address": ext_ip or "Unknown",
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+class OoklaCliRunner:
+    """
+    Asynchronous runner for the Ookla CLI.
+    The test runs via asyncio.create_subprocess_exec with --format=jsonl --progress=yes; every output
+    line is parsed as it arrives and updates `progress` (phase, ping, download/upload so far), which is
+    handed to `on_progress` at most every PROGRESS_INTERVAL seconds. Cancelling the task (e.g. Ctrl+C
+    in asyncio.run) kills the CLI. The CLI version is queried once per runner; --secure is dropped for
+    later runs only if the CLI rejects it or the plain retry succeeds where the secure run failed.
+    """
+
+    PROGRESS_INTERVAL = 1.0
+
+    # stderr/log messages of CLI versions that do not know --secure
+    SECURE_UNSUPPORTED = re.compile(r"(unknown|unrecognized|unsupported|invalid)[^\n]*secure|secure[^\n]*not supported", re.I)
+
+    def __init__(self, cli_path, logfile=None, screen=True):
+        self.cli_path = cli_path
+        self.logfile = logfile
+        self.screen = screen
+        self.version = None
+        self.version_checked = False
+        self.secure_supported = True
+        self.progress = {}
+        self.process = None
+        self.on_progress = None
+        self.last_progress = 0.0
+
+    def log(self, message):
+        screen_and_log(message, self.logfile, self.screen)
+
+    async def get_version(self):
+        """CLI version, queried with --version only on the first call"""
+        if not self.version_checked:
+            self.version_checked = True
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    self.cli_path, "--version", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+                stdout, _ = await asyncio.wait_for(process.communicate(), 10)
+                if process.returncode == 0 and stdout.strip():
+                    self.version = stdout.decode("utf-8", errors="replace").strip().splitlines()[0]
+                    self.log(f"Ookla-CLI Version: {self.version}")
+            except Exception:
+                pass
+        return self.version
+
+    def handle_line(self, line):
+        """Parse one output line; updates progress and returns the final result data (or None)"""
+        line = line.strip()
+        if not line:
+            return None
         try:
-            version_process = subprocess.run([cli_path, "--version"], capture_output=True, text=True, timeout=10)
-            if version_process.returncode == 0:
-                screen_and_log(f"Ookla-CLI Version: {version_process.stdout.strip()}", logfile, screen)
-        except Exception:
-            pass
+            data = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
 
-        base_cmd = [cli_path, "--accept-license", "--accept-gdpr", "--format=json"]
-        if server_id:
-            base_cmd += ["--server-id", str(server_id)]
+        event = data.get("type")
+        if event in ("ping", "download", "upload"):
+            if self.progress.get("phase") != event:
+                self.log(f"Ookla-CLI: {event} läuft...")
+            phase_changed = self.progress.get("phase") != event
+            self.progress["phase"] = event
+            values = data.get(event, {}) or {}
+            self.progress[f"{event}_progress"] = values.get("progress")
+            if event == "ping" and values.get("latency") is not None:
+                self.progress["ping_ms"] = round(float(values["latency"]), 2)
+            elif event != "ping" and values.get("bandwidth") is not None:
+                self.progress[f"{event}_mbps"] = bytes_per_sec_to_mbps(values["bandwidth"])
+            self.report_progress(force=phase_changed)
+        elif event == "log" and data.get("level") == "error":
+            self.progress["error"] = data.get("message")
+        elif event == "result" or (event is None and "download" in data and "upload" in data):
+            # jsonl result line, or the single JSON document of --format=json
+            self.progress["phase"] = "result"
+            return data
+        return None
 
-        # Try with --secure first, then without
-        cmd_variants = []
-        if secure:
-            cmd_variants.append(base_cmd + ["--secure"])
-        cmd_variants.append(base_cmd[:])
+    async def _run_once(self, cmd, timeout):
+        """One CLI run; returns (result data or None, return code, stderr)"""
+        self.log(f"Starte Ookla-CLI: {' '.join(cmd)}")
+        self.process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        result = {}
+        stderr_lines = []
 
-        for cmd in cmd_variants:
-            screen_and_log(f"Starte Ookla-CLI: {' '.join(cmd)}", logfile, screen)
-            completed_process = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        async def read_stdout():
+            async for raw in self.process.stdout:
+                data = self.handle_line(raw.decode("utf-8", errors="replace"))
+                if data is not None:
+                    result["data"] = data
 
-            if completed_process.returncode == 0:
-                try:
-                    data = json.loads(completed_process.stdout)
-                except Exception as e:
-                    screen_and_log(f"ERROR: Ungültiges JSON der Ookla-CLI: {e}", logfile, screen)
-                    continue
+        async def read_stderr():
+            async for raw in self.process.stderr:
+                stderr_lines.append(raw.decode("utf-8", errors="replace").rstrip())
+
+        try:
+            await asyncio.wait_for(asyncio.gather(read_stdout(), read_stderr(), self.process.wait()), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._kill()
+            await self.process.wait()
+            raise
+        finally:
+            returncode = self.process.returncode
+            self.process = None
+        return result.get("data"), returncode, "\n".join(stderr_lines).strip()
+
+    def _kill(self):
+        if self.process is not None and self.process.returncode is None:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+
+    def report_progress(self, force=False):
+        """Hands a copy of `progress` to on_progress (throttled to PROGRESS_INTERVAL unless forced)"""
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        if force or now - self.last_progress >= self.PROGRESS_INTERVAL:
+            self.last_progress = now
+            try:
+                self.on_progress(dict(self.progress))
+            except Exception as e:
+                self.log(f"WARN: Fortschritt konnte nicht übergeben werden: {e}")
+
+    def _disable_secure(self):
+        self.secure_supported = False
+        self.log("WARN: --secure wird für weitere Messungen nicht mehr verwendet.")
+
+    async def run(self, server_id=None, secure=True, timeout=180, on_progress=None):
+        """Run one test; returns the result dict or None (progress keeps the partial values)"""
+        self.progress = {"phase": "start"}
+        self.on_progress = on_progress
+        await self.get_version()
+
+        base_cmd = [self.cli_path, "--accept-license", "--accept-gdpr", "--format=jsonl", "--progress=yes"]
+        if server_id:
+            base_cmd += ["--server-id", str(server_id)]
+
+        use_secure = secure and self.secure_supported
+        secure_failed = False
+        while True:
+            cmd = base_cmd + ["--secure"] if use_secure else base_cmd[:]
+            try:
+                data, returncode, err = await self._run_once(cmd, timeout)
+            except asyncio.TimeoutError:
+                self.log(f"ERROR: Ookla-CLI Timeout nach {timeout} Sekunden (Teilergebnis: {self.progress}).")
+                return None
+            except asyncio.CancelledError:
+                self.log(f"WARN: Ookla-CLI Messung abgebrochen (Teilergebnis: {self.progress}).")
+                raise
 
-                server = data.get("server", {}) or {}
-                ping = (data.get("ping", {}) or {}).get("latency")
-                dl_bps = (data.get("download", {}) or {}).get("bandwidth")
-                ul_bps = (data.get("upload", {}) or {}).get("bandwidth")
-                ext_ip = (data.get("interface", {}) or {}).get("externalIp")
-
-                result = {
-                    "server_name": server.get("name") or server.get("host") or server.get("sponsor") or "Unknown",
-                    "server_location": f"{server.get('location','Unknown')}, {server.get('country','Unknown')}",
-                    "download_mbps": bytes_per_sec_to_mbps(dl_bps),
-                    "upload_mbps": bytes_per_sec_to_mbps(ul_bps),
-                    "ping_ms": round(float(ping), 2) if ping is not None else None,
-                    "ip_address": ext_ip or "Unknown",
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
-                
-                server_id_found = server.get("id")
+            if returncode == 0 and data is not None:
+                if secure_failed:
+                    # Plain run works where the secure one failed: --secure is the problem, not the network
+                    self._disable_secure()
+                result = cli_result_to_dict(data)
+                server_id_found = (data.get("server", {}) or {}).get("id")
                 if server_id_found:
-                    screen_and_log(f"CLI-Server: {result['server_name']} – {result['server_location']} (ID {server_id_found})",
-                                   logfile, screen)
+                    self.log(f"CLI-Server: {result['server_name']} – {result['server_location']} (ID {server_id_found})")
                 return result
 
-            err = (completed_process.stderr or "").strip()
-            screen_and_log(f"WARN: Ookla-CLI fehlgeschlagen (rc={completed_process.returncode}, stderr={err})", logfile, screen)
+            error = err or self.progress.get("error") or ""
+            self.log(f"WARN: Ookla-CLI fehlgeschlagen (rc={returncode}, stderr={error})")
+            if not use_secure:
+                self.log("ERROR: Ookla-CLI Messung fehlgeschlagen (alle Varianten).")
+                return None
+            if self.SECURE_UNSUPPORTED.search(error):
+                self._disable_secure()
+            # Retry this measurement without --secure
+            secure_failed = True
+            use_secure = False
 
-        screen_and_log("ERROR: Ookla-CLI Messung fehlgeschlagen (alle Varianten).", logfile, screen)
-        return None
 
-    except subprocess.TimeoutExpired:
-        screen_and_log("ERROR: Ookla-CLI Timeout.", logfile, screen)
-        return None
+# One runner per CLI path, so the version check and the --secure fallback are remembered across tests
+_cli_runners = {}
+
+
+def get_cli_runner(cli_path, logfile=None, screen=True):
+    runner = _cli_runners.get(cli_path)
+    if runner is None:
+        runner = _cli_runners[cli_path] = OoklaCliRunner(cli_path, logfile, screen)
+    runner.logfile, runner.screen = logfile, screen
+    return runner
+
+
+def perform_speedtest_cli(cli_path, logfile, screen=True, server_id=None, secure=True, timeout=180, on_progress=None):
+    """
+    Perform speedtest using Ookla CLI (synchronous wrapper around OoklaCliRunner).
+    on_progress(progress) receives the partial values while the test runs; Ctrl+C kills the CLI.
+    """
+    try:
+        runner = get_cli_runner(cli_path, logfile, screen)
+        return asyncio.run(runner.run(server_id=server_id, secure=secure, timeout=timeout, on_progress=on_progress))
     except Exception as e:
         screen_and_log(f"ERROR: Unerwarteter Fehler in perform_speedtest_cli: {e}", logfile, screen)
         tb = traceback.format_exc()
@@ -210,8 +426,124 @@ def perform_speedtest_cli(cli_path, logfile, screen=True, server_id=None, secure
         return None
 
 
-def perform_speedtest_py(logfile, screen=True, server_id=None, sponsor=None, city=None, country=None, secure=True):
-    """Perform speedtest using Python speedtest library"""
+def load_server_cache(cache_file, filters, ttl, logfile=None, screen=True):
+    """Load the server-discovery cache; None if missing, expired or created with other server filters"""
+    if not cache_file or not ttl or not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("filters") != filters:
+            return None
+        if time.time() - float(cache.get("created", 0)) > ttl:
+            screen_and_log("Server-Cache abgelaufen – Serversuche wird wiederholt.", logfile, screen)
+            return None
+        return cache
+    except Exception as e:
+        screen_and_log(f"WARN: Server-Cache konnte nicht gelesen werden ({e}).", logfile, screen)
+        return None
+
+
+def save_server_cache(cache_file, cache, logfile=None, screen=True):
+    """Persist the server-discovery cache (candidate list and last best server)"""
+    if not cache_file:
+        return
+    try:
+        directory = os.path.dirname(cache_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = cache_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, cache_file)
+    except Exception as e:
+        screen_and_log(f"WARN: Server-Cache konnte nicht geschrieben werden ({e}).", logfile, screen)
+
+
+# speedtest-cli scores each failed latency probe with 3600 s instead of raising; averaged over
+# get_best_server's divisor of 6 a single failed probe already adds this many milliseconds
+UNREACHABLE_LATENCY_MS = 3600 / 6 * 1000
+
+
+def probe_servers(st, servers):
+    """get_best_server() restricted to the given servers; None if none of them answers"""
+    best_server = st.get_best_server(servers)
+    if not best_server or best_server.get("latency", 0) >= UNREACHABLE_LATENCY_MS:
+        return None
+    return best_server
+
+
+def discover_servers(st, server_id, sponsor_filter, city_filter, country_filter, log, log_exception):
+    """
+    Full server discovery (fixed ID, then sponsor/city/country filter, then closest servers) on one
+    Speedtest object. Returns (best_server, candidates); the server list is downloaded at most twice.
+    """
+    # Try fixed server ID first
+    if server_id:
+        try:
+            st.get_servers([int(server_id)])
+            best_server = probe_servers(st, st.get_closest_servers())
+            if best_server:
+                log(f"Fester Server (per ID) gewählt: {best_server['sponsor']} – "
+                    f"{best_server['name']}, {best_server['country']} (ID {server_id})")
+                return best_server, [best_server]
+        except Exception as e:
+            log_exception("WARN: Fester Server per ID nicht verfügbar", e)
+
+    # Filter by sponsor/city/country
+    candidates = []
+    try:
+        st.get_servers()
+        for srv_list in st.servers.values():
+            for srv in srv_list:
+                sponsor_lc = (srv.get("sponsor", "") or "").lower()
+                city_lc = (srv.get("name", "") or "").lower()
+                country_lc = (srv.get("country", "") or "").lower()
+                sponsor_ok = bool(re.search(r'\b(deutsche\s+)?telekom\b', sponsor_lc))
+                if sponsor_filter:
+                    sponsor_ok = sponsor_ok and (sponsor_filter.lower() in sponsor_lc or sponsor_filter.lower() == "telekom")
+                city_ok = (city_filter.lower() in city_lc) if city_filter else True
+                country_ok = (country_filter.lower() in country_lc) if country_filter else True
+                if sponsor_ok and city_ok and country_ok:
+                    candidates.append(srv)
+        if candidates:
+            best_server = probe_servers(st, candidates)
+            if best_server:
+                log(f"Telekom/Frankfurt-Server gewählt: {best_server['sponsor']} – "
+                    f"{best_server['name']}, {best_server['country']} (ID {best_server.get('id')})")
+                return best_server, candidates
+        else:
+            log("WARN: Kein Telekom-Server in Frankfurt gefunden – Fallback auf best_server()")
+    except Exception as e:
+        log_exception("WARN: Sponsor/City-Filter fehlgeschlagen", e)
+
+    # Fallback to best of the closest servers (reuses the downloaded server list)
+    try:
+        if not st.servers:
+            st.get_servers()
+        st.closest = []
+        closest = st.get_closest_servers()
+        best_server = probe_servers(st, closest)
+        if best_server:
+            log(f"Fallback-Server: {best_server['sponsor']} – "
+                f"{best_server['name']}, {best_server['country']} (ID {best_server.get('id')})")
+            return best_server, closest
+    except Exception as e:
+        log_exception("ERROR: Fallback get_best_server() fehlgeschlagen", e)
+    return None, []
+
+
+def perform_speedtest_py(logfile, screen=True, server_id=None, sponsor=None, city=None, country=None, secure=True,
+                         server_cache=None, server_cache_ttl=0):
+    """
+    Perform speedtest using Python speedtest library.
+    With `server_cache` the candidate list and the last best server are kept in a JSON file for
+    `server_cache_ttl` seconds; later measurements only re-probe the cached server and skip discovery
+    unless it fails.
+    """
+    def log(message):
+        screen_and_log(message, logfile, screen)
+
     def log_exception(prefix, exception):
         screen_and_log(f"{prefix}: {exception.__class__.__name__}: {exception}", logfile, screen)
         tb = traceback.format_exc()
@@ -220,80 +552,45 @@ def perform_speedtest_py(logfile, screen=True, server_id=None, sponsor=None, cit
     sponsor_filter = (sponsor or "").strip() or "Telekom"
     city_filter = (city or "").strip() or "Frankfurt"
     country_filter = (country or "").strip()
+    filters = {"server_id": server_id or "", "sponsor": sponsor_filter, "city": city_filter,
+               "country": country_filter, "secure": bool(secure)}
 
     screen_and_log("DSL-Speedtest beginnt...", logfile, screen)
     try:
-        st = speedtest.Speedtest(secure=bool(secure))
+        # The constructor already downloads the configuration
         try:
-            st.get_config()
+            st = speedtest.Speedtest(secure=bool(secure))
         except Exception as e:
             log_exception("ERROR: Konnte Speedtest-Konfiguration nicht laden", e)
             return None
 
+        cache = load_server_cache(server_cache, filters, server_cache_ttl, logfile, screen)
         best_server = None
 
-        # Try fixed server ID first
-        if server_id:
-            try:
-                st.get_servers([int(server_id)])
-                best_server = st.get_best_server()
-                screen_and_log(
-                    f"Fester Server (per ID) gewählt: {best_server['sponsor']} – "
-                    f"{best_server['name']}, {best_server['country']} (ID {server_id})",
-                    logfile, screen
-                )
-            except Exception as e:
-                log_exception("WARN: Fester Server per ID nicht verfügbar", e)
-                best_server = None
-
-        # Filter by sponsor/city/country
-        if not best_server:
-            try:
-                st = speedtest.Speedtest(secure=bool(secure))
-                st.get_config()
-                st.get_servers()
-                candidates = []
-                for srv_list in st.servers.values():
-                    for srv in srv_list:
-                        sponsor_lc = (srv.get("sponsor", "") or "").lower()
-                        city_lc = (srv.get("name", "") or "").lower()
-                        country_lc = (srv.get("country", "") or "").lower()
-                        sponsor_ok = bool(re.search(r'\b(deutsche\s+)?telekom\b', sponsor_lc))
-                        if sponsor_filter:
-                            sponsor_ok = sponsor_ok and (sponsor_filter.lower() in sponsor_lc or sponsor_filter.lower() == "telekom")
-                        city_ok = (city_filter.lower() in city_lc) if city_filter else True
-                        country_ok = (country_filter.lower() in country_lc) if country_filter else True
-                        if sponsor_ok and city_ok and country_ok:
-                            candidates.append(srv)
-                if candidates:
-                    ids = [int(s["id"]) for s in candidates if "id" in s]
-                    st.get_servers(ids)
-                    best_server = st.get_best_server()
-                    screen_and_log(
-                        f"Telekom/Frankfurt-Server gewählt: {best_server['sponsor']} – "
-                        f"{best_server['name']}, {best_server['country']} (ID {best_server.get('id')})",
-                        logfile, screen
-                    )
-                else:
-                    screen_and_log("WARN: Kein Telekom-Server in Frankfurt gefunden – Fallback auf best_server()", logfile, screen)
-            except Exception as e:
-                log_exception("WARN: Sponsor/City-Filter fehlgeschlagen", e)
+        # Cached best server first, then the cached candidates (latency probe only, no server list download)
+        if cache:
+            for servers, label in ((cache.get("best") and [cache["best"]], "letzter Server"),
+                                   (cache.get("candidates"), "Kandidaten")):
+                if not servers:
+                    continue
+                try:
+                    best_server = probe_servers(st, servers)
+                except Exception as e:
+                    log_exception(f"WARN: Server aus Cache ({label}) nicht erreichbar", e)
+                if best_server:
+                    log(f"Server aus Cache ({label}): {best_server['sponsor']} – "
+                        f"{best_server['name']}, {best_server['country']} (ID {best_server.get('id')})")
+                    break
+            if not best_server:
+                log("WARN: Server aus Cache nicht erreichbar – Serversuche wird wiederholt.")
+                cache = None
 
-        # Fallback to best server
         if not best_server:
-            try:
-                st = speedtest.Speedtest(secure=bool(secure))
-                st.get_config()
-                st.get_servers()
-                best_server = st.get_best_server()
-                screen_and_log(
-                    f"Fallback-Server: {best_server['sponsor']} – "
-                    f"{best_server['name']}, {best_server['country']} (ID {best_server.get('id')})",
-                    logfile, screen
-                )
-            except Exception as e:
-                log_exception("ERROR: Fallback get_best_server() fehlgeschlagen", e)
+            best_server, candidates = discover_servers(st, server_id, sponsor_filter, city_filter, country_filter,
+                                                       log, log_exception)
+            if not best_server:
                 return None
+            cache = {"created": time.time(), "filters": filters, "candidates": candidates}
 
         # Perform measurement
         try:
@@ -302,8 +599,17 @@ def perform_speedtest_py(logfile, screen=True, server_id=None, sponsor=None, cit
             ping_value = st.results.ping
         except Exception as e:
             log_exception("ERROR: Download/Upload/Ping fehlgeschlagen", e)
+            # Do not reuse a server that failed during the measurement
+            if server_cache and os.path.exists(server_cache):
+                try:
+                    os.remove(server_cache)
+                except OSError:
+                    pass
             return None
 
+        cache["best"] = best_server
+        save_server_cache(server_cache, cache, logfile, screen)
+
         return {
             "server_name": best_server['sponsor'],
             "server_location": f"{best_server['name']}, {best_server['country']}",
@@ -335,11 +641,10 @@ def save_results_to_json(results, json_target, logfile, screen=True):
         return None
 
 
-def save_results_to_parquet(results, parquet_file, logfile, screen=True):
-    """Save speedtest results to Parquet file for efficient data storage"""
+def save_results_to_parquet(results, dataset_dir, logfile, screen=True, compact_after=0):
+    """Append speedtest results to the partitioned Parquet dataset (one new file, no rewrite of history)"""
     try:
-        # Convert results to DataFrame
-        df_new = pd.DataFrame([{
+        path = speedtest_storage.append_measurement(dataset_dir, {
             'timestamp': pd.to_datetime(results['timestamp']),
             'server_name': results['server_name'],
             'server_location': results['server_location'],
@@ -347,33 +652,18 @@ def save_results_to_parquet(results, parquet_file, logfile, screen=True):
             'upload_mbps': results['upload_mbps'],
             'ping_ms': results['ping_ms'],
             'ip_address': results['ip_address']
-        }])
-        
-        # Check if parquet file exists
-        if os.path.exists(parquet_file):
-            # Load existing data and append
-            try:
-                df_existing = pd.read_parquet(parquet_file)
-                df_combined = pd.concat([df_existing, df_new], ignore_index=True)
-                
-                # Sort by timestamp and remove duplicates
-                df_combined = df_combined.sort_values('timestamp').drop_duplicates(
-                    subset=['timestamp'], keep='last'
-                )
-                
-                df_combined.to_parquet(parquet_file, index=False)
-                screen_and_log(f"Parquet-Daten aktualisiert: '{parquet_file}' ({len(df_combined)} Einträge)", logfile, screen)
-                
-            except Exception as e:
-                screen_and_log(f"WARN: Bestehende Parquet-Datei konnte nicht gelesen werden ({e}). Erstelle neue Datei.", logfile, screen)
-                df_new.to_parquet(parquet_file, index=False)
-                screen_and_log(f"Neue Parquet-Datei erstellt: '{parquet_file}'", logfile, screen)
-        else:
-            # Create new parquet file
-            df_new.to_parquet(parquet_file, index=False)
-            screen_and_log(f"Neue Parquet-Datei erstellt: '{parquet_file}'", logfile, screen)
-        
-        return parquet_file
+        })
+        screen_and_log(f"Parquet-Datensatz angehängt: '{path}'", logfile, screen)
+
+        partition = os.path.dirname(path)
+        try:
+            if speedtest_storage.compact_if_needed(partition, compact_after):
+                screen_and_log(f"Partition kompaktiert: '{partition}'", logfile, screen)
+        except Exception as e:
+            # The measurement is already stored; compaction is retried with the next one
+            screen_and_log(f"WARN: Kompaktierung fehlgeschlagen ({e}).", logfile, screen)
+
+        return path
 
     except Exception as e:
         screen_and_log(f"ERROR: Parquet-Schreiben fehlgeschlagen: {e}", logfile, screen)
@@ -382,11 +672,37 @@ def save_results_to_parquet(results, parquet_file, logfile, screen=True):
         return None
 
 
-def run_single_speedtest(settings, logfile):
-    """Run a single speedtest and save results"""
+def prepare_parquet_dataset(settings, logfile, screen=True):
+    """Move the legacy single-file Parquet history into the dataset (once) and compact finished months"""
+    try:
+        rows = speedtest_storage.migrate_legacy_file(settings["parquet_data"], settings["parquet_dataset"])
+        if rows:
+            screen_and_log(f"{rows} Einträge aus '{settings['parquet_data']}' in '{settings['parquet_dataset']}' übernommen", logfile, screen)
+        for directory in speedtest_storage.compact_closed_partitions(settings["parquet_dataset"]):
+            screen_and_log(f"Partition kompaktiert: '{directory}'", logfile, screen)
+    except Exception as e:
+        screen_and_log(f"ERROR: Vorbereitung des Parquet-Datensatzes fehlgeschlagen: {e}", logfile, screen)
+
+
+def progress_publisher(publish, logfile):
+    """on_progress callback that publishes the partial CLI values as 'speedtest_progress' (None without publish)"""
+    if publish is None:
+        return None
+
+    def on_progress(progress):
+        publish("speedtest_progress", dict(progress, timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    return on_progress
+
+
+def run_single_speedtest(settings, logfile, publish=None, store=None, scheduler=None):
+    """
+    Run a single speedtest and save results (optionally to the state store and to publish(name, data)).
+    With an AdaptiveScheduler the result (or the failure) also sets the pause before the next test.
+    """
     speed_cfg = settings.get("speedtest", {})
     json_file = settings["json_output"]
-    parquet_file = settings["parquet_data"]
+    dataset_dir = settings["parquet_dataset"]
     
     server_id = speed_cfg.get("server_id") or None
     use_cli = bool(speed_cfg.get("use_ookla_cli"))
@@ -400,7 +716,8 @@ def run_single_speedtest(settings, logfile):
     
     # Try Ookla CLI first if configured
     if use_cli and cli_path and os.path.exists(cli_path):
-        results = perform_speedtest_cli(cli_path, logfile, server_id=server_id, secure=secure)
+        results = perform_speedtest_cli(cli_path, logfile, server_id=server_id, secure=secure,
+                                        on_progress=progress_publisher(publish, logfile))
         if not results:
             screen_and_log("WARN: CLI-Messung fehlgeschlagen – Fallback auf Python-Lib.", logfile, True)
 
@@ -414,16 +731,39 @@ def run_single_speedtest(settings, logfile):
             sponsor=sponsor,
             city=city,
             country=country,
-            secure=secure
+            secure=secure,
+            server_cache=settings.get("server_cache"),
+            server_cache_ttl=speed_cfg.get("server_cache_ttl", 0)
         )
 
+    if scheduler is not None:
+        deviating = scheduler.observe(results)
+        if deviating and results:
+            screen_and_log(f"WARN: Messung außerhalb des Normalbereichs ({', '.join(deviating)}) – "
+                           f"nächster Test in {scheduler.interval:.0f} Sekunden", logfile)
+
     if not results:
         screen_and_log("ERROR: DSL-Speedtest fehlgeschlagen.", logfile)
         return False
 
     # Save results to both JSON and Parquet
     json_written = save_results_to_json(results, json_file, logfile)
-    parquet_written = save_results_to_parquet(results, parquet_file, logfile)
+    parquet_written = save_results_to_parquet(results, dataset_dir, logfile, compact_after=settings.get("compact_after", 0))
+
+    # Append the snapshot to the shared state store and update the hourly/daily/total rollups
+    if store is not None:
+        try:
+            store.append("speedtest", results, ts=results.get("timestamp"))
+            speedtest_rollups.update_rollups(store, results)
+        except Exception as e:
+            screen_and_log(f"ERROR: Speedtest konnte nicht im State-Store gespeichert werden: {e}", logfile)
+
+    # Hand the snapshot to the web app directly when running in the same process
+    if publish is not None:
+        try:
+            publish("speedtest", dict(results))
+        except Exception as e:
+            screen_and_log(f"WARN: Snapshot konnte nicht übergeben werden: {e}", logfile)
     
     if json_written and parquet_written:
         screen_and_log(f"Speedtest erfolgreich: Download {results.get('download_mbps')}Mbps, Upload {results.get('upload_mbps')}Mbps, Ping {results.get('ping_ms')}ms", logfile)
@@ -436,39 +776,244 @@ def run_single_speedtest(settings, logfile):
         return False
 
 
-def main():
-    """Main function - runs continuous speedtest monitoring"""
+def backfill_rollups(store, settings, logfile, screen=True):
+    """Build the rollups once from the Parquet history if the state store has none yet"""
     try:
-        script_dir = set_working_directory()
-        if not script_dir:
-            sys.exit(1)
-            
-        settings_file = "status_dsl.ini"
-        settings = settings_import(settings_file, logfile=None, screen=True)
-        
-        logfile = settings["logfile"]
-        refresh_time = settings.get("refresh_time", 300)
-        
-        screen_and_log("Status DSL Speedtest monitoring gestartet", logfile, True)
+        if speedtest_rollups.rollups_exist(store) or not speedtest_storage.dataset_exists(settings["parquet_dataset"]):
+            return
+        df = speedtest_storage.read_dataset(settings["parquet_dataset"])
+        rows = speedtest_rollups.rebuild_rollups(store, df)
+        screen_and_log(f"Rollups aus {rows} Einträgen der Parquet-Historie aufgebaut", logfile, screen)
+    except Exception as e:
+        screen_and_log(f"ERROR: Rollups konnten nicht aufgebaut werden: {e}", logfile, screen)
+
+
+class AdaptiveScheduler:
+    """
+    Chooses the pause before the next full speedtest.
+    For download, upload and ping it learns a normal band incrementally (exponentially weighted mean
+    and variance). While measurements stay inside the band the interval grows by backoff_factor up to
+    max_interval. A degradation beyond band_sigma standard deviations (lower download/upload, higher
+    ping), a failed test or a failing latency probe drops it back to min_interval. A probe failure also
+    wakes up the waiting loop at once. Deviating values move the mean only by DEVIATION_WEIGHT * ewma_alpha
+    and leave the variance alone, so a sustained degradation keeps the short interval instead of becoming
+    the new normal within a few tests; a permanent change is adopted slowly.
+    """
+
+    # Metric -> +1 if larger values are worse, -1 if smaller values are worse
+    METRICS = {"download_mbps": -1, "upload_mbps": -1, "ping_ms": 1}
+    # Minimum band width relative to the mean, so a very steady line does not flag tiny changes
+    MIN_RELATIVE_BAND = 0.1
+    # Share of ewma_alpha with which a deviating value moves the mean
+    DEVIATION_WEIGHT = 0.1
+
+    def __init__(self, min_interval, max_interval, backoff_factor=1.5, band_sigma=3.0, ewma_alpha=0.1, warmup=10):
+        self.min_interval = float(min_interval)
+        self.max_interval = max(float(max_interval), self.min_interval)
+        self.backoff_factor = float(backoff_factor)
+        self.band_sigma = float(band_sigma)
+        self.alpha = float(ewma_alpha)
+        self.warmup = int(warmup)
+        self.count = 0
+        self.mean = {}
+        self.var = {}
+        self.interval = self.min_interval
+        self.wake = threading.Event()
+
+    def deviations(self, results):
+        """Metrics of a result that are worse than the learned band (empty during warmup)"""
+        if self.count < self.warmup:
+            return []
+        deviating = []
+        for metric, worse in self.METRICS.items():
+            value = results.get(metric)
+            if value is None or metric not in self.mean:
+                continue
+            band = max(self.band_sigma * math.sqrt(self.var[metric]), self.MIN_RELATIVE_BAND * abs(self.mean[metric]))
+            if worse * (float(value) - self.mean[metric]) > band:
+                deviating.append(metric)
+        return deviating
+
+    def learn(self, results, deviating=()):
+        """
+        Fold a measurement into the exponentially weighted mean/variance of each metric. Metrics in
+        `deviating` only nudge the mean (see DEVIATION_WEIGHT).
+        """
+        for metric in self.METRICS:
+            value = results.get(metric)
+            if value is None:
+                continue
+            value = float(value)
+            if metric not in self.mean:
+                self.mean[metric], self.var[metric] = value, 0.0
+                continue
+            diff = value - self.mean[metric]
+            if metric in deviating:
+                self.mean[metric] += self.DEVIATION_WEIGHT * self.alpha * diff
+                continue
+            increment = self.alpha * diff
+            self.mean[metric] += increment
+            self.var[metric] = (1 - self.alpha) * (self.var[metric] + diff * increment)
+        self.count += 1
+
+    def observe(self, results):
+        """Update with a speedtest result (None = failed test); returns the list of deviating metrics"""
+        # A wake-up requested while this test was running is answered by the test itself
+        self.wake.clear()
+        if not results:
+            self.interval = self.min_interval
+            return ["failed"]
+        deviating = self.deviations(results)
+        self.learn(results, deviating)
+        if deviating:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff_factor)
+        return deviating
+
+    def probe_failed(self, host=None):
+        """Latency probe callback: test again soon (may be called from the probe thread)"""
+        self.interval = self.min_interval
+        self.wake.set()
+
+    def wait(self, interval=None):
+        """Sleep until the next test is due or a probe failure wakes the loop"""
+        self.wake.wait(self.interval if interval is None else interval)
+        self.wake.clear()
+
+
+def build_scheduler(settings, logfile):
+    """AdaptiveScheduler from settings, seeded with the recent Parquet history; None if disabled"""
+    cfg = settings.get("adaptive", {})
+    if not cfg.get("enabled"):
+        return None
+    scheduler = AdaptiveScheduler(cfg["min_interval"], cfg["max_interval"], cfg["backoff_factor"],
+                                  cfg["band_sigma"], cfg["ewma_alpha"], cfg["warmup"])
+    try:
+        if speedtest_storage.dataset_exists(settings.get("parquet_dataset")):
+            start = datetime.now() - timedelta(days=cfg["history_days"])
+            history = speedtest_storage.read_dataset(settings["parquet_dataset"], start=start,
+                                                     columns=list(AdaptiveScheduler.METRICS))
+            for record in history.to_dict("records"):
+                scheduler.learn(record)
+            screen_and_log(f"Normalbereich aus {len(history)} Messungen der letzten {cfg['history_days']} Tage gelernt", logfile, True)
+    except Exception as e:
+        screen_and_log(f"WARN: Historie für adaptive Planung nicht lesbar ({e}).", logfile, True)
+    return scheduler
+
+
+def start_latency_probe(settings, store, logfile, on_failure=None):
+    """Start the background latency probe if enabled; returns the LatencyProbe or None"""
+    probe_cfg = settings.get("probe", {})
+    if not probe_cfg.get("enabled") or not probe_cfg.get("hosts"):
+        return None
+    probe = latency_probe.LatencyProbe(
+        probe_cfg["hosts"],
+        interval=probe_cfg["interval"],
+        timeout=probe_cfg["timeout"],
+        capacity=probe_cfg["capacity"],
+        flush_interval=probe_cfg["flush_interval"],
+        store=store,
+        failure_threshold=probe_cfg["failure_threshold"],
+        on_failure=on_failure,
+        logger=lambda message: screen_and_log(message, logfile, True),
+        retention_days=probe_cfg["retention_days"],
+    )
+    probe.start()
+    screen_and_log(f"Latenz-Probe gestartet: {', '.join(probe.host_names)} alle {probe.interval:g} Sekunden", logfile, True)
+    return probe
+
+
+def prune_speedtest_snapshots(store, days, logfile):
+    """
+    Deletes 'speedtest' snapshots older than `days` days from the state store (the Parquet dataset and
+    the rollups keep the full history); returns the day of the pruning
+    """
+    today = datetime.now().date()
+    try:
+        removed = store.prune("speedtest", datetime.combine(today, datetime.min.time()) - timedelta(days=days))
+        if removed:
+            screen_and_log(f"{removed} Speedtest-Snapshots älter als {days} Tage aus dem State-Store gelöscht", logfile)
+    except Exception as e:
+        screen_and_log(f"WARN: Alte Speedtest-Snapshots konnten nicht gelöscht werden: {e}", logfile)
+    return today
+
+
+def run_speedtest_loop(settings, logfile, publish=None):
+    """Continuous speedtest loop with a fixed refresh interval"""
+    refresh_time = settings.get("refresh_time", 300)
+
+    store = None
+    if settings.get("state_store"):
+        try:
+            store = StateStore(settings["state_store"])
+            screen_and_log(f"State-Store geöffnet: {settings['state_store']}", logfile, True)
+        except Exception as e:
+            screen_and_log(f"WARN: State-Store konnte nicht geöffnet werden ({e}). Nur JSON/Parquet.", logfile, True)
+
+    prepare_parquet_dataset(settings, logfile)
+    if store is not None:
+        backfill_rollups(store, settings, logfile)
+
+    scheduler = build_scheduler(settings, logfile)
+    probe = start_latency_probe(settings, store, logfile,
+                                on_failure=scheduler.probe_failed if scheduler is not None else None)
+
+    screen_and_log("Status DSL Speedtest monitoring gestartet", logfile, True)
+    if scheduler is not None:
+        screen_and_log(f"Adaptives Intervall: {scheduler.min_interval:.0f} bis {scheduler.max_interval:.0f} Sekunden", logfile, True)
+    else:
         screen_and_log(f"Aktualisierungsintervall: {refresh_time} Sekunden", logfile, True)
-        
-        while True:
-            try:
-                success = run_single_speedtest(settings, logfile)
-                if not success:
-                    screen_and_log("WARN: Speedtest fehlgeschlagen, versuche es beim nächsten Zyklus erneut.", logfile)
-                
+
+    pruned_on = None
+    while True:
+        try:
+            success = run_single_speedtest(settings, logfile, publish=publish, store=store, scheduler=scheduler)
+            if not success:
+                screen_and_log("WARN: Speedtest fehlgeschlagen, versuche es beim nächsten Zyklus erneut.", logfile)
+            if store is not None and settings.get("store_days") and pruned_on != datetime.now().date():
+                pruned_on = prune_speedtest_snapshots(store, settings["store_days"], logfile)
+
+            if scheduler is not None:
+                screen_and_log(f"Warte {scheduler.interval:.0f} Sekunden bis zum nächsten Test...", logfile, True)
+                scheduler.wait()
+            else:
                 screen_and_log(f"Warte {refresh_time} Sekunden bis zum nächsten Test...", logfile, True)
                 time.sleep(refresh_time)
-                
-            except KeyboardInterrupt:
-                screen_and_log("Programm durch Benutzer beendet (Ctrl+C)", logfile, True)
-                break
-            except Exception as e:
-                screen_and_log(f"ERROR: Unerwarteter Fehler im Hauptloop: {e}", logfile, True)
-                tb = traceback.format_exc()
-                screen_and_log(tb, logfile, True)
-                time.sleep(refresh_time)
+
+        except KeyboardInterrupt:
+            screen_and_log("Programm durch Benutzer beendet (Ctrl+C)", logfile, True)
+            break
+        except Exception as e:
+            screen_and_log(f"ERROR: Unerwarteter Fehler im Hauptloop: {e}", logfile, True)
+            tb = traceback.format_exc()
+            screen_and_log(tb, logfile, True)
+            time.sleep(refresh_time)
+
+    if probe is not None:
+        probe.stop()
+
+
+def main(publish=None, chdir=True):
+    """
+    Main function - runs continuous speedtest monitoring.
+    All paths are resolved against the script directory; with chdir=False (shared process, see
+    run_all.py) the working directory is left alone.
+    """
+    try:
+        if chdir:
+            script_dir = set_working_directory()
+            if not script_dir:
+                sys.exit(1)
+        else:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+
+        settings_file = os.path.join(script_dir, "status_dsl.ini")
+        settings = settings_import(settings_file, logfile=None, screen=True)
+        
+        logfile = settings["logfile"]
+        buffered_log.configure(logfile, **settings["logging"])
+        run_speedtest_loop(settings, logfile, publish=publish)
 
     except Exception as e:
         screen_and_log(f"ERROR: Kritischer Fehler: {e}", None, True)
@@ -478,4 +1023,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Fake Ookla CLI for the tests: writes jsonl lines like `speedtest --format=jsonl --progress=yes`.
+Behaviour is selected with FAKE_SPEEDTEST_MODE:
+    ok              progress lines and a result
+    hang            one ping line, then sleeps (timeout/cancel)
+    fail_secure     fails with --secure, works without
+    reject_secure   rejects the --secure option, works without
+    fail            fails in every variant (network outage)
+The arguments of every call are appended to FAKE_SPEEDTEST_ARGS (one JSON list per line).
+"""
+
+import json
+import os
+import sys
+import time
+
+
+def emit(data):
+    print(json.dumps(data), flush=True)
+
+
+def main():
+    args = sys.argv[1:]
+    mode = os.environ.get("FAKE_SPEEDTEST_MODE", "ok")
+    if os.environ.get("FAKE_SPEEDTEST_ARGS"):
+        with open(os.environ["FAKE_SPEEDTEST_ARGS"], "a", encoding="utf-8") as f:
+            f.write(json.dumps(args) + "\n")
+
+    if "--version" in args:
+        print("Speedtest by Ookla 1.2.0.84 (fake)")
+        return 0
+
+    secure = "--secure" in args
+    if mode == "reject_secure" and secure:
+        print("Unrecognized option '--secure'", file=sys.stderr)
+        return 1
+    if mode == "fail" or (mode == "fail_secure" and secure):
+        emit({"type": "log", "level": "error", "message": "Cannot open socket: Timeout occurred in connect."})
+        return 2
+
+    emit({"type": "testStart", "server": {"id": 31448, "name": "Telekom"}})
+    emit({"type": "ping", "ping": {"jitter": 0.5, "latency": 12.345, "progress": 1.0}})
+    if mode == "hang":
+        time.sleep(60)
+        return 0
+    emit({"type": "download", "download": {"bandwidth": 6250000, "bytes": 1000, "elapsed": 100, "progress": 0.5}})
+    emit({"type": "download", "download": {"bandwidth": 12500000, "bytes": 2000, "elapsed": 200, "progress": 1.0}})
+    emit({"type": "upload", "upload": {"bandwidth": 5000000, "bytes": 1000, "elapsed": 100, "progress": 1.0}})
+    emit({
+        "type": "result",
+        "ping": {"jitter": 0.5, "latency": 12.345},
+        "download": {"bandwidth": 12500000},
+        "upload": {"bandwidth": 5000000},
+        "interface": {"externalIp": "192.0.2.1"},
+        "server": {"id": 31448, "name": "Telekom", "location": "Frankfurt", "country": "Germany"},
+    })
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+import status_dsl
+
+
+def make_scheduler():
+    scheduler = status_dsl.AdaptiveScheduler(min_interval=600, max_interval=3600, backoff_factor=1.5,
+                                             band_sigma=3, ewma_alpha=0.1, warmup=10)
+    for i in range(20):
+        scheduler.observe({"download_mbps": 100 + (i % 3 - 1) * 2, "upload_mbps": 40.0, "ping_ms": 15.0})
+    return scheduler
+
+
+def test_interval_grows_while_in_band():
+    scheduler = make_scheduler()
+    assert scheduler.interval == 3600
+
+
+def test_sustained_degradation_keeps_short_interval():
+    scheduler = make_scheduler()
+    for _ in range(50):
+        assert scheduler.observe({"download_mbps": 50.0, "upload_mbps": 40.0, "ping_ms": 15.0}) == ["download_mbps"]
+        assert scheduler.interval == 600
+    # Upload and ping stayed normal and keep their band
+    assert scheduler.mean["upload_mbps"] == 40.0
+
+
+def test_permanent_change_is_adopted_slowly():
+    scheduler = make_scheduler()
+    for _ in range(500):
+        scheduler.observe({"download_mbps": 50.0, "upload_mbps": 40.0, "ping_ms": 15.0})
+    assert scheduler.observe({"download_mbps": 50.0, "upload_mbps": 40.0, "ping_ms": 15.0}) == []
+    assert scheduler.interval > 600
+
+
+def test_failed_test_resets_interval():
+    scheduler = make_scheduler()
+    assert scheduler.observe(None) == ["failed"]
+    assert scheduler.interval == 600
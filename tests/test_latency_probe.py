@@ -0,0 +1,72 @@
+import math
+import socket
+
+import pytest
+
+import latency_probe
+from state_store import StateStore
+
+
+@pytest.fixture
+def listening_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen(16)
+        yield server.getsockname()[1]
+
+
+@pytest.fixture
+def closed_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_parse_hosts():
+    assert latency_probe.parse_hosts("1.1.1.1:443, 8.8.8.8:53, www.telekom.de") == [
+        ("1.1.1.1", 443), ("8.8.8.8", 53), ("www.telekom.de", 443)]
+    assert latency_probe.parse_hosts("::1, [::1]:8443, [2001:db8::1], 2001:db8::2") == [
+        ("::1", 443), ("::1", 8443), ("2001:db8::1", 443), ("2001:db8::2", 443)]
+    assert latency_probe.parse_hosts("") == []
+
+
+def test_ring_overwrites_oldest():
+    ring = latency_probe.LatencyRing(3)
+    for i in range(5):
+        ring.append(float(i + 1), 0, None if i == 4 else float(i))
+    samples = ring.since(0)
+    assert [sample[0] for sample in samples] == [3.0, 4.0, 5.0]
+    assert math.isnan(samples[-1][2])
+
+
+def test_probe_open_and_closed_port(listening_port, closed_port, tmp_path):
+    failures = []
+    store = StateStore(str(tmp_path / "state.sqlite"))
+    probe = latency_probe.LatencyProbe([("127.0.0.1", listening_port), ("127.0.0.1", closed_port)],
+                                       timeout=1, store=store, failure_threshold=2, on_failure=failures.append)
+    probe.last_flush = 0.0
+
+    for _ in range(3):
+        (open_name, open_latency), (closed_name, closed_latency) = probe.probe_once()
+        assert open_latency is not None and open_latency >= 0
+        assert closed_latency is None
+    assert failures == [closed_name]
+
+    stats = probe.stats()
+    assert stats[open_name]["count"] == 3 and stats[open_name]["failures"] == 0
+    assert stats[closed_name]["failures"] == 3 and stats[closed_name]["mean"] is None
+
+    probe.flush()
+    snapshot = store.latest("latency")
+    assert snapshot["data"]["hosts"][open_name]["count"] == 3
+    store.close()
+
+
+def test_flush_prunes_old_snapshots(listening_port, tmp_path):
+    store = StateStore(str(tmp_path / "state.sqlite"))
+    store.append("latency", {"hosts": {}}, ts="2000-01-01 00:00:00")
+    probe = latency_probe.LatencyProbe([("127.0.0.1", listening_port)], store=store, retention_days=7)
+    probe.probe_once()
+    probe.flush()
+    assert [snapshot["ts"] > "2000-01-01 00:00:00" for snapshot in store.range("latency")] == [True]
+    store.close()
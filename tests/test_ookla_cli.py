@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+import status_dsl
+
+FAKE_CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_speedtest.py")
+
+
+@pytest.fixture
+def fake_cli(tmp_path, monkeypatch):
+    """Executable wrapper around fake_speedtest.py; returns (cli path, args log)"""
+    args_log = tmp_path / "args.jsonl"
+    monkeypatch.setenv("FAKE_SPEEDTEST_ARGS", str(args_log))
+    monkeypatch.setenv("FAKE_SPEEDTEST_MODE", "ok")
+    if os.name == "nt":
+        cli = tmp_path / "speedtest.bat"
+        cli.write_text(f'@"{sys.executable}" "{FAKE_CLI}" %*\n')
+    else:
+        cli = tmp_path / "speedtest"
+        cli.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_CLI}" "$@"\n')
+        cli.chmod(0o755)
+    return str(cli), args_log
+
+
+def cli_calls(args_log):
+    return [json.loads(line) for line in args_log.read_text().splitlines() if "--version" not in line]
+
+
+def run(runner, **kwargs):
+    return asyncio.run(runner.run(**kwargs))
+
+
+def test_result_and_progress(fake_cli):
+    cli, args_log = fake_cli
+    runner = status_dsl.OoklaCliRunner(cli, screen=False)
+    updates = []
+
+    result = run(runner, server_id="31448", on_progress=updates.append)
+
+    assert result["download_mbps"] == 100.0
+    assert result["upload_mbps"] == 40.0
+    assert result["ping_ms"] == 12.35
+    assert result["server_name"] == "Telekom"
+    assert result["server_location"] == "Frankfurt, Germany"
+    assert result["ip_address"] == "192.0.2.1"
+    assert runner.version == "Speedtest by Ookla 1.2.0.84 (fake)"
+    assert [update["phase"] for update in updates] == ["ping", "download", "upload"]
+    assert runner.progress["download_mbps"] == 100.0
+    [args] = cli_calls(args_log)
+    assert "--progress=yes" in args and "--secure" in args
+    assert args[args.index("--server-id") + 1] == "31448"
+
+
+def test_timeout_kills_cli(fake_cli, monkeypatch):
+    cli, _ = fake_cli
+    monkeypatch.setenv("FAKE_SPEEDTEST_MODE", "hang")
+    runner = status_dsl.OoklaCliRunner(cli, screen=False)
+
+    started = time.monotonic()
+    assert run(runner, timeout=1) is None
+    assert time.monotonic() - started < 10
+    assert runner.progress["ping_ms"] == 12.35
+    assert runner.process is None
+
+
+def test_cancel_kills_cli(fake_cli, monkeypatch):
+    cli, _ = fake_cli
+    monkeypatch.setenv("FAKE_SPEEDTEST_MODE", "hang")
+    runner = status_dsl.OoklaCliRunner(cli, screen=False)
+
+    async def cancel_during_ping():
+        task = asyncio.create_task(runner.run(timeout=60))
+        while runner.progress.get("phase") != "ping":
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    started = time.monotonic()
+    asyncio.run(cancel_during_ping())
+    assert time.monotonic() - started < 10
+    assert runner.process is None
+
+
+def test_secure_fallback_when_plain_run_succeeds(fake_cli, monkeypatch):
+    cli, args_log = fake_cli
+    monkeypatch.setenv("FAKE_SPEEDTEST_MODE", "fail_secure")
+    runner = status_dsl.OoklaCliRunner(cli, screen=False)
+
+    assert run(runner)["download_mbps"] == 100.0
+    assert runner.secure_supported is False
+    assert run(runner) is not None
+    assert ["--secure" in args for args in cli_calls(args_log)] == [True, False, False]
+
+
+def test_secure_rejected_by_cli(fake_cli, monkeypatch):
+    cli, _ = fake_cli
+    monkeypatch.setenv("FAKE_SPEEDTEST_MODE", "reject_secure")
+    runner = status_dsl.OoklaCliRunner(cli, screen=False)
+
+    assert run(runner) is not None
+    assert runner.secure_supported is False
+
+
+def test_outage_keeps_secure(fake_cli, monkeypatch):
+    cli, args_log = fake_cli
+    monkeypatch.setenv("FAKE_SPEEDTEST_MODE", "fail")
+    runner = status_dsl.OoklaCliRunner(cli, screen=False)
+
+    assert run(runner) is None
+    assert runner.secure_supported is True
+    assert ["--secure" in args for args in cli_calls(args_log)] == [True, False]
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("yfinance")
+pytest.importorskip("ahlib")
+import pandas as pd
+
+import status
+
+
+class HangingDownloader:
+    """yf.download stand-in: the first call hangs past the timeout, records overlapping calls"""
+
+    def __init__(self, hang):
+        self.hang = hang
+        self.lock = threading.Lock()
+        self.running = 0
+        self.overlaps = 0
+        self.calls = []
+
+    def __call__(self, tickers, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.overlaps += self.running > 1
+            self.calls.append(list(tickers))
+            first = len(self.calls) == 1
+        try:
+            if first:
+                time.sleep(self.hang)
+            columns = pd.MultiIndex.from_product([tickers, ["Close"]])
+            return pd.DataFrame([[1.0] * len(tickers)], columns=columns)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_timed_out_download_blocks_the_next_one():
+    downloader = HangingDownloader(hang=0.6)
+    state = {}
+    chunks = [["A", "B"], ["C"], ["D"]]
+
+    async def cycle():
+        return await status.fetch_quote_chunks(state, chunks, asyncio.Semaphore(8), 0.2, downloader)
+
+    first = asyncio.run(cycle())
+    assert isinstance(first[0], asyncio.TimeoutError)
+    assert all(isinstance(result, RuntimeError) for result in first[1:])
+
+    # The next cycle starts while the first download still hangs
+    second = asyncio.run(cycle())
+    assert all(isinstance(result, RuntimeError) for result in second)
+
+    state['download_future'].result(timeout=2)
+    third = asyncio.run(cycle())
+    assert [sorted(result[0]) for result in third] == [["A", "B"], ["C"], ["D"]]
+    assert downloader.overlaps == 0
+    assert len(downloader.calls) == 4